@@ -0,0 +1,65 @@
+'''
+Per-frame cost of the check byte calculations before and after moving them to
+`pywatlow.checksum`.
+
+Usage::
+
+    python benchmarks/bench_checksum.py [-n NUMBER]
+'''
+import argparse
+import struct
+import timeit
+from binascii import unhexlify
+
+import crcmod
+
+from pywatlow import checksum
+
+FRAME = unhexlify('55FF060010000B8802030104010108468F3638DD0E')
+
+
+def legacyHeaderCheckByte(headerBytes):
+    # Watlow._headerCheckByte before pywatlow.checksum: the table is built on every call
+    crc_8_table = list(checksum.HEADER_TABLE)
+    intCheck = ~crc_8_table[headerBytes[6] ^ crc_8_table[headerBytes[5] ^
+                            crc_8_table[headerBytes[4] ^ crc_8_table[headerBytes[3] ^
+                                        crc_8_table[~headerBytes[2]]]]]] & (2**8-1)
+    return bytes([intCheck])
+
+
+def legacyDataCheckByte(dataBytes):
+    # Watlow._dataCheckByte before pywatlow.checksum: a CRC function is generated on every call
+    crc_fun = crcmod.mkCrcFun(poly=0x11021, initCrc=0, rev=True, xorOut=0xFFFF)
+    return struct.pack('<H', crc_fun(dataBytes))
+
+
+def legacyValidate(frame):
+    return (bytearray([frame[7]]) == legacyHeaderCheckByte(frame[0:7]) and
+            frame[-2:] == legacyDataCheckByte(frame[8:-2]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    cases = [
+        ('header check, before', lambda: legacyHeaderCheckByte(FRAME[0:7])),
+        ('header check, after', lambda: checksum.headerCheckByte(FRAME)),
+        ('data check, before', lambda: legacyDataCheckByte(FRAME[8:-2])),
+        ('data check, after', lambda: checksum.dataCheckByte(memoryview(FRAME)[8:-2])),
+        ('data check, after (pure Python)', lambda: checksum._pyDataCheck(memoryview(FRAME)[8:-2])),
+        ('validate frame, before', lambda: legacyValidate(FRAME)),
+        ('validate frame, after', lambda: checksum.verifyFrame(FRAME)),
+    ]
+    frames = [FRAME] * 1000
+    print('crcmod C extension in use: {0}'.format(checksum.usingExtension))
+    for name, fun in cases:
+        seconds = min(timeit.repeat(fun, number=args.number, repeat=3))
+        print('{0:<34} {1:8.3f} us/frame'.format(name, seconds / args.number * 1e6))
+    seconds = min(timeit.repeat(lambda: checksum.verifyFrames(frames), number=max(args.number // 1000, 1), repeat=3))
+    print('{0:<34} {1:8.3f} us/frame'.format('verifyFrames, batch of 1000', seconds / max(args.number // 1000, 1) / 1000 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
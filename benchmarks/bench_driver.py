@@ -0,0 +1,185 @@
+'''
+Benchmarks for the driver's hot path: frame building, check bytes, response
+validation and parsing, and full readParam/writeParam round trips against
+the simulated bus.
+
+For each case the number of operations per second (best of several runs),
+the p50 and p99 latency of single calls, the peak memory allocated during one
+call and the number of memory blocks still held after each call are reported.
+Results can be saved as a JSON baseline and later runs compared against it.
+The committed baseline, ``benchmarks/baseline.json``, was measured on the
+machine and Python version recorded in its ``metadata``; ops/sec are only
+comparable on similar hardware, so save a baseline of your own before
+comparing on another machine::
+
+    python benchmarks/bench_driver.py --compare benchmarks/baseline.json
+    python benchmarks/bench_driver.py --save my-baseline.json
+
+When comparing, the exit status is 1 if any case is slower than the baseline
+by more than `--threshold` (default 20%).
+'''
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from binascii import unhexlify
+
+from pywatlow import checksum
+from pywatlow.frames import FrameCompiler
+from pywatlow.metrics import Metrics
+from pywatlow.modbus import ModbusWatlow
+from pywatlow.reading import parseResponse
+from pywatlow.simulator import SimulatedBus
+from pywatlow.simulator import SimulatedController
+from pywatlow.simulator import SimulatedModbusBus
+from pywatlow.watlow import Watlow
+
+READ_RESPONSE = unhexlify('55FF060010000B8802030104010108468F3638DD0E')
+WRITE_RESPONSE = unhexlify('55FF06031100097702040803010F010047883B')
+
+
+def cases():
+    watlow = Watlow(serial=None, address=1)
+    watlow2 = Watlow(serial=None, address=2)
+    compiler = FrameCompiler()
+    simulated = SimulatedBus([SimulatedController(1, {4001: 72.5, 7001: 75.0, 8003: 71})])
+    polled = Watlow(serial=simulated, address=1)
+    measured = Watlow(serial=simulated, address=1, metrics=Metrics())
+    zone = [4001, 4012, 4014, 4015, 4016, 4017, 4018]
+    values = {param: 1.0 for param in zone}
+    standard = Watlow(serial=SimulatedBus([SimulatedController(1, values)]), address=1)
+    block = ModbusWatlow(serial=SimulatedModbusBus([SimulatedController(1, values)]), address=1)
+    header = READ_RESPONSE[0:7]
+    data = READ_RESPONSE[8:-2]
+    return [
+        ('_buildReadRequest', lambda: watlow._buildReadRequest(4001)),
+        ('_buildWriteRequest float', lambda: watlow._buildWriteRequest(7001, 81.5, float)),
+        ('_buildWriteRequest int', lambda: watlow._buildWriteRequest(8003, 71, int)),
+        ('FrameCompiler.readRequest', lambda: compiler.readRequest(watlow, 4001)),
+        ('FrameCompiler.writeRequest', lambda: compiler.writeRequest(watlow, 7001, 81.5, float)),
+        ('_headerCheckByte', lambda: watlow._headerCheckByte(header)),
+        ('_dataCheckByte', lambda: watlow._dataCheckByte(data)),
+        ('checksum.verifyFrame', lambda: checksum.verifyFrame(READ_RESPONSE)),
+        ('_validateResponse', lambda: watlow._validateResponse(READ_RESPONSE)),
+        ('_parseResponse float', lambda: watlow._parseResponse(READ_RESPONSE)),
+        ('_parseResponse int', lambda: watlow2._parseResponse(WRITE_RESPONSE)),
+        ('parseResponse', lambda: parseResponse(READ_RESPONSE, 1)),
+        ('readParam round trip', lambda: polled.readParam(4001)),
+        ('writeParam round trip', lambda: polled.writeParam(7001, 81.5)),
+        ('readParam with metrics', lambda: measured.readParam(4001)),
+        ('readParams zone', lambda: standard.readParams(zone)),
+        ('readParams zone Modbus', lambda: block.readParams(zone)),
+    ]
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def measure(fun, number, repeat):
+    # Warm up caches (frame compiler, etc.)
+    for _ in range(min(number, 100)):
+        fun()
+
+    gc.disable()
+    try:
+        # Best of `repeat` runs, the others were slowed down by something else
+        total = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fun()
+            total = min(total, time.perf_counter() - start)
+
+        clock = time.perf_counter
+        samples = []
+        for _ in range(number):
+            callStart = clock()
+            fun()
+            samples.append(clock() - callStart)
+    finally:
+        gc.enable()
+    samples.sort()
+
+    tracemalloc.start()
+    try:
+        fun()
+        before = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        fun()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        blocks = sys.getallocatedblocks()
+        for _ in range(100):
+            fun()
+        retained = (sys.getallocatedblocks() - blocks) / 100
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'ops_per_sec': number / total,
+        'p50_us': percentile(samples, 0.50) * 1e6,
+        'p99_us': percentile(samples, 0.99) * 1e6,
+        'alloc_peak_bytes': peak,
+        'retained_blocks': retained,
+    }
+
+
+def metadata():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'crcmod_extension': checksum.usingExtension,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=10000, help='calls per case')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='timed runs per case, the fastest is kept')
+    parser.add_argument('-k', '--filter', default='', help='only run cases containing this string')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fraction of ops/sec lost against the baseline that counts as a regression')
+    args = parser.parse_args(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['results']
+
+    results = {}
+    regressions = []
+    print('{0:<28} {1:>12} {2:>9} {3:>9} {4:>8} {5:>8} {6:>8}'.format(
+        'case', 'ops/sec', 'p50 us', 'p99 us', 'alloc B', 'retained', 'change'))
+    for name, fun in cases():
+        if args.filter not in name:
+            continue
+        result = measure(fun, args.number, args.repeat)
+        results[name] = result
+        change = ''
+        if baseline and name in baseline:
+            ratio = result['ops_per_sec'] / baseline[name]['ops_per_sec']
+            change = '{0:+.0%}'.format(ratio - 1)
+            if ratio < 1 - args.threshold:
+                regressions.append(name)
+        print('{0:<28} {ops_per_sec:12.0f} {p50_us:9.2f} {p99_us:9.2f} {alloc_peak_bytes:8d} {retained_blocks:8.2f} {1:>8}'.format(
+            name, change, **result))
+
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump({'metadata': metadata(), 'results': results}, fh, indent=2, sort_keys=True)
+    if regressions:
+        print('Regressions against {0}: {1}'.format(args.compare, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -74,6 +74,8 @@ setup(
         # eg:
         #   'rst': ['docutils>=0.11'],
         #   ':python_version=="2.6"': ['argparse'],
+        'async': ['pyserial-asyncio'],
+        'capture': ['numpy'],
     },
     entry_points={
         'console_scripts': [
@@ -0,0 +1,253 @@
+'''
+asyncio versions of `WatlowBus` and `Watlow`.
+
+Requests are written to and responses read from a pair of asyncio streams, so
+any number of pending reads on any number of ports only needs the event loop's
+thread. `AsyncWatlowBus.open()` opens a serial port with the optional
+pyserial-asyncio package (``pip install pyserial-asyncio``); any other
+transport can be used by passing its `StreamReader` and `StreamWriter`.
+'''
+import asyncio
+
+from pywatlow import params as catalog
+from pywatlow.checksum import verifyFrame
+from pywatlow.frames import HEADER_LENGTH
+from pywatlow.frames import FrameDecoder
+from pywatlow.frames import answers
+from pywatlow.frames import frameLength
+from pywatlow.timing import ResponseTimer
+from pywatlow.watlow import Watlow
+from pywatlow.watlow import _paramSpec
+
+
+class AsyncWatlowBus():
+    '''
+    Object representing one RS-485 serial port shared by up to 16 Watlow
+    controllers, accessed through asyncio streams.
+
+    * **reader**: asyncio.StreamReader receiving bytes from the port
+    * **writer**: asyncio.StreamWriter sending bytes to the port
+    * **timeout** (float): default read timeout in seconds, the longest a request waits for its response
+    * **adaptive** (bool): adapt the timeout of each address to its response times
+    * **metrics**: `Metrics` (see `pywatlow.metrics`) recording each transaction, or `None`
+
+    Transactions are run one at a time and each response is matched to its
+    request by the zone byte, parameter and instance. Controllers are
+    accessed through `AsyncWatlow` handles::
+
+        bus = await AsyncWatlowBus.open('/dev/ttyUSB0')
+        print(await bus[1].read())
+
+    Timeouts adapt to each address and dead addresses are skipped as with
+    `WatlowBus`.
+    '''
+    def __init__(self, reader, writer, timeout=0.5, adaptive=True, metrics=None):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.baudrate = 38400
+        self.adaptive = adaptive
+        self.metrics = metrics
+        self.mismatched = 0
+        self._timers = {}
+        self._decoder = FrameDecoder()
+        # Created on first use, inside the running event loop
+        self._lock = None
+        self._handles = {}
+
+    @classmethod
+    async def open(cls, port, timeout=0.5):
+        '''
+        Opens `port` with pyserial-asyncio and returns the bus.
+        '''
+        try:
+            import serial_asyncio
+        except ImportError:
+            raise ImportError('AsyncWatlowBus.open() requires pyserial-asyncio (pip install pyserial-asyncio)')
+        reader, writer = await serial_asyncio.open_serial_connection(url=port, baudrate=38400)
+        return cls(reader, writer, timeout=timeout)
+
+    async def close(self):
+        self.writer.close()
+        if hasattr(self.writer, 'wait_closed'):
+            await self.writer.wait_closed()
+
+    def __getitem__(self, address):
+        return self.watlow(address)
+
+    def watlow(self, address):
+        '''
+        Returns the `AsyncWatlow` handle for the controller at `address` (1
+        through 16).
+        '''
+        if not 1 <= address <= 16:
+            raise ValueError('Watlow addresses are 1 through 16, not {0}'.format(address))
+        handle = self._handles.get(address)
+        if handle is None:
+            handle = self._handles.setdefault(address, AsyncWatlow(self, address))
+        return handle
+
+    def timer(self, address):
+        '''
+        Returns the `ResponseTimer` of `address`.
+        '''
+        timer = self._timers.get(address)
+        if timer is None:
+            timer = self._timers.setdefault(address, ResponseTimer(self.timeout))
+        return timer
+
+    async def _readFrame(self, request, address):
+        # Reads frames until the response to `request`, dropping responses
+        # from other addresses and to other requests (see `WatlowBus`)
+        decoder = self._decoder
+        while True:
+            frame = decoder.decode()
+            if frame is None:
+                chunk = await self.reader.read(decoder.needed())
+                if not chunk:
+                    # End of stream
+                    return decoder.pending
+                decoder.feed(chunk)
+            elif frame[4] - 15 == address and (not verifyFrame(frame) or answers(request, frame)):
+                return frame
+            else:
+                self.mismatched += 1
+                if self.metrics is not None:
+                    self.metrics.dropped(address, frame)
+
+    async def transact(self, request, address, timeout=None):
+        '''
+        Writes `request` and returns the first response frame from `address`,
+        or whatever was received before the timeout (`b''` if nothing was).
+
+        Cancelling the call leaves the bus usable: a late response is dropped
+        by the next transaction because its zone, parameter or instance
+        doesn't match.
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        clock = asyncio.get_event_loop().time
+        async with self._lock:
+            timer = self.timer(address) if self.adaptive else None
+            if timeout is None:
+                if timer is None:
+                    timeout = self.timeout
+                elif not timer.available(clock()):
+                    if self.metrics is not None:
+                        self.metrics.skipped(address, request)
+                    return b''
+                else:
+                    timeout = timer.timeout()
+            # Drop what's left of earlier transactions
+            self._decoder.reset()
+            start = clock()
+            self.writer.write(request)
+            await self.writer.drain()
+            try:
+                frame = await asyncio.wait_for(self._readFrame(request, address), timeout)
+            except asyncio.TimeoutError:
+                frame = self._decoder.pending
+                if len(frame) < HEADER_LENGTH or frame[4] - 15 == address:
+                    self._decoder.reset()
+                else:
+                    frame = b''
+            if self.metrics is not None:
+                self.metrics.record(address, request, frame, clock() - start)
+            if timer is not None:
+                if len(frame) >= HEADER_LENGTH and len(frame) == frameLength(frame):
+                    timer.success(clock() - start)
+                else:
+                    timer.failure(start)
+            return frame
+
+
+class AsyncWatlow(Watlow):
+    '''
+    asyncio version of `Watlow` for one address on an `AsyncWatlowBus`. The
+    methods take the same arguments as `Watlow`'s plus an optional `timeout`
+    in seconds, and must be awaited. Use `AsyncWatlowBus.watlow()` (or
+    `bus[address]`) instead of creating these directly.
+    '''
+    def __init__(self, bus, address):
+        self.bus = bus
+        self.address = address
+        self.timeout = bus.timeout
+        self.baudrate = bus.baudrate
+        self.port = None
+        self.serial = None
+
+    def open(self):
+        '''
+        Does nothing, the streams are opened and closed by the bus.
+        '''
+
+    def close(self):
+        '''
+        Does nothing, the streams are opened and closed by the bus.
+        '''
+
+    async def read(self, instance='01', timeout=None):
+        '''
+        Reads the current temperature, see `Watlow.read()`.
+        '''
+        return await self.readParam(4001, float, instance, timeout)
+
+    async def readSetpoint(self, instance='01', timeout=None):
+        '''
+        Reads the current setpoint, see `Watlow.readSetpoint()`.
+        '''
+        return await self.readParam(7001, float, instance, timeout)
+
+    async def readParam(self, param, data_type=None, instance='01', timeout=None):
+        '''
+        Reads a parameter, see `Watlow.readParam()`.
+        '''
+        request = self.compiler.readRequest(self, param, instance)
+        response = await self.bus.transact(request, self.address, timeout)
+        return self._parseReading(response)
+
+    async def write(self, value, instance='01', timeout=None):
+        '''
+        Changes the setpoint, see `Watlow.write()`.
+        '''
+        return await self.writeParam(7001, value, float, instance, timeout)
+
+    async def writeParam(self, param, value, data_type=None, instance='01', timeout=None):
+        '''
+        Changes the value of a parameter, see `Watlow.writeParam()`.
+        '''
+        data_type = catalog.dataType(param, data_type)
+        request = self.compiler.writeRequest(self, param, value, data_type, instance)
+        response = await self.bus.transact(request, self.address, timeout)
+        return self._parseReading(response)
+
+    async def readParams(self, params, timeout=None):
+        '''
+        Reads several parameters, see `Watlow.readParams()`.
+        '''
+        specs = [_paramSpec(spec) for spec in params]
+        requests = [self.compiler.readRequest(self, param, instance) for param, data_type, instance in specs]
+        return await self._transactMany(requests, timeout)
+
+    async def writeParams(self, values, timeout=None):
+        '''
+        Changes several parameters, see `Watlow.writeParams()`.
+        '''
+        requests = []
+        for spec in values:
+            param, value = spec[0], spec[1]
+            data_type = catalog.dataType(param, spec[2] if len(spec) > 2 else None)
+            instance = spec[3] if len(spec) > 3 else '01'
+            requests.append(self.compiler.writeRequest(self, param, value, data_type, instance))
+        return await self._transactMany(requests, timeout)
+
+    async def _transactMany(self, requests, timeout=None):
+        # Runs the requests one after another, stopping after the first one
+        # without a response, and returns the readings
+        responses = []
+        for request in requests:
+            response = await self.bus.transact(request, self.address, timeout)
+            responses.append(response)
+            if not response:
+                break
+        return self._batchOutputs(requests, responses, None)
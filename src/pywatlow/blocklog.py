@@ -0,0 +1,346 @@
+'''
+Append-only columnar log of readings.
+
+`ReadingLog` collects readings into blocks and appends each block to a file
+as columns (timestamps, values, parameter IDs, ...) with a single write,
+instead of formatting a line of text per reading. The file is synced to disk
+every `fsyncInterval` seconds::
+
+    log = ReadingLog.create('readings.pwl')
+    poller = Poller({'COM5': {1: [4001, 7001]}}, log=log, queue=False)
+    ...
+    log.close()
+
+Reading the log back doesn't parse anything: the file is memory mapped and
+the columns of each block are views of the mapping. `columns()` returns
+NumPy arrays (``pip install pywatlow[capture]``) of the readings between two
+times, reading only the blocks that overlap them::
+
+    log = ReadingLog.open('readings.pwl')
+    columns = log.columns(start=time.time() - 3600)
+    print(columns['value'][columns['param'] == 4001].mean())
+
+The file starts with `FILE_HEADER` (magic and version), followed by blocks.
+Each block is a `BLOCK` header (marker, number of readings, first and last
+timestamp) followed by the `COLUMNS` in order, little-endian, padded to a
+multiple of 8 bytes. A small index file next to the log (its path plus
+'.idx') holds the offset, count and time range of every block as
+`INDEX_ENTRY`; blocks missing from the index, e.g. after a crash, are found by
+scanning the block headers. A block is only taken as complete if it is
+followed by another block (or the start of one) or the end of the file.
+'''
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+MAGIC = b'PWRL'
+VERSION = 1
+# magic, version
+FILE_HEADER = struct.Struct('<4sH10x')
+BLOCK_MARKER = b'PWRB'
+# marker, number of readings, first timestamp, last timestamp
+BLOCK = struct.Struct('<4sI8xdd')
+# block offset, number of readings, first timestamp, last timestamp
+INDEX_ENTRY = struct.Struct('<QI4xdd')
+# Column name, array type code and NumPy dtype, in the order they are stored
+COLUMNS = (
+    ('timestamp', 'd', '<f8'),
+    ('value', 'd', '<f8'),
+    ('param', 'I', '<u4'),
+    ('address', 'B', 'u1'),
+    ('instance', 'B', 'u1'),
+    ('status', 'B', 'u1'),
+    ('valueType', 'B', 'u1'),
+)
+# Bytes per reading over all columns
+_ROW_SIZE = 8 + 8 + 4 + 1 + 1 + 1 + 1
+
+_NAN = float('nan')
+
+# Value types
+NONE = 0
+FLOAT = 1
+INT = 2
+
+
+def blockSize(count):
+    '''
+    Returns the size in bytes of a block of `count` readings, header included.
+    '''
+    return BLOCK.size + (count * _ROW_SIZE + 7) // 8 * 8
+
+
+def _validBlock(data, size, offset, count):
+    # A complete block has its marker and is followed by the end of the file
+    # or the marker of the next block (all of it written or not). A block torn
+    # by a crash usually isn't, even once more blocks were appended after it.
+    end = offset + blockSize(count)
+    if not count or end > size or data[offset:offset + 4] != BLOCK_MARKER:
+        return False
+    following = min(len(BLOCK_MARKER), size - end)
+    return data[end:end + following] == BLOCK_MARKER[:following]
+
+
+class ReadingLog():
+    '''
+    Columnar log file of readings. Use `create()` to append readings and
+    `open()` to read them.
+
+    * **path** (str): log file
+    * **writable** (bool): open for appending, creating the file if needed
+    * **blockSize** (int): readings per block
+    * **fsyncInterval** (float): longest time in seconds between syncs to disk, `None` to leave it to the OS
+    * **clock**: function returning the time in seconds, for `fsyncInterval`
+
+    Readings are added with `add()`, which takes the same arguments as
+    `LatestValueTable.publish()`. A block is written when it is full, when
+    `fsyncInterval` seconds have passed since the last sync (so a block may
+    be partial), and on `flush()` and `close()`. Opening a log for appending
+    first cuts off a block left incomplete by a crash.
+    '''
+    def __init__(self, path, writable, blockSize=4096, fsyncInterval=5.0, clock=time.monotonic):
+        self.path = path
+        self.indexPath = path + '.idx'
+        self.writable = writable
+        self.blockSize = blockSize
+        self.fsyncInterval = fsyncInterval
+        self.clock = clock
+        self.written = 0
+        self.syncs = 0
+        self._lock = threading.Lock()
+        self._map = None
+        if writable:
+            self._recover()
+            self._file = open(path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self._index = open(self.indexPath, 'ab')
+            self._columns = [array(typecode) for name, typecode, dtype in COLUMNS]
+            self._lastSync = clock()
+        else:
+            self._file = open(path, 'rb')
+            self._index = None
+            self.refresh()
+
+    @classmethod
+    def create(cls, path, blockSize=4096, fsyncInterval=5.0, clock=time.monotonic):
+        '''
+        Opens the log at `path` for appending, creating it if it doesn't exist.
+        '''
+        return cls(path, True, blockSize, fsyncInterval, clock)
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Opens an existing log for reading.
+        '''
+        return cls(path, False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, address, param, instance, reading):
+        '''
+        Adds `reading` of (address, param, instance) to the current block.
+        '''
+        if instance.__class__ is str:
+            instance = int(instance, 16)
+        value = reading.value
+        if value is None:
+            value, valueType = _NAN, NONE
+        else:
+            valueType = FLOAT if value.__class__ is float else INT
+        with self._lock:
+            timestamps, values, params, addresses, instances, statuses, valueTypes = self._columns
+            timestamps.append(reading.timestamp)
+            values.append(value)
+            params.append(param)
+            addresses.append(address)
+            instances.append(instance)
+            statuses.append(reading.status)
+            valueTypes.append(valueType)
+            if len(timestamps) >= self.blockSize:
+                self._writeBlock()
+            if self.fsyncInterval is not None and self.clock() - self._lastSync >= self.fsyncInterval:
+                # Write the block even if it isn't full, so no more than
+                # fsyncInterval seconds of readings are lost
+                self._writeBlock()
+                self._sync()
+
+    def __len__(self):
+        if self.writable:
+            return self.written + len(self._columns[0])
+        return sum(entry[1] for entry in self._blocks)
+
+    def _writeBlock(self):
+        columns = self._columns
+        count = len(columns[0])
+        if not count:
+            return
+        timestamps = columns[0]
+        parts = [BLOCK.pack(BLOCK_MARKER, count, min(timestamps), max(timestamps))]
+        for column in columns:
+            if sys.byteorder == 'big':
+                column.byteswap()
+            parts.append(column.tobytes())
+        data = b''.join(parts)
+        data += bytes(blockSize(count) - len(data))
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        self._index.write(INDEX_ENTRY.pack(offset, count, min(timestamps), max(timestamps)))
+        self._index.flush()
+        self.written += count
+        self._columns = [array(typecode) for name, typecode, dtype in COLUMNS]
+
+    def _recover(self):
+        # Truncates the log after its last complete block, e.g. when a crash
+        # left half a block at the end, so that appended blocks follow valid
+        # ones, and rewrites the index to match
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, 'r+b') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self._checkHeader(data, size)
+                blocks = self._readIndex(data, size)
+            finally:
+                data.close()
+            end = blocks[-1][0] + blockSize(blocks[-1][1]) if blocks else FILE_HEADER.size
+            if end < size:
+                fh.truncate(end)
+        with open(self.indexPath, 'wb') as fh:
+            fh.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in blocks))
+
+    def _checkHeader(self, data, size):
+        if size < FILE_HEADER.size or FILE_HEADER.unpack_from(data, 0) != (MAGIC, VERSION):
+            raise ValueError('{0} is not a version {1} reading log'.format(self.path, VERSION))
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        os.fsync(self._index.fileno())
+        self._lastSync = self.clock()
+        self.syncs += 1
+
+    def flush(self):
+        '''
+        Writes the current block, even if it isn't full, and syncs the log to
+        disk.
+        '''
+        with self._lock:
+            self._writeBlock()
+            self._sync()
+
+    def close(self):
+        if self.writable:
+            self.flush()
+            self._index.close()
+        else:
+            self._unmap()
+        self._file.close()
+
+    def _unmap(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Views from blockColumns() still exist, the mapping is closed
+                # when they are released
+                pass
+            self._map = None
+
+    def refresh(self):
+        '''
+        Maps the log again and reads its index, to see the blocks written
+        since it was opened.
+        '''
+        self._unmap()
+        size = os.path.getsize(self.path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._checkHeader(self._map, size)
+        self._blocks = self._readIndex(self._map, size)
+
+    def _readIndex(self, data, size):
+        # Returns the (offset, count, first, last) of each complete block of
+        # the mapped log `data`, from the index file and then from the block
+        # headers it's missing
+        blocks = []
+        offset = FILE_HEADER.size
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath, 'rb') as fh:
+                index = fh.read()
+            for position in range(0, len(index) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+                entry = INDEX_ENTRY.unpack_from(index, position)
+                if entry[0] != offset or not _validBlock(data, size, offset, entry[1]):
+                    break
+                blocks.append(entry)
+                offset += blockSize(entry[1])
+        while offset + BLOCK.size <= size:
+            marker, count, first, last = BLOCK.unpack_from(data, offset)
+            if not _validBlock(data, size, offset, count):
+                break
+            blocks.append((offset, count, first, last))
+            offset += blockSize(count)
+        return blocks
+
+    def blocks(self, start=None, end=None):
+        '''
+        Returns the (offset, count, first timestamp, last timestamp) of the
+        blocks holding readings from `start` up to `end`.
+        '''
+        return [entry for entry in self._blocks
+                if (start is None or entry[3] >= start) and (end is None or entry[2] < end)]
+
+    def blockColumns(self, start=None, end=None):
+        '''
+        Yields a dict of the columns of each block holding readings from
+        `start` up to `end`, as `memoryview` objects of the mapped file (in
+        the host's byte order, which must be little-endian). Blocks can also
+        hold readings outside the range. The views stay valid after `close()`
+        and `refresh()`.
+        '''
+        for offset, count, first, last in self.blocks(start, end):
+            position = offset + BLOCK.size
+            columns = {}
+            for name, typecode, dtype in COLUMNS:
+                size = count * array(typecode).itemsize
+                columns[name] = memoryview(self._map)[position:position + size].cast(typecode)
+                position += size
+            yield columns
+
+    def columns(self, start=None, end=None):
+        '''
+        Returns a dict of NumPy arrays of the readings from `start` up to
+        `end` (seconds since the epoch), by column name. Failed readings have
+        a NaN value and `valueType` `NONE`.
+        '''
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('ReadingLog.columns() requires numpy (pip install pywatlow[capture])')
+        parts = {name: [] for name, typecode, dtype in COLUMNS}
+        for offset, count, first, last in self.blocks(start, end):
+            position = offset + BLOCK.size
+            for name, typecode, dtype in COLUMNS:
+                column = numpy.frombuffer(self._map, dtype=dtype, count=count, offset=position)
+                parts[name].append(column)
+                position += column.nbytes
+        columns = {name: numpy.concatenate(parts[name]) if parts[name] else numpy.empty(0, dtype)
+                   for name, typecode, dtype in COLUMNS}
+        if start is not None or end is not None:
+            timestamps = columns['timestamp']
+            keep = numpy.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                keep &= timestamps >= start
+            if end is not None:
+                keep &= timestamps < end
+            columns = {name: column[keep] for name, column in columns.items()}
+        return columns
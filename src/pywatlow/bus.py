@@ -0,0 +1,239 @@
+import threading
+import time
+
+import serial as ser
+
+from pywatlow.capture import CaptureSerial
+from pywatlow.checksum import verifyFrame
+from pywatlow.frames import HEADER_LENGTH
+from pywatlow.frames import answers
+from pywatlow.frames import frameLength
+from pywatlow.frames import readFrame
+from pywatlow.timing import ResponseTimer
+from pywatlow.watlow import Watlow
+from pywatlow.writes import WriteBehind
+
+
+class WatlowBus():
+    '''
+    Object representing one RS-485 serial port shared by up to 16 Watlow
+    controllers. The bus owns the port and runs one transaction (request and
+    response) at a time, so it can be used from several threads.
+
+    * **serial**: serial object (see pySerial's serial.Serial class) or `None`
+    * **port** (str): string representing the serial port or `None`
+    * **timeout** (float): Read timeout value in seconds, the longest a request waits for its response
+    * **adaptive** (bool): adapt the timeout of each address to its response times
+    * **clock**: function returning the time in seconds, used to measure response times
+    * **cache**: `ReadCache` (see `pywatlow.cache`) shared by the handles, or `None`
+    * **writeFilter**: `WriteFilter` (see `pywatlow.writes`) shared by the handles, or `None`
+    * **metrics**: `Metrics` (see `pywatlow.metrics`) recording each transaction, or `None`
+    * **capture** (str): path of a file to log every frame sent and received to (see `pywatlow.capture`), or `None`
+
+    Controllers are accessed through handles with the same `readParam()` and
+    `writeParam()` API as `Watlow`::
+
+        bus = WatlowBus(port='COM5')
+        print(bus[1].read())
+        print(bus[2].readParam(8003, int))
+
+    Each response is matched to its request by the zone byte and by the
+    parameter and instance it names. Other frames (e.g. a late response to a
+    request that already timed out) are dropped and counted in `mismatched`.
+
+    With `adaptive` on, each address gets a `ResponseTimer` (see
+    `pywatlow.timing`, and `timer()`) that sets the read timeout from the
+    controller's measured response times instead of always waiting `timeout`.
+    An address that times out several times in a row is considered dead: its
+    requests return no response immediately, except for probes sent with
+    exponential backoff, until it answers again.
+    '''
+    def __init__(self, serial=None, port=None, timeout=0.5, adaptive=True, clock=time.monotonic, cache=None,
+                 writeFilter=None, metrics=None, capture=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.writeFilter = writeFilter
+        self.metrics = metrics
+        self.baudrate = 38400
+        self.adaptive = adaptive
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.mismatched = 0
+        self._handles = {}
+        self._timers = {}
+        self._writeBehind = None
+        if serial:
+            self.port = serial.port
+            self.serial = serial
+        else:
+            self.port = port
+            self.open()
+        if capture is not None:
+            self.serial = CaptureSerial(self.serial, capture)
+
+    def open(self):
+        self.serial = ser.Serial(self.port, self.baudrate, timeout=self.timeout)
+
+    def close(self):
+        if self._writeBehind is not None:
+            self._writeBehind.close()
+        with self.lock:
+            self.serial.flush()
+            self.serial.close()
+
+    def __getitem__(self, address):
+        return self.watlow(address)
+
+    def watlow(self, address):
+        '''
+        Returns the handle for the controller at `address` (1 through 16).
+        Handles are created once per address and can be shared.
+        '''
+        if not 1 <= address <= 16:
+            raise ValueError('Watlow addresses are 1 through 16, not {0}'.format(address))
+        handle = self._handles.get(address)
+        if handle is None:
+            handle = self._handles.setdefault(address, WatlowHandle(self, address))
+        return handle
+
+    def writeBehind(self, **options):
+        '''
+        Returns the bus's `WriteBehind` (see `pywatlow.writes`), which sends the
+        handles' `writeParamAsync()` writes from a background thread. It is
+        created with `options` on the first call.
+        '''
+        with self.lock:
+            if self._writeBehind is None:
+                self._writeBehind = WriteBehind(self, **options)
+            return self._writeBehind
+
+    def timer(self, address):
+        '''
+        Returns the `ResponseTimer` of `address`.
+        '''
+        timer = self._timers.get(address)
+        if timer is None:
+            timer = self._timers.setdefault(address, ResponseTimer(self.timeout))
+        return timer
+
+    def transact(self, request, address, timeout=None):
+        '''
+        Writes `request` and returns the first response frame from `address`,
+        or whatever was received before the timeout (`b''` if nothing was).
+
+        * **request** (bytes): complete request frame
+        * **address** (int): Watlow controller address the request was sent to
+        * **timeout** (float): seconds to wait for the response. Defaults to the address's adaptive timeout, or
+          the bus timeout if `adaptive` is off
+
+        If the address is dead (see `ResponseTimer`) and not due for a probe,
+        `b''` is returned without sending the request.
+        '''
+        with self.lock:
+            timer = self.timer(address) if self.adaptive else None
+            if timeout is None:
+                if timer is None:
+                    timeout = self.timeout
+                elif not timer.available(self.clock()):
+                    if self.metrics is not None:
+                        self.metrics.skipped(address, request)
+                    return b''
+                else:
+                    timeout = timer.timeout()
+            # Drop anything left over from earlier transactions
+            if getattr(self.serial, 'in_waiting', 0):
+                self.serial.reset_input_buffer()
+            if self.serial.timeout != timeout:
+                self.serial.timeout = timeout
+            start = self.clock()
+            try:
+                self.serial.write(request)
+                frame = self._receive(request, address, start + timeout)
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.failed(address, request, self.clock() - start)
+                raise
+            if self.metrics is not None:
+                self.metrics.record(address, request, frame, self.clock() - start)
+            if timer is not None:
+                if len(frame) >= HEADER_LENGTH and len(frame) == frameLength(frame):
+                    timer.success(self.clock() - start)
+                else:
+                    timer.failure(start)
+            return frame
+
+    def _receive(self, request, address, deadline):
+        # Reads frames until the response to `request`, dropping responses
+        # from other addresses and to other requests
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return b''
+            frame = readFrame(self.serial, remaining)
+            if len(frame) < HEADER_LENGTH or len(frame) != frameLength(frame):
+                return frame
+            if frame[4] - 15 == address and (not verifyFrame(frame) or answers(request, frame)):
+                # Corrupt responses are returned and reported as invalid
+                return frame
+            self.mismatched += 1
+            if self.metrics is not None:
+                self.metrics.dropped(address, frame)
+
+
+class WatlowHandle(Watlow):
+    '''
+    `Watlow` object for one address on a `WatlowBus`. Requests go through the
+    bus, which owns the serial port. Use `WatlowBus.watlow()` (or
+    `bus[address]`) instead of creating handles directly.
+    '''
+    def __init__(self, bus, address):
+        self.bus = bus
+        self.address = address
+        self.timeout = bus.timeout
+        self.baudrate = bus.baudrate
+
+    @property
+    def serial(self):
+        return self.bus.serial
+
+    @property
+    def port(self):
+        return self.bus.port
+
+    @property
+    def cache(self):
+        return self.bus.cache
+
+    @property
+    def writeFilter(self):
+        return self.bus.writeFilter
+
+    @property
+    def metrics(self):
+        return self.bus.metrics
+
+    def open(self):
+        '''
+        Does nothing, the serial port is opened and closed by the bus.
+        '''
+
+    def close(self):
+        '''
+        Does nothing, the serial port is opened and closed by the bus.
+        '''
+
+    def writeParamAsync(self, param, value, data_type=None, instance='01'):
+        '''
+        Queues a write like `writeParam()` on the bus's `WriteBehind` and
+        returns a `concurrent.futures.Future` resolved with the `Reading` from
+        the response. Raises `queue.Full` if too many writes are pending.
+        '''
+        return self.bus.writeBehind().writeParam(self.address, param, value, data_type, instance)
+
+    def _transact(self, request):
+        return self.bus.transact(request, self.address)
+
+    def _transactMany(self, requests):
+        # Keep the bus for the whole batch
+        with self.bus.lock:
+            return Watlow._transactMany(self, requests)
@@ -0,0 +1,149 @@
+'''
+Read cache for `Watlow` objects.
+
+A `ReadCache` keeps the last successful reading of each (address, param,
+instance) for a time to live (TTL), so several callers reading the same
+parameter within the TTL share one transaction::
+
+    cache = ReadCache(ttl=1.0, ttls={4001: 0.2, 8003: 300.0})
+    watlow = Watlow(port='COM5', address=1, cache=cache)
+    watlow.readSetpoint()   # read from the controller
+    watlow.readSetpoint()   # returned from the cache
+
+Writes update the cached value from the controller's echo of the written
+value, or drop it if the write failed. With `stale=True`, an expired reading
+is returned right away while a background thread reads the new value.
+'''
+import threading
+import time
+
+
+def cacheKey(address, param, instance='01'):
+    '''
+    Returns the cache key of a parameter. `instance` is either the two digit
+    string passed to `readParam()` or the instance number of a `Reading`.
+    '''
+    if isinstance(instance, str):
+        instance = int(instance, 16)
+    return (address, int(param), instance)
+
+
+class ReadCache():
+    '''
+    Time to live cache of readings, shared by any number of `Watlow` objects.
+
+    * **ttl** (float): seconds a reading is fresh
+    * **ttls** (dict): seconds a reading is fresh by parameter ID, overriding `ttl`
+    * **stale** (bool): return expired readings while they are refreshed in the background
+    * **clock**: function returning the time in seconds
+
+    Only successful readings are cached. `stats()` reports hits and misses.
+    '''
+    def __init__(self, ttl=1.0, ttls=None, stale=False, clock=time.monotonic):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.stale = stale
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.staleHits = 0
+        self.refreshes = 0
+        self.invalidations = 0
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def ttlOf(self, param):
+        return self.ttls.get(int(param), self.ttl)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        '''
+        Returns the fresh cached reading for `key`, or `None`.
+        '''
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() < entry[0]:
+            return entry[1]
+        return None
+
+    def put(self, key, reading):
+        '''
+        Caches `reading` if it is successful, otherwise drops the entry for
+        `key`.
+        '''
+        with self._lock:
+            if reading.ok:
+                self._entries[key] = (self.clock() + self.ttlOf(key[1]), reading)
+            elif self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate(self, address=None, param=None, instance=None):
+        '''
+        Drops the cached readings matching `address`, `param` and `instance`
+        (all of them if none are given).
+        '''
+        if instance is not None:
+            instance = cacheKey(0, 0, instance)[2]
+        with self._lock:
+            for key in list(self._entries):
+                if ((address is None or key[0] == address) and (param is None or key[1] == int(param)) and
+                        (instance is None or key[2] == instance)):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def read(self, key, load):
+        '''
+        Returns the reading for `key` from the cache, or from calling `load()`
+        (which runs the transaction) on a miss.
+        '''
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now < entry[0]:
+                    self.hits += 1
+                    return entry[1]
+                if self.stale:
+                    self.staleHits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, load), daemon=True).start()
+                    return entry[1]
+            self.misses += 1
+        reading = load()
+        self.put(key, reading)
+        return reading
+
+    def _refresh(self, key, load):
+        try:
+            reading = load()
+            # Keep the stale reading if the refresh failed
+            if reading.ok:
+                self.put(key, reading)
+            self.refreshes += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        '''
+        Returns a dict with the number of 'hits', 'misses', 'staleHits'
+        (expired readings returned while refreshing), background 'refreshes',
+        'invalidations', cached 'entries' and the 'hitRate'.
+        '''
+        lookups = self.hits + self.staleHits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'staleHits': self.staleHits,
+            'refreshes': self.refreshes,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+            'hitRate': (self.hits + self.staleHits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,293 @@
+'''
+Capture of every frame sent and received, and an offline decoder.
+
+`CaptureSerial` wraps a serial object and appends each request it writes and
+each frame it reads to a log file, with a timestamp, as fixed size records.
+Pass `capture=` to `Watlow` or `WatlowBus` to wrap their port::
+
+    bus = WatlowBus(port='COM5', capture='bus.cap')
+
+`CaptureLog` reads a log back: `records()` yields the frames one by one, and
+`decode()` memory maps the file and decodes all of it at once with NumPy
+(``pip install pywatlow[capture]``), checking the check bytes and extracting
+the parameters and values of millions of frames in vectorized operations::
+
+    decoded = CaptureLog('bus.cap').decode()
+    temperatures = decoded[(decoded['param'] == 4001) & (decoded['status'] == OK)]
+
+The log starts with `FILE_HEADER` (magic, version and record size), followed
+by `RECORD`s: timestamp, direction (`TX` or `RX`), length of the frame and the
+first `FRAME_SIZE` bytes of the frame, zero padded. Requests and responses
+are at most 21 bytes long; longer frames are stored truncated and decoded as
+`INVALID`. Bytes received that don't complete a frame before the next request
+are stored as a frame of their own.
+'''
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pywatlow.checksum import DATA_TABLE
+from pywatlow.checksum import HEADER_TABLE
+from pywatlow.frames import FrameDecoder
+from pywatlow.reading import INVALID
+from pywatlow.reading import NO_RESPONSE
+from pywatlow.reading import OK
+from pywatlow.reading import READ_FLOAT_LENGTH
+from pywatlow.reading import READ_INT_LENGTH
+from pywatlow.reading import READ_PARAM_OFFSET
+from pywatlow.reading import UNPARSEABLE
+from pywatlow.reading import WRITE_FLOAT_LENGTH
+from pywatlow.reading import WRITE_INT_LENGTH
+from pywatlow.reading import WRITE_PARAM_OFFSET
+
+MAGIC = b'PWCP'
+VERSION = 1
+FRAME_SIZE = 32
+# magic, version, record size
+FILE_HEADER = struct.Struct('<4sHH8x')
+# timestamp, direction, frame length, frame
+RECORD = struct.Struct('<dBxH4x{0}s'.format(FRAME_SIZE))
+
+# Directions
+TX = 0
+RX = 1
+
+# Value types of decoded frames
+NONE = 0
+FLOAT = 1
+INT = 2
+
+# Data lengths of request frames
+_READ_REQUEST_LENGTH = 6
+_WRITE_FLOAT_REQUEST_LENGTH = 10
+_WRITE_INT_REQUEST_LENGTH = 9
+
+# Decoded frames per chunk in `CaptureLog.decode()`
+_CHUNK = 1 << 20
+
+CaptureRecord = namedtuple('CaptureRecord', ['timestamp', 'direction', 'frame'])
+
+
+class CaptureSerial():
+    '''
+    Serial object logging every frame written to and read from `serial`.
+
+    * **serial**: serial object (see pySerial's serial.Serial class)
+    * **path** (str): log file, appended to if it exists
+    * **clock**: function returning the time in seconds since the epoch
+
+    Everything else is passed through to `serial`, so a `CaptureSerial` can
+    be used anywhere a serial object is accepted. Each frame is written to
+    the log when it is complete, so a crash only loses a frame still being
+    received. Closing it closes the log too.
+    '''
+    def __init__(self, serial, path, clock=time.time):
+        self.serial = serial
+        self.path = path
+        self.clock = clock
+        self.records = 0
+        self._decoder = FrameDecoder()
+        self._lock = threading.Lock()
+        # Unbuffered: each record is written to the file as it is captured,
+        # so the log survives the process dying
+        self._log = open(path, 'ab', buffering=0)
+        if self._log.tell() == 0:
+            self._log.write(FILE_HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def __getattr__(self, name):
+        return getattr(self.serial, name)
+
+    @property
+    def timeout(self):
+        return self.serial.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.serial.timeout = timeout
+
+    def _record(self, direction, frame):
+        self._log.write(RECORD.pack(self.clock(), direction, len(frame), frame[:FRAME_SIZE]))
+        self.records += 1
+
+    def write(self, data):
+        with self._lock:
+            pending = self._decoder.pending
+            if pending:
+                self._record(RX, pending)
+                self._decoder.reset()
+            self._record(TX, bytes(data))
+        return self.serial.write(data)
+
+    def read(self, size=1):
+        data = self.serial.read(size)
+        if data:
+            with self._lock:
+                self._decoder.feed(data)
+                frame = self._decoder.decode()
+                while frame is not None:
+                    self._record(RX, frame)
+                    frame = self._decoder.decode()
+        return data
+
+    def flush(self):
+        self.serial.flush()
+
+    def close(self):
+        self.serial.close()
+        with self._lock:
+            pending = self._decoder.pending
+            if pending:
+                self._record(RX, pending)
+                self._decoder.reset()
+            self._log.close()
+
+
+def _recordDtype(numpy):
+    return numpy.dtype({'names': ['timestamp', 'direction', 'length', 'frame'],
+                        'formats': ['<f8', 'u1', '<u2', ('u1', FRAME_SIZE)],
+                        'offsets': [0, 8, 10, 16], 'itemsize': RECORD.size})
+
+
+def decodedDtype(numpy):
+    '''
+    Returns the NumPy dtype of the arrays returned by `CaptureLog.decode()`.
+    '''
+    return numpy.dtype([('timestamp', '<f8'), ('direction', 'u1'), ('address', 'u1'), ('status', 'u1'),
+                        ('valueType', 'u1'), ('param', '<u4'), ('instance', 'u1'), ('value', '<f8')])
+
+
+class CaptureLog():
+    '''
+    Reads a log written by `CaptureSerial`.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            magic, version, recordSize = FILE_HEADER.unpack(fh.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION or recordSize != RECORD.size:
+            raise ValueError('{0} is not a version {1} capture log'.format(path, VERSION))
+
+    def __len__(self):
+        return (os.path.getsize(self.path) - FILE_HEADER.size) // RECORD.size
+
+    def records(self):
+        '''
+        Yields each record as a `CaptureRecord` of the timestamp, direction
+        and frame (truncated to `FRAME_SIZE` bytes).
+        '''
+        with open(self.path, 'rb') as fh:
+            fh.seek(FILE_HEADER.size)
+            while True:
+                data = fh.read(RECORD.size)
+                if len(data) < RECORD.size:
+                    return
+                timestamp, direction, length, frame = RECORD.unpack(data)
+                yield CaptureRecord(timestamp, direction, frame[:length])
+
+    def decode(self):
+        '''
+        Decodes the whole log with NumPy and returns a structured array (see
+        `decodedDtype()`) with one row per record.
+
+        The address, parameter ID, instance and value are taken from the
+        responses as `parseResponse()` does, and from the requests as they are
+        built by `Watlow`. The status is `OK`, `NO_RESPONSE` (nothing but
+        zeros received), `INVALID` (wrong check bytes, incomplete or
+        truncated) or `UNPARSEABLE` (a valid frame of another layout). The
+        value is NaN where there is none (read requests and failed frames),
+        with `valueType` telling floats from ints.
+        '''
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('CaptureLog.decode() requires numpy (pip install pywatlow[capture])')
+        out = numpy.empty(len(self), dtype=decodedDtype(numpy))
+        if not len(out):
+            return out
+        records = numpy.memmap(self.path, dtype=_recordDtype(numpy), mode='r', offset=FILE_HEADER.size,
+                               shape=(len(out),))
+        for start in range(0, len(records), _CHUNK):
+            _decodeChunk(numpy, records[start:start + _CHUNK], out[start:start + _CHUNK])
+        del records
+        return out
+
+
+def _headerValid(numpy, frames):
+    table = numpy.array(HEADER_TABLE, dtype=numpy.uint8)
+    check = table[~frames[:, 2]]
+    for index in (3, 4, 5, 6):
+        check = table[frames[:, index] ^ check]
+    return ~check == frames[:, 7]
+
+
+def _dataValid(numpy, frames, lengths, rows):
+    # CRC-16 of bytes[8] through bytes[length - 3] of every frame at once, one
+    # byte position at a time
+    table = numpy.array(DATA_TABLE, dtype=numpy.uint16)
+    crc = numpy.full(len(frames), 0xFFFF, dtype=numpy.uint16)
+    end = lengths.astype(numpy.intp) - 2
+    for index in range(8, FRAME_SIZE - 2):
+        active = index < end
+        if not active.any():
+            break
+        updated = table[(crc ^ frames[:, index]) & 0xFF] ^ (crc >> 8)
+        crc = numpy.where(active, updated, crc)
+    end = numpy.clip(end, 0, FRAME_SIZE - 2)
+    received = frames[rows, end].astype(numpy.uint16) | (frames[rows, end + 1].astype(numpy.uint16) << 8)
+    return (crc ^ 0xFFFF) == received
+
+
+def _gather(numpy, frames, rows, offsets, size):
+    # Returns `size` bytes starting at `offsets` in each frame as a 2D array
+    offsets = numpy.clip(offsets, 0, FRAME_SIZE - size)
+    return frames[rows[:, None], offsets[:, None] + numpy.arange(size)]
+
+
+def _decodeChunk(numpy, records, out):
+    frames = numpy.asarray(records['frame'])
+    lengths = numpy.asarray(records['length']).astype(numpy.intp)
+    directions = numpy.asarray(records['direction'])
+    rows = numpy.arange(len(frames))
+    rx = directions == RX
+
+    zones = numpy.where(rx, frames[:, 4], frames[:, 3])
+    out['timestamp'] = records['timestamp']
+    out['direction'] = directions
+    out['address'] = numpy.where(zones > 15, zones - 15, 0)
+
+    dataLengths = (frames[:, 5].astype(numpy.intp) << 8) | frames[:, 6]
+    valid = ((lengths > 10) & (lengths <= FRAME_SIZE) & (lengths == dataLengths + 10) &
+             (frames[:, 0] == 0x55) & (frames[:, 1] == 0xFF) & _headerValid(numpy, frames))
+    valid &= _dataValid(numpy, frames, lengths, rows)
+    silent = (numpy.count_nonzero(frames, axis=1) == 0) & (lengths <= FRAME_SIZE)
+
+    # Layouts, as in parseResponse() for responses and Watlow._buildReadRequest()
+    # and _buildWriteRequest() for requests
+    before = _gather(numpy, frames, rows, lengths - 7, 3)
+    readInt = rx & (dataLengths == READ_INT_LENGTH) & (before[:, 1] == 15) & (before[:, 2] == 1)
+    writeFloat = rx & (dataLengths == WRITE_FLOAT_LENGTH) & (before[:, 0] == 8) & ~readInt
+    writeInt = rx & (dataLengths == WRITE_INT_LENGTH)
+    readFloat = rx & (dataLengths == READ_FLOAT_LENGTH)
+    readRequest = ~rx & (dataLengths == _READ_REQUEST_LENGTH)
+    writeFloatRequest = ~rx & (dataLengths == _WRITE_FLOAT_REQUEST_LENGTH)
+    writeIntRequest = ~rx & (dataLengths == _WRITE_INT_REQUEST_LENGTH)
+
+    isFloat = valid & (readFloat | writeFloat | writeFloatRequest)
+    isInt = valid & (readInt | writeInt | writeIntRequest)
+    known = isFloat | isInt | (valid & readRequest)
+
+    offsets = numpy.where(readInt | readFloat | readRequest, READ_PARAM_OFFSET, WRITE_PARAM_OFFSET)
+    params = _gather(numpy, frames, rows, offsets, 3)
+    out['param'] = numpy.where(known, params[:, 0].astype(numpy.uint32) * 1000 + params[:, 1], 0)
+    out['instance'] = numpy.where(known, params[:, 2], 0)
+
+    floats = numpy.ascontiguousarray(_gather(numpy, frames, rows, lengths - 6, 4)).view('>f4')[:, 0]
+    ints = _gather(numpy, frames, rows, lengths - 4, 2).astype(numpy.uint16)
+    ints = (ints[:, 0] << 8) | ints[:, 1]
+    out['value'] = numpy.where(isFloat, floats, numpy.where(isInt, ints, numpy.nan))
+    out['valueType'] = numpy.where(isFloat, FLOAT, numpy.where(isInt, INT, NONE))
+
+    failed = numpy.where(silent, NO_RESPONSE, INVALID)
+    out['status'] = numpy.where(known, OK, numpy.where(valid, UNPARSEABLE, failed))
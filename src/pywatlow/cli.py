@@ -15,9 +15,68 @@ Why does this file exist, and why not put this in __main__?
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
 import argparse
+import csv
+import json
+import re
+import sys
+import time
 
+from pywatlow import params as catalog
+from pywatlow.bus import WatlowBus
+from pywatlow.gateway import Gateway
+from pywatlow.reading import STATUS_NAMES
+from pywatlow.scheduler import PollSpec
+from pywatlow.scheduler import Scheduler
 from pywatlow.watlow import Watlow
 
+
+def positiveFloat(text):
+    '''
+    argparse type for numbers above 0.
+    '''
+    value = float(text)
+    if not value > 0:
+        raise argparse.ArgumentTypeError('must be above 0, not {0}'.format(text))
+    return value
+
+
+def parseAddresses(text):
+    '''
+    Returns the list of addresses in a string like '1-4,7'.
+    '''
+    addresses = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        addresses.extend(range(int(first), int(last or first) + 1))
+    return addresses
+
+
+def addressList(text):
+    '''
+    argparse type for controller addresses like '1-4,7', all 1 through 16.
+    '''
+    try:
+        addresses = parseAddresses(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected addresses like "1-4,7", not {0!r}'.format(text))
+    if not addresses or not all(1 <= address <= 16 for address in addresses):
+        raise argparse.ArgumentTypeError('Watlow addresses are 1 through 16, not {0!r}'.format(text))
+    return addresses
+
+
+def paramList(text):
+    '''
+    argparse type for comma separated parameter IDs like '4001,7001'.
+    '''
+    try:
+        params = [int(param) for param in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected parameter IDs like "4001,7001", not {0!r}'.format(text))
+    if not all(param > 0 for param in params):
+        raise argparse.ArgumentTypeError('parameter IDs must be above 0, not {0!r}'.format(text))
+    return params
+
+
 parser = argparse.ArgumentParser(description='A Python driver for Watlow temperature controllers')
 group = parser.add_mutually_exclusive_group()
 group.add_argument('-r', '--read', metavar=('PORT', 'ADDR', 'PARAM'), nargs=3,
@@ -25,6 +84,206 @@ group.add_argument('-r', '--read', metavar=('PORT', 'ADDR', 'PARAM'), nargs=3,
                    (e.g. "4001" for temperature, "7001" for setpoint). Other values can be found in the Watlow user manual')
 group.add_argument('-w', '--write', metavar=('PORT', 'ADDR', 'TEMP'), nargs=3,
                    help='Change the setpoint temperature. Specify the port, RS485 address, and desired setpoint temperature in Celcius')
+group.add_argument('-g', '--gateway', metavar=('PORT', 'LISTEN'), nargs=2,
+                   help='Run a gateway sharing the port with other processes. Specify the port and the Unix socket path \
+                   or host:port to listen on')
+
+commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+pollParser = commands.add_parser('poll', help='Poll parameters, writing one JSON line per reading',
+                                 description='Poll parameters over one open port, writing one JSON line per reading')
+pollParser.add_argument('--port', required=True, help='Serial port (e.g. COM5, /dev/ttyUSB0)')
+pollParser.add_argument('--addresses', type=addressList, default='1', help='Controller addresses, e.g. "1-16" or "1,3,5-7" (default: 1)')
+pollParser.add_argument('--params', type=paramList, default='4001', help='Comma separated parameter IDs (default: 4001)')
+pollParser.add_argument('--rate', type=positiveFloat, default=1.0, help='Readings per second of each parameter (default: 1)')
+pollParser.add_argument('--duration', type=float, help='Seconds to poll for (default: until interrupted)')
+pollParser.add_argument('--timeout', type=float, default=0.5, help='Read timeout in seconds (default: 0.5)')
+batchParser = commands.add_parser('batch', help='Run the reads and writes listed in a file',
+                                  description='Run the reads and writes listed in FILE (CSV or JSON lines) over one open port, \
+                                  writing one JSON line per result. CSV lines are op,address,param[,value[,data_type[,instance]]], \
+                                  e.g. "write,1,7001,60.0"; JSON lines have the same keys')
+batchParser.add_argument('file', metavar='FILE', help='File of operations, or - for standard input')
+batchParser.add_argument('--port', required=True, help='Serial port (e.g. COM5, /dev/ttyUSB0)')
+batchParser.add_argument('--timeout', type=float, default=0.5, help='Read timeout in seconds (default: 0.5)')
+
+_FIELDS = ('op', 'address', 'param', 'value', 'data_type', 'instance')
+_TYPES = {'float': float, 'int': int, '': None, None: None}
+
+
+def openBus(port, timeout):
+    return WatlowBus(port=port, timeout=timeout)
+
+
+def readingJson(reading):
+    '''
+    Returns a reading as one line of JSON.
+    '''
+    return json.dumps({
+        'timestamp': reading.timestamp,
+        'address': reading.address,
+        'param': reading.param,
+        'instance': reading.instance,
+        'value': reading.value,
+        'status': STATUS_NAMES[reading.status],
+        'error': None if reading.ok else str(reading.error),
+    })
+
+
+def poll(args, out=None):
+    '''
+    Runs the poll command: reads each parameter `args.rate` times per second
+    from each address and writes the readings to `out` as JSON lines.
+    '''
+    out = out or sys.stdout
+    bus = openBus(args.port, args.timeout)
+    specs = [PollSpec(address, param, 1.0 / args.rate) for address in args.addresses for param in args.params]
+
+    def write(spec, reading):
+        out.write(readingJson(reading) + '\n')
+
+    def sleep(seconds):
+        # Write out the readings of the last burst before waiting for the next
+        out.flush()
+        time.sleep(seconds)
+
+    # Every parameter is polled, more slowly than asked if the bus is too slow
+    scheduler = Scheduler(bus, specs, callback=write, capacity=float('inf'), sleep=sleep)
+    if scheduler.load() > 1:
+        sys.stderr.write('The bus can only carry about {0:.0%} of the requested rate\n'.format(1 / scheduler.load()))
+    try:
+        scheduler.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.flush()
+        bus.close()
+    return 0
+
+
+def _number(fields, name, kind):
+    # Returns a field of a batch line as an int or float, raising ValueError
+    # for missing fields and other types
+    value = fields.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('{0} must be a number, not {1!r}'.format(name, value))
+    return int(float(value)) if kind == int and not isinstance(value, int) else kind(value)
+
+
+def parseOperation(line):
+    '''
+    Returns (op, address, param, value, data_type, instance) from a line of a
+    batch file, in CSV or JSON, or `None` for blank lines and # comments.
+    Raises `ValueError` for invalid lines.
+    '''
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        fields = json.loads(line)
+        if not isinstance(fields, dict):
+            raise ValueError('Expected a JSON object')
+    else:
+        fields = dict(zip(_FIELDS, next(csv.reader([line]))))
+    op = fields.get('op')
+    if not isinstance(op, str) or op.strip().lower() not in ('read', 'write'):
+        raise ValueError('Unknown operation {0!r}, use read or write'.format(op))
+    op = op.strip().lower()
+    address = _number(fields, 'address', int)
+    if not 1 <= address <= 16:
+        raise ValueError('Watlow addresses are 1 through 16, not {0}'.format(address))
+    param = _number(fields, 'param', int)
+    data_type = fields.get('data_type')
+    if not (data_type is None or isinstance(data_type, str)) or data_type not in _TYPES:
+        raise ValueError('Unknown data_type {0!r}, use int or float'.format(data_type))
+    data_type = _TYPES[data_type]
+    instance = fields.get('instance')
+    if instance in (None, ''):
+        instance = '01'
+    elif isinstance(instance, int) and not isinstance(instance, bool) and 0 <= instance <= 0xff:
+        instance = format(instance, '02x')
+    elif not isinstance(instance, str) or not re.fullmatch('[0-9a-fA-F]{2}', instance):
+        raise ValueError('instance must be two hex digits like "01", not {0!r}'.format(instance))
+    value = None
+    if op == 'write':
+        if fields.get('value') in (None, ''):
+            raise ValueError('Write of {0} has no value'.format(param))
+        # Parameters missing from the catalog need data_type
+        data_type = catalog.dataType(param, data_type)
+        value = _number(fields, 'value', data_type)
+    return op, address, param, value, data_type, instance
+
+
+def _runBatch(bus, batch, out):
+    # Runs consecutive operations of one kind on one address as one batch and
+    # writes their results
+    op, address = batch[0][1][0], batch[0][1][1]
+    start = time.perf_counter()
+    if op == 'read':
+        outputs = bus[address].readParams([(param, data_type, instance)
+                                           for _, (_, _, param, _, data_type, instance) in batch])
+    else:
+        outputs = bus[address].writeParams([(param, value, data_type, instance)
+                                            for _, (_, _, param, value, data_type, instance) in batch])
+    latency = (time.perf_counter() - start) / len(batch)
+    for (lineNumber, operation), output in zip(batch, outputs):
+        out.write(resultJson(lineNumber, op, output, latency) + '\n')
+    return sum(not output.ok for output in outputs)
+
+
+def resultJson(lineNumber, op, reading, latency):
+    result = json.loads(readingJson(reading))
+    result.update({'line': lineNumber, 'op': op, 'latency_ms': round(latency * 1000, 3)})
+    return json.dumps(result)
+
+
+def batch(args, source=None, out=None, err=None):
+    '''
+    Runs the batch command: reads operations from `source` (the file named in
+    `args.file` by default) and runs them in order over one bus. Consecutive
+    operations of the same kind on the same address are sent as one batch
+    (see `Watlow.readParams()`), and 'latency_ms' in each result is the
+    average time per operation of its batch. A summary is written to `err`.
+    '''
+    out = out or sys.stdout
+    err = err or sys.stderr
+    opened = source is None and args.file != '-'
+    if source is None:
+        source = open(args.file) if opened else sys.stdin
+    started = time.perf_counter()
+    bus = openBus(args.port, args.timeout)
+    pending = []
+    operations = errors = batches = 0
+    try:
+        for lineNumber, line in enumerate(source, 1):
+            try:
+                operation = parseOperation(line)
+            except (ValueError, KeyError) as e:
+                # Keep the results in order
+                if pending:
+                    errors += _runBatch(bus, pending, out)
+                    batches += 1
+                    pending = []
+                out.write(json.dumps({'line': lineNumber, 'status': 'invalid', 'error': str(e)}) + '\n')
+                errors += 1
+                continue
+            if operation is None:
+                continue
+            operations += 1
+            if pending and (operation[:2] != pending[0][1][:2] or len(pending) == 32):
+                errors += _runBatch(bus, pending, out)
+                batches += 1
+                pending = []
+            pending.append((lineNumber, operation))
+        if pending:
+            errors += _runBatch(bus, pending, out)
+            batches += 1
+    finally:
+        out.flush()
+        bus.close()
+        if opened:
+            source.close()
+    err.write(json.dumps({'operations': operations, 'batches': batches, 'errors': errors,
+                          'runtime_s': round(time.perf_counter() - started, 3)}) + '\n')
+    return 1 if errors else 0
 
 
 def main(args=None):
@@ -34,15 +293,22 @@ def main(args=None):
     """
     args = parser.parse_args(args=args)
 
+    if args.command == 'poll':
+        return poll(args)
+    if args.command == 'batch':
+        return batch(args)
     if args.read:
         watlow = Watlow(port=args.read[0], address=int(args.read[1]))
-        if args.read[2] == '4001' or args.read[2] == '7001':
-            print(watlow.readParam(int(args.read[2]), float))
-        else:
-            print('Use parameter 4001 for current temperature or 7001 for current setpoint.')
+        print(watlow.readParam(int(args.read[2])).asDict())
     elif args.write:
         watlow = Watlow(port=args.write[0], address=int(args.write[1]))
-        print(watlow.write(int(args.write[2])))
+        print(watlow.write(int(args.write[2])).asDict())
+    elif args.gateway:
+        gateway = Gateway(WatlowBus(port=args.gateway[0]), args.gateway[1])
+        try:
+            gateway.serve_forever()
+        except KeyboardInterrupt:
+            gateway.shutdown()
     else:
         parser.print_help()
     return 0
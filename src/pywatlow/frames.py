@@ -0,0 +1,265 @@
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from pywatlow.checksum import dataCheck
+from pywatlow.checksum import headerCheck
+
+PREAMBLE = b'\x55\xff'
+HEADER_LENGTH = 8
+# Largest data length allowed by BACnet MS/TP, anything above is a corrupt header
+MAX_DATA_LENGTH = 501
+
+
+class _WriteTemplate():
+    '''
+    Everything in a write request that does not depend on the value: the
+    header, check byte and data bytes up to the value, plus the CRC state of
+    those data bytes.
+    '''
+    __slots__ = ('prefix', 'crc', 'pack')
+
+    def __init__(self, prefix, crc, pack):
+        self.prefix = prefix
+        self.crc = crc
+        self.pack = pack
+
+    def build(self, value):
+        valueBytes = self.pack(value)
+        return self.prefix + valueBytes + struct.pack('<H', dataCheck(valueBytes, self.crc))
+
+
+def _packFloat(value):
+    return struct.pack('>f', float(value))
+
+
+def _packInt(value):
+    return value.to_bytes(2, 'big')
+
+
+class FrameCompiler():
+    '''
+    Caches request frames so that repeated reads and writes don't rebuild
+    them from hex strings.
+
+    * **maxsize** (int): maximum number of read frames and write templates kept. The least recently used entry is dropped first.
+
+    Read frames never change for a given (address, param, instance), so they
+    are cached whole. Write frames only differ in the value bytes, so a
+    template holding the fixed prefix and its CRC state is cached instead and
+    each write only packs the value and finishes the CRC.
+
+    Frames are produced by `Watlow._buildReadRequest()` and
+    `Watlow._buildWriteRequest()` on a miss, so compiled frames are always
+    byte-identical to the ones those functions return.
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def readRequest(self, watlow, param, instance='01'):
+        '''
+        Returns the read request for `param` at `watlow`'s address as a bytes
+        object.
+        '''
+        key = ('r', watlow.address, int(param), instance)
+        request = self._get(key)
+        if request is None:
+            request = bytes(watlow._buildReadRequest(param, instance))
+            self._put(key, request)
+        return request
+
+    def writeRequest(self, watlow, param, value, data_type, instance='01'):
+        '''
+        Returns the write request setting `param` at `watlow`'s address to
+        `value` as a bytes object.
+        '''
+        key = ('w', watlow.address, int(param), instance, data_type)
+        template = self._get(key)
+        if template is None:
+            if data_type == float:
+                pack, valueLength = _packFloat, 4
+            elif data_type == int:
+                pack, valueLength = _packInt, 2
+            else:
+                raise ValueError('data_type must be int or float, not {0}'.format(data_type))
+            request = bytes(watlow._buildWriteRequest(param, data_type(0), data_type, instance))
+            # Strip the value and the data check bytes off the end:
+            prefix = request[:-(valueLength + 2)]
+            template = _WriteTemplate(prefix, dataCheck(prefix[8:]), pack)
+            self._put(key, template)
+        return template.build(value)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        '''
+        Returns a dict with the number of cache hits, misses and evictions and
+        the current and maximum cache size.
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._cache),
+                'maxsize': self.maxsize
+            }
+
+
+def frameLength(header):
+    '''
+    Returns the total length of the frame starting with `header` (at least 7
+    bytes), using the data length in bytes[5] and bytes[6]. Frames without data
+    have no data check bytes.
+    '''
+    dataLength = (header[5] << 8) | header[6]
+    return HEADER_LENGTH + dataLength + 2 if dataLength else HEADER_LENGTH
+
+
+def answers(request, response):
+    '''
+    Returns False if `response`, a complete frame, is the response to a read
+    or write of another parameter or instance than `request`, e.g. a late
+    response to an earlier request. Error responses don't name a parameter
+    and are taken as answers.
+    '''
+    if len(response) < HEADER_LENGTH + 6 or len(request) < HEADER_LENGTH + 6:
+        return True
+    op = request[9]
+    if response[9] != op:
+        return False
+    # Parameter and instance follow 01 03 01 in reads and 01 04 in writes
+    start = 11 if op == 0x03 else 10
+    return response[start:start + 3] == request[start:start + 3]
+
+
+class FrameDecoder():
+    '''
+    Incremental decoder that splits a byte stream into standard bus frames.
+
+    Bytes are added with `feed()` and complete frames taken out with
+    `decode()`. The decoder syncs on the 55 FF preamble and checks the header
+    check byte before trusting the data length in the header. Anything that
+    isn't part of a frame is dropped and counted in `discarded`.
+
+    `needed()` returns how many more bytes are required to finish the frame
+    currently being decoded, so a reader never has to read past the end of it.
+    '''
+    def __init__(self):
+        self._buffer = bytearray()
+        self.discarded = 0
+
+    @property
+    def pending(self):
+        return bytes(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
+
+    def feed(self, data):
+        self._buffer += data
+
+    def _sync(self):
+        # Drops bytes up to the next preamble. Returns False if more bytes are
+        # needed before a header can be checked.
+        buffer = self._buffer
+        while True:
+            start = buffer.find(PREAMBLE)
+            if start < 0:
+                # Keep a trailing 0x55, it may be the start of a preamble
+                keep = 1 if buffer[-1:] == PREAMBLE[:1] else 0
+                self.discarded += len(buffer) - keep
+                del buffer[:len(buffer) - keep]
+                return False
+            if start:
+                self.discarded += start
+                del buffer[:start]
+            if len(buffer) < HEADER_LENGTH:
+                return False
+            if (buffer[7] == headerCheck(buffer) and
+                    (buffer[5] << 8) | buffer[6] <= MAX_DATA_LENGTH):
+                return True
+            # Not a real header, look for the next preamble
+            self.discarded += 1
+            del buffer[:1]
+
+    def decode(self):
+        '''
+        Returns the next complete frame as a bytes object, or `None` if more
+        bytes are needed.
+        '''
+        if not self._sync():
+            return None
+        length = frameLength(self._buffer)
+        if len(self._buffer) < length:
+            return None
+        frame = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return frame
+
+    def needed(self):
+        '''
+        Returns the number of bytes still missing from the frame being decoded
+        (always at least one).
+        '''
+        buffer = self._buffer
+        if len(buffer) < HEADER_LENGTH or buffer[:2] != PREAMBLE:
+            return max(HEADER_LENGTH - len(buffer), 1)
+        return max(frameLength(buffer) - len(buffer), 1)
+
+
+def readFrame(serial, timeout=None):
+    '''
+    Reads one complete frame from `serial` and returns it as a bytes object.
+
+    * **serial**: serial object (see pySerial's serial.Serial class)
+    * **timeout** (float): seconds to wait for the frame. Defaults to the serial object's timeout
+
+    Only the bytes belonging to the frame are read, so the call returns as
+    soon as the last data check byte arrives. Noise before the frame is
+    skipped. If the frame isn't complete by the timeout, whatever was received
+    is returned instead (`b''` if nothing was).
+    '''
+    if timeout is None:
+        timeout = serial.timeout
+    deadline = None if timeout is None else time.monotonic() + timeout
+    decoder = FrameDecoder()
+    received = bytearray()
+    while True:
+        chunk = serial.read(decoder.needed())
+        if not chunk:
+            break
+        received += chunk
+        decoder.feed(chunk)
+        frame = decoder.decode()
+        if frame is not None:
+            return frame
+        if deadline is not None and time.monotonic() > deadline:
+            break
+    return bytes(decoder.pending or received)
@@ -0,0 +1,333 @@
+'''
+Gateway that shares one serial port between processes.
+
+`Gateway` owns a `WatlowBus` and serves `readParam()` and `writeParam()`
+requests from any number of clients over a TCP or Unix socket.
+`GatewayClient` connects to it and hands out `GatewayWatlow` objects with the
+same API as `Watlow`::
+
+    # In the process owning the port (or: pywatlow --gateway COM5 /tmp/watlow.sock)
+    gateway = Gateway(WatlowBus(port='COM5'), '/tmp/watlow.sock')
+    gateway.serve_forever()
+
+    # In any other process
+    client = GatewayClient('/tmp/watlow.sock')
+    print(client[1].read())
+
+Identical reads from different clients arriving while one of them is on the
+bus are answered by that one transaction.
+
+Messages are fixed size structs. A request is `REQUEST`: operation, request
+ID, address, parameter ID, instance, data type and value. A response is
+`RESPONSE`: request ID, status (see `pywatlow.reading`), address, parameter
+ID, instance, value type, value and timestamp, followed by the UTF-8 error
+message of `ERROR` responses (`messageLength` bytes).
+'''
+import itertools
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import threading
+
+from pywatlow import params as catalog
+from pywatlow.reading import ERROR
+from pywatlow.reading import OK
+from pywatlow.reading import Reading
+from pywatlow.watlow import Watlow
+from pywatlow.watlow import _paramSpec
+
+READ = 1
+WRITE = 2
+
+# Data and value types
+NONE = 0
+FLOAT = 1
+INT = 2
+_TYPES = {None: NONE, float: FLOAT, int: INT}
+
+# op, request ID, address, param, instance, data type, value
+REQUEST = struct.Struct('>BIBIBBd')
+# request ID, status, address, param, instance, value type, value, timestamp, messageLength
+RESPONSE = struct.Struct('>IBBIBBddH')
+
+
+def parseAddress(text):
+    '''
+    Returns the socket address for 'host:port' (TCP) or a path (Unix socket).
+    '''
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit() and '/' not in text:
+        return (host or 'localhost', int(port))
+    return text
+
+
+def _recvExactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Gateway connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def _encodeResponse(requestId, output):
+    value = output.value
+    valueType = NONE if value is None else (FLOAT if isinstance(value, float) else INT)
+    message = b''
+    if output.status == ERROR:
+        message = str(output.error).encode('utf-8')[:0xffff]
+    return RESPONSE.pack(requestId, output.status, output.address, output.param or 0, output.instance or 0,
+                         valueType, value or 0, output.timestamp, len(message)) + message
+
+
+class _GatewayHandler(socketserver.BaseRequestHandler):
+    '''
+    Serves the requests of one client connection, one at a time.
+    '''
+    def handle(self):
+        gateway = self.server.gateway
+        sock = self.request
+        while True:
+            try:
+                op, requestId, address, param, instance, dataType, value = REQUEST.unpack(
+                    _recvExactly(sock, REQUEST.size))
+            except (ConnectionError, OSError):
+                return
+            output = gateway.handle(op, address, param, instance, dataType, value)
+            try:
+                sock.sendall(_encodeResponse(requestId, output))
+            except OSError:
+                return
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class Gateway():
+    '''
+    Serves requests for the controllers on `bus` to clients on a socket.
+
+    * **bus**: `WatlowBus` owning the serial port
+    * **address**: 'host:port' or (host, port) to listen on TCP, or the path of a Unix socket
+
+    Call `serve_forever()`, or `start()` to serve from a background thread,
+    and `shutdown()` to stop. `stats()` counts requests, bus transactions and
+    reads answered by another client's transaction.
+    '''
+    def __init__(self, bus, address):
+        self.bus = bus
+        if isinstance(address, str):
+            address = parseAddress(address)
+        self.address = address
+        self.requests = 0
+        self.transactions = 0
+        self.coalesced = 0
+        # In-flight reads by (address, param, instance), as [event, reading]
+        self._inFlight = {}
+        self._lock = threading.Lock()
+        if isinstance(address, tuple):
+            self.server = _TCPServer(address, _GatewayHandler)
+            self.address = self.server.server_address
+        else:
+            if os.path.exists(address):
+                if not stat.S_ISSOCK(os.stat(address).st_mode):
+                    raise ValueError('{0} exists and is not a socket'.format(address))
+                # Left behind by a gateway that wasn't shut down
+                os.unlink(address)
+            self.server = _UnixServer(address, _GatewayHandler)
+        self.server.gateway = self
+        self.thread = None
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='pywatlow-gateway', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def handle(self, op, address, param, instance, dataType, value):
+        '''
+        Runs one request and returns the `Reading`.
+        '''
+        with self._lock:
+            self.requests += 1
+        try:
+            watlow = self.bus[address]
+            instance = format(instance, '02x')
+            if op == WRITE:
+                with self._lock:
+                    self.transactions += 1
+                data_type = float if dataType == FLOAT else int if dataType == INT else None
+                if data_type is None:
+                    data_type = catalog.dataType(param)
+                return watlow.writeParam(param, data_type(value), data_type, instance)
+            if op == READ:
+                return self._read(watlow, param, instance)
+            raise ValueError('Unknown gateway operation {0}'.format(op))
+        except Exception as e:
+            return Reading(address, status=ERROR, exception=e)
+
+    def _read(self, watlow, param, instance):
+        key = (watlow.address, param, instance)
+        with self._lock:
+            inFlight = self._inFlight.get(key)
+            if inFlight is None:
+                inFlight = self._inFlight[key] = [threading.Event(), None]
+                leader = True
+                self.transactions += 1
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            inFlight[0].wait()
+            return inFlight[1]
+        try:
+            inFlight[1] = watlow.readParam(param, None, instance)
+        except Exception as e:
+            # The followers get the error too
+            inFlight[1] = Reading(watlow.address, status=ERROR, exception=e)
+        finally:
+            with self._lock:
+                del self._inFlight[key]
+            inFlight[0].set()
+        return inFlight[1]
+
+    def stats(self):
+        return {'requests': self.requests, 'transactions': self.transactions, 'coalesced': self.coalesced}
+
+
+class GatewayClient():
+    '''
+    Client of a `Gateway`, usable from several threads.
+
+    * **address**: 'host:port' or (host, port) of a TCP gateway, or the path of a Unix socket
+    * **poolSize** (int): most connections kept open to the gateway
+    * **timeout** (float): socket timeout in seconds
+
+    Each request uses a connection from the pool, so up to `poolSize` threads
+    can have requests in progress at once. Controllers are accessed through
+    `GatewayWatlow` objects (`client[address]` or `client.watlow(address)`).
+    '''
+    def __init__(self, address, poolSize=4, timeout=5.0):
+        if isinstance(address, str):
+            address = parseAddress(address)
+        self.address = address
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(poolSize)
+        self._ids = itertools.count(1)
+        self._handles = {}
+
+    def _connect(self):
+        family = socket.AF_INET if isinstance(self.address, tuple) else socket.AF_UNIX
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def request(self, op, address, param, instance='01', data_type=None, value=0):
+        '''
+        Sends one request and returns the `Reading` from the gateway.
+        Connection errors are returned as `ERROR` readings.
+        '''
+        requestId = next(self._ids) & 0xffffffff
+        self._slots.acquire()
+        sock = None
+        try:
+            try:
+                sock = self._pool.get_nowait()
+            except queue.Empty:
+                sock = self._connect()
+            sock.sendall(REQUEST.pack(op, requestId, address, int(param), int(instance, 16), _TYPES[data_type],
+                                      value))
+            (responseId, status, address, param, instance, valueType, value, timestamp,
+             messageLength) = RESPONSE.unpack(_recvExactly(sock, RESPONSE.size))
+            message = _recvExactly(sock, messageLength).decode('utf-8') if messageLength else ''
+            if responseId != requestId:
+                raise ConnectionError('Gateway response {0} to request {1}'.format(responseId, requestId))
+        except Exception as e:
+            if sock is not None:
+                sock.close()
+            return Reading(address, status=ERROR, exception=e)
+        else:
+            self._pool.put(sock)
+        finally:
+            self._slots.release()
+        if status != OK:
+            return Reading(address, status=status, timestamp=timestamp,
+                           exception=Exception(message) if status == ERROR else None)
+        return Reading(address, param, instance, int(value) if valueType == INT else value, status, timestamp)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __getitem__(self, address):
+        return self.watlow(address)
+
+    def watlow(self, address):
+        '''
+        Returns the `GatewayWatlow` for the controller at `address`.
+        '''
+        handle = self._handles.get(address)
+        if handle is None:
+            handle = self._handles.setdefault(address, GatewayWatlow(self, address))
+        return handle
+
+
+class GatewayWatlow(Watlow):
+    '''
+    `Watlow` object for one controller behind a `Gateway`, with the same read
+    and write methods. Use `GatewayClient.watlow()` (or `client[address]`)
+    instead of creating these directly.
+    '''
+    def __init__(self, client, address):
+        self.client = client
+        self.address = address
+        self.port = None
+        self.serial = None
+
+    def open(self):
+        '''
+        Does nothing, the gateway owns the serial port.
+        '''
+
+    def close(self):
+        '''
+        Does nothing, the gateway owns the serial port.
+        '''
+
+    def readParam(self, param, data_type=None, instance='01'):
+        return self.client.request(READ, self.address, param, instance)
+
+    def writeParam(self, param, value, data_type=None, instance='01'):
+        data_type = catalog.dataType(param, data_type)
+        return self.client.request(WRITE, self.address, param, instance, data_type, value)
+
+    def readParams(self, params):
+        return [self.readParam(param, data_type, instance) for param, data_type, instance in map(_paramSpec, params)]
+
+    def writeParams(self, values):
+        return [self.writeParam(*spec) for spec in values]
@@ -0,0 +1,240 @@
+'''
+Bounded in-memory history of readings.
+
+`History` keeps the recent readings of each (address, param, instance) in
+fixed size ring buffers, along with rollups (minimum, maximum and mean per
+second, per minute, ...) that are updated as each reading arrives. Its memory
+use is fixed by the capacities, however long it runs::
+
+    history = History()
+    poller = Poller({'COM5': {1: [4001, 7001]}}, interval=0.2, history=history, queue=False)
+    ...
+    times, values = history.raw(1, 4001, start=time.time() - 60)
+    minutes = history.rollup(1, 4001, 60.0)
+    print(max(minutes.max))
+
+Queries return `memoryview` objects of the buffers themselves instead of
+copies. They can be passed to `numpy.asarray()` or `statistics.mean()` as
+is, but see the values that later readings write, so copy them (e.g. with
+`list()`) to keep them.
+'''
+import bisect
+import math
+import threading
+from array import array
+from collections import namedtuple
+
+from pywatlow.cache import cacheKey
+
+# Rollup periods in seconds and the number of periods kept: an hour of
+# seconds and a day of minutes
+ROLLUPS = ((1.0, 3600), (60.0, 1440))
+
+Window = namedtuple('Window', ['time', 'min', 'max', 'mean', 'count'])
+Window.__doc__ = '''
+Rollup periods returned by `History.rollup()`: the start time of each
+period, and the minimum, maximum and mean value and number of readings in it.
+'''
+
+
+class RingBuffer():
+    '''
+    Fixed size buffer of the last `capacity` numbers appended.
+
+    * **capacity** (int): most numbers kept
+    * **typecode** (str): `array` type code of the numbers
+
+    Each number is stored twice, `capacity` apart, so the last `n` numbers
+    always are contiguous and `view()` can return them without copying.
+    '''
+    def __init__(self, capacity, typecode='d'):
+        if capacity < 1:
+            raise ValueError('Ring buffer capacity must be positive, not {0}'.format(capacity))
+        self.capacity = capacity
+        self.appended = 0
+        self._data = array(typecode, [0]) * (2 * capacity)
+
+    def __len__(self):
+        return min(self.appended, self.capacity)
+
+    def append(self, value):
+        index = self.appended % self.capacity
+        self._data[index] = self._data[index + self.capacity] = value
+        self.appended += 1
+
+    def replace(self, value):
+        '''
+        Replaces the last number appended.
+        '''
+        index = (self.appended - 1) % self.capacity
+        self._data[index] = self._data[index + self.capacity] = value
+
+    def last(self):
+        return self._data[(self.appended - 1) % self.capacity]
+
+    def view(self, start=0, stop=None):
+        '''
+        Returns a `memoryview` of the numbers from `start` to `stop` (indexes
+        from the oldest number kept).
+        '''
+        length = len(self)
+        start, stop, _ = slice(start, stop).indices(length)
+        first = (self.appended - length) % self.capacity
+        return memoryview(self._data)[first + start:first + max(start, stop)]
+
+
+class Rollup():
+    '''
+    Minimum, maximum and mean of the readings in each `period` seconds, for
+    the last `capacity` periods.
+    '''
+    def __init__(self, period, capacity):
+        self.period = period
+        self.time = RingBuffer(capacity)
+        self.min = RingBuffer(capacity)
+        self.max = RingBuffer(capacity)
+        self.mean = RingBuffer(capacity)
+        self.count = RingBuffer(capacity, 'L')
+
+    def add(self, timestamp, value):
+        start = math.floor(timestamp / self.period) * self.period
+        if len(self.time) and self.time.last() == start:
+            count = self.count.last() + 1
+            self.count.replace(count)
+            self.min.replace(min(self.min.last(), value))
+            self.max.replace(max(self.max.last(), value))
+            mean = self.mean.last()
+            self.mean.replace(mean + (value - mean) / count)
+        elif not len(self.time) or start > self.time.last():
+            self.time.append(start)
+            self.min.append(value)
+            self.max.append(value)
+            self.mean.append(value)
+            self.count.append(1)
+
+    def window(self, start=None, end=None):
+        first, last = _range(self.time, start, end)
+        buffers = (self.time, self.min, self.max, self.mean, self.count)
+        return Window(*(buffer.view(first, last) for buffer in buffers))
+
+
+def _range(times, start, end):
+    # Returns the indexes of the first and after the last time in [start, end)
+    view = times.view()
+    first = 0 if start is None else bisect.bisect_left(view, start)
+    last = len(view) if end is None else bisect.bisect_left(view, end)
+    return first, last
+
+
+class _Series():
+    '''
+    Raw readings and rollups of one parameter.
+    '''
+    def __init__(self, capacity, rollups):
+        self.times = RingBuffer(capacity)
+        self.values = RingBuffer(capacity)
+        self.rollups = {float(period): Rollup(period, size) for period, size in rollups}
+
+    def add(self, timestamp, value):
+        self.times.append(timestamp)
+        self.values.append(value)
+        if value == value:
+            for rollup in self.rollups.values():
+                rollup.add(timestamp, value)
+
+
+class History():
+    '''
+    Recent readings of any number of parameters.
+
+    * **capacity** (int): raw readings kept per parameter
+    * **rollups**: (period in seconds, periods kept) of each rollup kept per parameter
+
+    Readings are added with `add()`, which takes the same arguments as
+    `LatestValueTable.publish()`, e.g. by passing `history=` to `Poller`.
+    Failed readings are kept as NaN values in the raw readings and left out
+    of the rollups. Readings are expected in time order; a reading older than
+    the current period of a rollup is only kept in the raw readings.
+    '''
+    def __init__(self, capacity=3600, rollups=ROLLUPS):
+        self.capacity = capacity
+        self.rollups = tuple(rollups)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._series)
+
+    def keys(self):
+        '''
+        Returns the (address, param, instance) keys of the parameters with
+        readings, with the instance as an int.
+        '''
+        return list(self._series)
+
+    def add(self, address, param, instance, reading):
+        '''
+        Adds `reading` to the history of (address, param, instance).
+        '''
+        key = cacheKey(address, param, instance)
+        value = float(reading.value) if reading.ok else math.nan
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.capacity, self.rollups)
+            series.add(reading.timestamp, value)
+
+    def _get(self, address, param, instance):
+        series = self._series.get(cacheKey(address, param, instance))
+        if series is None:
+            raise KeyError((address, param, instance))
+        return series
+
+    def raw(self, address, param, instance='01', start=None, end=None):
+        '''
+        Returns the times and values of the raw readings of a parameter from
+        `start` up to `end` (seconds since the epoch), as two `memoryview`
+        objects. Raises `KeyError` if the parameter has no readings.
+        '''
+        with self._lock:
+            series = self._get(address, param, instance)
+            first, last = _range(series.times, start, end)
+            return series.times.view(first, last), series.values.view(first, last)
+
+    def rollup(self, address, param, period, instance='01', start=None, end=None):
+        '''
+        Returns the periods of the `period` seconds rollup of a parameter
+        that start from `start` up to `end`, as a `Window` of `memoryview`
+        objects. The last period is the current one, still being updated.
+        Raises `KeyError` if the parameter has no readings or there is no
+        such rollup.
+        '''
+        with self._lock:
+            rollup = self._get(address, param, instance).rollups.get(float(period))
+            if rollup is None:
+                raise KeyError('No {0} second rollup'.format(period))
+            return rollup.window(start, end)
+
+    def latest(self, address, param, instance='01'):
+        '''
+        Returns the time and value of the last reading of a parameter, or
+        `None` if it has no readings.
+        '''
+        series = self._series.get(cacheKey(address, param, instance))
+        if series is None:
+            return None
+        with self._lock:
+            return series.times.last(), series.values.last()
+
+    def nbytes(self):
+        '''
+        Returns the number of bytes used by the buffers, which only grows with
+        the number of parameters.
+        '''
+        total = 0
+        for series in list(self._series.values()):
+            buffers = [series.times, series.values]
+            for rollup in series.rollups.values():
+                buffers += [rollup.time, rollup.min, rollup.max, rollup.mean, rollup.count]
+            total += sum(len(buffer._data) * buffer._data.itemsize for buffer in buffers)
+        return total
@@ -0,0 +1,344 @@
+'''
+Transaction metrics.
+
+A `Metrics` object passed to `Watlow`, `WatlowBus` or `AsyncWatlowBus` records
+every transaction: its outcome (a complete response, a timeout, a bad header
+check byte or CRC, ...), the bytes sent and received, and the response time
+in histograms per address and per parameter::
+
+    metrics = Metrics()
+    bus = WatlowBus(port='COM5', metrics=metrics)
+    bus[1].read()
+    print(metrics.prometheus())
+
+`prometheus()` returns the counters in the Prometheus text format, e.g. to be
+served on a /metrics page, and `addHook()` registers functions called with
+each `Transaction`, e.g. to log failures. Without `metrics` (the default), the
+only cost is one attribute check per transaction.
+'''
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from pywatlow.checksum import dataCheck
+from pywatlow.checksum import headerCheck
+from pywatlow.frames import HEADER_LENGTH
+from pywatlow.frames import frameLength
+from pywatlow.reading import UNPARSEABLE
+from pywatlow.reading import parseResponse
+
+# Transaction outcomes
+OK = 'ok'
+TIMEOUT = 'timeout'
+INCOMPLETE = 'incomplete'
+HEADER_MISMATCH = 'header mismatch'
+CRC_MISMATCH = 'crc mismatch'
+ADDRESS_MISMATCH = 'address mismatch'
+STALE_RESPONSE = 'stale response'
+UNPARSEABLE_FRAME = 'unparseable'
+ERROR = 'error'
+SKIPPED = 'skipped'
+_UNANSWERED = (TIMEOUT, ERROR, SKIPPED)
+
+# Response time histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+
+Transaction = namedtuple('Transaction', ['address', 'op', 'param', 'outcome', 'elapsed', 'request', 'response'])
+Transaction.__doc__ = '''
+One transaction passed to the hooks of `Metrics`: the controller address, the
+operation ('read' or 'write'), the parameter ID, the outcome, the response
+time in seconds, and the request and response frames.
+'''
+
+
+def requestParam(request):
+    '''
+    Returns the operation ('read' or 'write') and parameter ID of a request
+    frame built by `Watlow`, or (`None`, `None`) for other frames.
+    '''
+    if len(request) < 13 or request[:2] != b'\x55\xff':
+        return None, None
+    if request[9] == 0x03:
+        return 'read', request[11] * 1000 + request[12]
+    if request[9] == 0x04:
+        return 'write', request[10] * 1000 + request[11]
+    return None, None
+
+
+def classify(response, address):
+    '''
+    Returns the outcome of a transaction from its response frame: `OK`,
+    `TIMEOUT` (nothing received), `INCOMPLETE` (part of a frame received),
+    `HEADER_MISMATCH` or `CRC_MISMATCH` (wrong check byte), `ADDRESS_MISMATCH`
+    (a frame from another controller) or `UNPARSEABLE_FRAME` (a valid frame
+    that isn't a read or write response).
+    '''
+    length = len(response)
+    if length == 0 or response.count(0) == length:
+        return TIMEOUT
+    if length < HEADER_LENGTH:
+        return INCOMPLETE
+    if response[7] != headerCheck(response):
+        return HEADER_MISMATCH
+    if length != frameLength(response):
+        return INCOMPLETE
+    if length > HEADER_LENGTH and dataCheck(memoryview(response)[8:-2]) != response[-2] | (response[-1] << 8):
+        return CRC_MISMATCH
+    if response[4] - 15 != address:
+        return ADDRESS_MISMATCH
+    if parseResponse(response, address).status == UNPARSEABLE:
+        return UNPARSEABLE_FRAME
+    return OK
+
+
+class Histogram():
+    '''
+    Cumulative histogram with fixed bucket bounds, like a Prometheus
+    histogram.
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = tuple(bounds)
+        # Observations per bucket, the last one above all bounds
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        Returns a list of (bound, observations less than or equal to bound),
+        ending with `float('inf')`.
+        '''
+        total = 0
+        out = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q):
+        '''
+        Returns the upper bound of the bucket holding the `q` quantile (e.g.
+        0.99), or `None` without observations.
+        '''
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+
+    def stats(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+class _AddressMetrics():
+    '''
+    Counters of one controller address.
+    '''
+    __slots__ = ('outcomes', 'dropped', 'bytesSent', 'bytesReceived', 'latency')
+
+    def __init__(self, buckets):
+        # Transactions by (op, outcome)
+        self.outcomes = {}
+        # Frames dropped by buses by reason
+        self.dropped = {}
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.latency = Histogram(buckets)
+
+
+class Metrics():
+    '''
+    Counts the transactions of any number of `Watlow` objects and buses.
+
+    * **buckets**: response time histogram bucket bounds in seconds
+    * **clock**: function returning the time in seconds, used to time `Watlow` transactions (buses use their own
+      clock)
+
+    Only transactions that received a response are added to the response
+    time histograms, so timeouts don't hide the controllers' actual response
+    times; they are counted in the `TIMEOUT` outcome instead. Transactions not
+    sent because their address is dead (see `pywatlow.timing`) are counted as
+    `SKIPPED`, and exceptions raised by the serial port as `ERROR`.
+
+    Buses drop frames that aren't the response they wait for and record them
+    with `dropped()`, apart from the transactions: frames from other
+    addresses as `ADDRESS_MISMATCH` and late responses from the same address
+    to earlier requests as `STALE_RESPONSE`. A `Watlow` on its own port
+    doesn't drop frames, so its transactions can have the `ADDRESS_MISMATCH`
+    outcome instead.
+    '''
+    def __init__(self, buckets=BUCKETS, clock=time.perf_counter):
+        self.buckets = tuple(buckets)
+        self.clock = clock
+        self.hookErrors = 0
+        self._addresses = {}
+        self._params = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def addHook(self, hook):
+        '''
+        Registers `hook`, called with a `Transaction` after each transaction.
+        Exceptions raised by hooks are counted in `hookErrors` and otherwise
+        ignored.
+        '''
+        self._hooks.append(hook)
+
+    def removeHook(self, hook):
+        self._hooks.remove(hook)
+
+    def _address(self, address):
+        entry = self._addresses.get(address)
+        if entry is None:
+            entry = self._addresses[address] = _AddressMetrics(self.buckets)
+        return entry
+
+    def record(self, address, request, response, elapsed, outcome=None):
+        '''
+        Records one transaction with the controller at `address`. The outcome
+        is classified from the response (see `classify()`) unless given.
+        '''
+        if outcome is None:
+            outcome = classify(response, address)
+        op, param = requestParam(request)
+        with self._lock:
+            entry = self._address(address)
+            key = (op, outcome)
+            entry.outcomes[key] = entry.outcomes.get(key, 0) + 1
+            if outcome != SKIPPED:
+                entry.bytesSent += len(request)
+                entry.bytesReceived += len(response)
+            if outcome not in _UNANSWERED:
+                entry.latency.observe(elapsed)
+                if param is not None:
+                    histogram = self._params.get(param)
+                    if histogram is None:
+                        histogram = self._params[param] = Histogram(self.buckets)
+                    histogram.observe(elapsed)
+        if self._hooks:
+            transaction = Transaction(address, op, param, outcome, elapsed, bytes(request), bytes(response))
+            for hook in list(self._hooks):
+                try:
+                    hook(transaction)
+                except Exception:
+                    self.hookErrors += 1
+
+    def skipped(self, address, request):
+        '''
+        Records a transaction that wasn't sent.
+        '''
+        self.record(address, request, b'', 0.0, SKIPPED)
+
+    def failed(self, address, request, elapsed):
+        '''
+        Records a transaction that raised an exception.
+        '''
+        self.record(address, request, b'', elapsed, ERROR)
+
+    def dropped(self, address, frame):
+        '''
+        Records a frame dropped by a bus while waiting for the response from
+        `address`.
+        '''
+        reason = STALE_RESPONSE if len(frame) > 4 and frame[4] - 15 == address else ADDRESS_MISMATCH
+        with self._lock:
+            entry = self._address(address)
+            entry.dropped[reason] = entry.dropped.get(reason, 0) + 1
+            entry.bytesReceived += len(frame)
+
+    def count(self, outcome=None, address=None):
+        '''
+        Returns the number of transactions with `outcome` to `address` (all
+        of them if not given).
+        '''
+        with self._lock:
+            return sum(count for entryAddress, entry in self._addresses.items()
+                       if address is None or entryAddress == address
+                       for (op, entryOutcome), count in entry.outcomes.items()
+                       if outcome is None or entryOutcome == outcome)
+
+    def latency(self, address=None, param=None):
+        '''
+        Returns the response time `Histogram` of `address` or `param`.
+        '''
+        if param is not None:
+            return self._params.get(int(param)) or Histogram(self.buckets)
+        entry = self._addresses.get(address)
+        return entry.latency if entry is not None else Histogram(self.buckets)
+
+    def reset(self):
+        with self._lock:
+            self._addresses.clear()
+            self._params.clear()
+
+    def stats(self):
+        '''
+        Returns a dict of statistics keyed by address: the number of
+        'transactions', the count of each outcome, 'bytesSent',
+        'bytesReceived', the 'latency' statistics (see `Histogram.stats()`)
+        and the number of frames 'dropped' by reason.
+        '''
+        out = {}
+        with self._lock:
+            for address, entry in sorted(self._addresses.items()):
+                stats = {'transactions': sum(entry.outcomes.values()), 'bytesSent': entry.bytesSent,
+                         'bytesReceived': entry.bytesReceived, 'latency': entry.latency.stats(),
+                         'dropped': dict(entry.dropped)}
+                for (op, outcome), count in entry.outcomes.items():
+                    stats[outcome] = stats.get(outcome, 0) + count
+                out[address] = stats
+        return out
+
+    def prometheus(self, prefix='pywatlow'):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+
+        def header(name, kind, text):
+            lines.append('# HELP {0}_{1} {2}'.format(prefix, name, text))
+            lines.append('# TYPE {0}_{1} {2}'.format(prefix, name, kind))
+
+        def histogram(name, labels, hist):
+            for bound, total in hist.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_{1}_bucket{{{2},le="{3}"}} {4}'.format(prefix, name, labels, le, total))
+            lines.append('{0}_{1}_sum{{{2}}} {3!r}'.format(prefix, name, labels, hist.sum))
+            lines.append('{0}_{1}_count{{{2}}} {3}'.format(prefix, name, labels, hist.count))
+
+        with self._lock:
+            addresses = sorted(self._addresses.items())
+            header('transactions_total', 'counter', 'Transactions by address, operation and outcome.')
+            for address, entry in addresses:
+                for (op, outcome), count in sorted(entry.outcomes.items(), key=str):
+                    lines.append('{0}_transactions_total{{address="{1}",op="{2}",outcome="{3}"}} {4}'.format(
+                        prefix, address, op or 'other', outcome, count))
+            header('dropped_frames_total', 'counter', 'Frames dropped while waiting for a response, by address and reason.')
+            for address, entry in addresses:
+                for reason, count in sorted(entry.dropped.items()):
+                    lines.append('{0}_dropped_frames_total{{address="{1}",reason="{2}"}} {3}'.format(
+                        prefix, address, reason, count))
+            header('sent_bytes_total', 'counter', 'Bytes sent by address.')
+            for address, entry in addresses:
+                lines.append('{0}_sent_bytes_total{{address="{1}"}} {2}'.format(prefix, address, entry.bytesSent))
+            header('received_bytes_total', 'counter', 'Bytes received by address.')
+            for address, entry in addresses:
+                lines.append('{0}_received_bytes_total{{address="{1}"}} {2}'.format(
+                    prefix, address, entry.bytesReceived))
+            header('response_seconds', 'histogram', 'Response time of transactions with a response, by address.')
+            for address, entry in addresses:
+                histogram('response_seconds', 'address="{0}"'.format(address), entry.latency)
+            header('param_response_seconds', 'histogram',
+                   'Response time of transactions with a response, by parameter.')
+            for param, hist in sorted(self._params.items()):
+                histogram('param_response_seconds', 'param="{0}"'.format(param), hist)
+        return '\n'.join(lines) + '\n'
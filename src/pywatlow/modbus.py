@@ -0,0 +1,352 @@
+'''
+Modbus RTU version of `Watlow`.
+
+EZ-Zone controllers can also be set to use Modbus RTU instead of Standard
+Bus. `ModbusWatlow` has the same methods as `Watlow` and uses the same read
+cache, write filter and metrics options, but sends Modbus frames. Capture
+logs (`pywatlow.capture`) only decode Standard Bus frames, so `capture` isn't
+supported.
+Since Modbus reads a range of registers in one transaction, `readParams()`
+reads all the parameters it can as blocks of registers instead of one
+transaction per parameter::
+
+    watlow = ModbusWatlow(port='COM5', address=1)
+    print(watlow.read())
+    print(watlow.readParams([4001, 4012, 4014, 4015, 4016, 4017, 4018]))   # two transactions
+
+Every parameter takes two 16 bit registers (a 32 bit float or integer). The
+register of a parameter is found from its class (the thousands of the
+parameter ID) and member (the rest): members follow each other from the
+class's base register in `REGISTER_BASES`, and instances are a fixed number
+of registers apart (see `registerOf()`). The bases known here are those of
+the EZ-Zone PM manual's Modbus column for inputs (class 4), set points (7)
+and loop setup (8); check the manual of your controller and pass `registers`
+for any other parameter, or to override them.
+'''
+import struct
+import time
+
+from pywatlow import metrics as outcomes
+from pywatlow import params as catalog
+from pywatlow.reading import ERROR
+from pywatlow.reading import INVALID
+from pywatlow.reading import NO_RESPONSE
+from pywatlow.reading import OK
+from pywatlow.reading import SKIPPED
+from pywatlow.reading import UNPARSEABLE
+from pywatlow.reading import Reading
+from pywatlow.watlow import Watlow
+
+READ_HOLDING_REGISTERS = 0x03
+WRITE_MULTIPLE_REGISTERS = 0x10
+# Most registers in one read (the Modbus limit)
+MAX_REGISTERS = 125
+
+# (base register, registers between instances) by parameter class
+REGISTER_BASES = {
+    4: (360, 80),
+    7: (2160, 80),
+    8: (1880, 80),
+}
+
+# Word orders of 32 bit values
+LOW_HIGH = 'lowHigh'
+HIGH_LOW = 'highLow'
+
+# Exception responses: address, function | 0x80, exception code, CRC
+EXCEPTION_LENGTH = 5
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+
+def _mkCrcTable():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _mkCrcTable()
+
+
+def crc16(data):
+    '''
+    Returns the Modbus CRC-16 of `data` as an int. Frames end with it
+    little-endian.
+    '''
+    table = CRC_TABLE
+    crc = 0xFFFF
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def buildFrame(address, function, data):
+    '''
+    Returns the frame of a request or response, CRC included.
+    '''
+    frame = bytes([address, function]) + bytes(data)
+    return frame + struct.pack('<H', crc16(frame))
+
+
+def validFrame(frame):
+    '''
+    Returns True if the CRC at the end of `frame` is correct.
+    '''
+    return len(frame) >= 4 and crc16(memoryview(frame)[:-2]) == frame[-2] | (frame[-1] << 8)
+
+
+def readRequest(address, register, count):
+    '''
+    Returns a request reading `count` registers from `register`.
+    '''
+    return buildFrame(address, READ_HOLDING_REGISTERS, struct.pack('>HH', register, count))
+
+
+def writeRequest(address, register, words):
+    '''
+    Returns a request writing the 16 bit `words` to the registers from
+    `register`.
+    '''
+    return buildFrame(address, WRITE_MULTIPLE_REGISTERS,
+                      struct.pack('>HHB{0}H'.format(len(words)), register, len(words), 2 * len(words), *words))
+
+
+def responseLength(request):
+    '''
+    Returns the length of the normal response to `request`.
+    '''
+    if request[1] == READ_HOLDING_REGISTERS:
+        return 5 + 2 * ((request[4] << 8) | request[5])
+    return 8
+
+
+def packValue(value, data_type, wordOrder=LOW_HIGH):
+    '''
+    Returns the two registers holding `value`.
+    '''
+    if data_type == float:
+        high, low = struct.unpack('>HH', struct.pack('>f', float(value)))
+    else:
+        high, low = struct.unpack('>HH', struct.pack('>I', int(value) & 0xFFFFFFFF))
+    return [low, high] if wordOrder == LOW_HIGH else [high, low]
+
+
+def unpackValue(words, data_type, wordOrder=LOW_HIGH):
+    '''
+    Returns the value held in two registers.
+    '''
+    low, high = words if wordOrder == LOW_HIGH else words[::-1]
+    raw = struct.pack('>HH', high, low)
+    if data_type == float:
+        return struct.unpack('>f', raw)[0]
+    return struct.unpack('>i', raw)[0]
+
+
+def readModbusFrame(serial, length):
+    '''
+    Reads a response of `length` bytes from `serial`, or the five bytes of an
+    exception response, and returns it (or whatever was received before the
+    timeout).
+    '''
+    received = bytearray(serial.read(min(EXCEPTION_LENGTH, length)))
+    if len(received) < 2 or received[1] & 0x80:
+        return bytes(received)
+    while len(received) < length:
+        chunk = serial.read(length - len(received))
+        if not chunk:
+            break
+        received += chunk
+    return bytes(received)
+
+
+def planBlocks(registers, maxGap=0, maxRegisters=MAX_REGISTERS):
+    '''
+    Groups the first registers of two register values into blocks read in one
+    transaction each. Returns a list of (first register, register count,
+    indexes of the values in `registers`). Values are read together if at most
+    `maxGap` unused registers lie between them.
+    '''
+    order = sorted(range(len(registers)), key=lambda index: registers[index])
+    blocks = []
+    for index in order:
+        register = registers[index]
+        if blocks:
+            start, count, indexes = blocks[-1]
+            end = start + count
+            if register < end:
+                # Same register as the previous value
+                indexes.append(index)
+                continue
+            if register - end <= maxGap and register + 2 - start <= maxRegisters:
+                blocks[-1] = (start, register + 2 - start, indexes + [index])
+                continue
+        blocks.append((register, 2, [index]))
+    return blocks
+
+
+def _instance(instance):
+    return int(instance, 16) if isinstance(instance, str) else int(instance)
+
+
+def registerOf(param, instance='01', registers=None):
+    '''
+    Returns the first register of a parameter: from `registers`, a dict of
+    (register of instance 1, registers between instances) by parameter ID, or
+    else from `REGISTER_BASES`. Raises `ValueError` if it is unknown.
+    '''
+    param = int(param)
+    if registers and param in registers:
+        base, offset = registers[param]
+    elif param // 1000 in REGISTER_BASES:
+        base, offset = REGISTER_BASES[param // 1000]
+        base += 2 * (param % 1000 - 1)
+    else:
+        raise ValueError('Modbus register of parameter {0} is unknown, pass registers'.format(param))
+    return base + offset * (_instance(instance) - 1)
+
+
+class ModbusWatlow(Watlow):
+    '''
+    `Watlow` object for a controller set to Modbus RTU.
+
+    * **serial**, **port**, **timeout**, **cache**, **writeFilter**, **metrics**: as for `Watlow`
+    * **capture**: must be `None`, capture logs only hold Standard Bus frames
+    * **address** (int): Modbus address of the controller (1 through 247)
+    * **baudrate** (int): baudrate set on the controller, used when opening `port`
+    * **registers** (dict): (register of instance 1, registers between instances) by parameter ID, added to
+      the registers found from `REGISTER_BASES`
+    * **wordOrder**: `LOW_HIGH` (the controller's default) or `HIGH_LOW`, as set on the controller
+    * **maxGap** (int): most unused registers read between parameters to read them in one block
+
+    Readings have the same statuses as with Standard Bus. A Modbus exception
+    response (e.g. for an unknown register) gives an `UNPARSEABLE` reading;
+    if a block read gets one, its parameters are read one at a time instead.
+    '''
+    def __init__(self, serial=None, port=None, timeout=0.5, address=1, cache=None, writeFilter=None, metrics=None,
+                 capture=None, baudrate=38400, registers=None, wordOrder=LOW_HIGH, maxGap=16):
+        if capture is not None:
+            raise ValueError('capture is only supported on Standard Bus, not Modbus')
+        self.registers = dict(registers or {})
+        self.wordOrder = wordOrder
+        self.maxGap = maxGap
+        self.baudrate = baudrate
+        super().__init__(serial, port, timeout, address, cache, writeFilter, metrics)
+
+    def register(self, param, instance='01'):
+        '''
+        Returns the first register of a parameter (see `registerOf()`).
+        '''
+        return registerOf(param, instance, self.registers)
+
+    def _transact(self, request):
+        metrics = self.metrics
+        if metrics is None:
+            self.serial.write(request)
+            return readModbusFrame(self.serial, responseLength(request))
+        start = metrics.clock()
+        try:
+            self.serial.write(request)
+            response = readModbusFrame(self.serial, responseLength(request))
+        except Exception:
+            metrics.failed(self.address, request, metrics.clock() - start)
+            raise
+        metrics.record(self.address, request, response, metrics.clock() - start, self._outcome(request, response))
+        return response
+
+    def _outcome(self, request, response):
+        # Metrics outcome of a transaction (see `pywatlow.metrics`)
+        if not response:
+            return outcomes.TIMEOUT
+        if len(response) < EXCEPTION_LENGTH:
+            return outcomes.INCOMPLETE
+        if not validFrame(response):
+            return outcomes.CRC_MISMATCH
+        if response[0] != self.address:
+            return outcomes.ADDRESS_MISMATCH
+        if response[1] != request[1] or len(response) != responseLength(request):
+            return outcomes.UNPARSEABLE_FRAME
+        return outcomes.OK
+
+    def _status(self, request, response):
+        # Status of a response, OK if it is the normal response to `request`
+        if not response:
+            return NO_RESPONSE
+        if not validFrame(response) or response[0] != self.address:
+            return INVALID
+        if response[1] != request[1] or len(response) != responseLength(request):
+            return UNPARSEABLE
+        return OK
+
+    def _readBlock(self, start, count, specs):
+        # Reads `count` registers from `start` and returns the status and the
+        # readings of the (param, data_type, instance, register) `specs`
+        request = readRequest(self.address, start, count)
+        try:
+            response = self._transact(request)
+        except Exception as e:
+            return ERROR, [Reading(self.address, status=ERROR, exception=e) for spec in specs]
+        status = self._status(request, response)
+        if status != OK:
+            return status, [Reading(self.address, status=status) for spec in specs]
+        timestamp = time.time()
+        words = struct.unpack_from('>{0}H'.format(count), response, 3)
+        outputs = []
+        for param, data_type, instance, register in specs:
+            value = unpackValue(words[register - start:register - start + 2], data_type, self.wordOrder)
+            outputs.append(Reading(self.address, int(param), _instance(instance), value, OK, timestamp))
+        return status, outputs
+
+    def _read(self, param, data_type, instance):
+        return self._readMany([(int(param), data_type, instance)])[0]
+
+    def _readMany(self, specs):
+        specs = [(param, catalog.dataType(param, data_type), instance, self.register(param, instance))
+                 for param, data_type, instance in specs]
+        outputs = [None] * len(specs)
+        status = OK
+        for start, count, indexes in planBlocks([spec[3] for spec in specs], self.maxGap):
+            if status in (NO_RESPONSE, ERROR):
+                # The controller didn't respond, skip the rest of the batch
+                for index in indexes:
+                    outputs[index] = Reading(self.address, status=SKIPPED if status == NO_RESPONSE else ERROR)
+                continue
+            status, block = self._readBlock(start, count, [specs[index] for index in indexes])
+            if status == UNPARSEABLE and len(indexes) > 1:
+                # An exception response, e.g. a register in the gaps doesn't
+                # exist: read the parameters one at a time
+                block = [self._readBlock(specs[index][3], 2, [specs[index]])[1][0] for index in indexes]
+                status = OK
+            for index, output in zip(indexes, block):
+                outputs[index] = output
+        return outputs
+
+    def _write(self, param, value, data_type, instance):
+        return self._writeMany([(param, value, data_type, instance)])[0]
+
+    def _writeMany(self, specs):
+        outputs = []
+        status = OK
+        for param, value, data_type, instance in specs:
+            if status in (NO_RESPONSE, ERROR):
+                outputs.append(Reading(self.address, status=SKIPPED if status == NO_RESPONSE else ERROR))
+                continue
+            words = packValue(value, data_type, self.wordOrder)
+            request = writeRequest(self.address, self.register(param, instance), words)
+            try:
+                response = self._transact(request)
+            except Exception as e:
+                status = ERROR
+                outputs.append(Reading(self.address, status=ERROR, exception=e))
+                continue
+            status = self._status(request, response)
+            if status != OK:
+                outputs.append(Reading(self.address, status=status))
+                continue
+            # The response doesn't echo the value, report the value as stored
+            outputs.append(Reading(self.address, int(param), _instance(instance), unpackValue(words, data_type, self.wordOrder)))
+        return outputs
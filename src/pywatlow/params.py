@@ -0,0 +1,93 @@
+'''
+Catalog of known Watlow parameters and their data types.
+
+Built from the example messages in docs/reference (messages_*.csv) and the
+requests and responses recorded from real controllers in the test suite. See
+the Watlow `user manual <https://www.watlow.com/-/media/documents/user-manuals/pm-pid-1.ashx>`_
+for the full list of parameters. Parameters missing from the catalog can
+still be used by passing `data_type` explicitly.
+'''
+from collections import namedtuple
+
+# Total frame lengths in bytes, by data type (see docs/reference/messaging.rst)
+READ_REQUEST_LENGTH = 16
+READ_RESPONSE_LENGTH = {float: 21, int: 20}
+WRITE_REQUEST_LENGTH = {float: 20, int: 19}
+WRITE_RESPONSE_LENGTH = {float: 20, int: 19}
+
+
+class Param(namedtuple('Param', ['param', 'name', 'data_type', 'readable', 'writable'])):
+    '''
+    A catalog entry.
+
+    * **param** (int): Watlow parameter ID (e.g. 4001)
+    * **name** (str): description of the parameter
+    * **data_type**: `int` or `float`
+    * **readable** (bool): whether the parameter can be read
+    * **writable** (bool): whether the parameter can be written
+    '''
+    __slots__ = ()
+
+    @property
+    def readResponseLength(self):
+        return READ_RESPONSE_LENGTH[self.data_type]
+
+    @property
+    def writeRequestLength(self):
+        return WRITE_REQUEST_LENGTH[self.data_type]
+
+    @property
+    def writeResponseLength(self):
+        return WRITE_RESPONSE_LENGTH[self.data_type]
+
+
+CATALOG = {entry.param: entry for entry in [
+    Param(4001, 'Process Value', float, True, False),
+    Param(4005, 'Sensor Type', int, True, True),
+    Param(4007, 'RTD Leads', int, True, True),
+    Param(4012, 'Calibration Offset', float, True, True),
+    Param(4014, 'Filter', float, True, True),
+    Param(4015, 'Scale Low', float, True, True),
+    Param(4016, 'Scale High', float, True, True),
+    Param(4017, 'Range Low', float, True, True),
+    Param(4018, 'Range High', float, True, True),
+    Param(4020, 'Display Precision', int, True, True),
+    Param(4028, 'Input Error Latching', int, True, True),
+    Param(4030, 'Process Error Enable', int, True, True),
+    Param(4031, 'Process Error Low Value', float, True, True),
+    Param(4037, 'Resistance Range of Thermistor', int, True, True),
+    Param(4042, 'Units', int, True, True),
+    Param(6001, 'Digital I/O Direction', int, True, True),
+    Param(7001, 'Set Point', float, True, True),
+    Param(8003, 'Heat Algorithm', int, True, True),
+    Param(26021, 'Process Value Function', int, True, True),
+    Param(26026, 'Process Value Filter', float, True, True),
+    Param(26028, 'Process Value Pressure Units', int, True, True),
+    Param(26029, 'Altitude Units', int, True, True),
+    Param(26030, 'Barometric Pressure', float, True, True),
+    Param(34005, 'Linearization Function', int, True, True),
+    Param(34008, 'Linearization Input Point 1', float, True, True),
+    Param(34018, 'Linearization Output Point 1', float, True, True),
+    Param(34029, 'Linearization Units', int, True, True),
+]}
+
+
+def lookup(param):
+    '''
+    Returns the catalog entry (`Param`) for a parameter ID, or `None` if it
+    isn't in the catalog.
+    '''
+    return CATALOG.get(int(param))
+
+
+def dataType(param, data_type=None):
+    '''
+    Returns `data_type` if given, otherwise the catalog's data type for
+    `param`. Raises `ValueError` if neither is known.
+    '''
+    if data_type is not None:
+        return data_type
+    entry = CATALOG.get(int(param))
+    if entry is None:
+        raise ValueError('Data type of parameter {0} is unknown, pass data_type (int or float)'.format(param))
+    return entry.data_type
@@ -0,0 +1,220 @@
+import threading
+import time
+from queue import Empty
+from queue import Queue
+
+from pywatlow.bus import WatlowBus
+from pywatlow.watlow import _paramSpec
+
+
+class _PortWorker():
+    '''
+    Polls every address and parameter of one port in a loop on its own
+    thread.
+    '''
+    def __init__(self, poller, bus, addresses):
+        self.poller = poller
+        self.bus = bus
+        self.name = str(bus.port)
+        self.specs = [(bus[address], [_paramSpec(spec) for spec in params])
+                      for address, params in sorted(addresses.items())]
+        self.busy = 0.0
+        self.readings = 0
+        self.errors = 0
+        self.cycles = 0
+        self.started = None
+        self.stopped = None
+        self.thread = threading.Thread(target=self.run, name='pywatlow-poller-{0}'.format(self.name), daemon=True)
+
+    def run(self):
+        poller = self.poller
+        stop = poller._stop
+        put = poller._queue.put if poller._queue is not None else None
+        table = poller.table
+        history = poller.history
+        log = poller.log
+        self.started = time.monotonic()
+        try:
+            while not stop.is_set():
+                cycleStart = time.monotonic()
+                for watlow, params in self.specs:
+                    if stop.is_set():
+                        return
+                    start = time.monotonic()
+                    outputs = watlow.readParams(params)
+                    self.busy += time.monotonic() - start
+                    timestamp = time.time()
+                    for output, (param, data_type, instance) in zip(outputs, params):
+                        if output['error'] is not None:
+                            self.errors += 1
+                        if table is not None:
+                            table.publish(watlow.address, param, instance, output)
+                        if history is not None:
+                            history.add(watlow.address, param, instance, output)
+                        if log is not None:
+                            log.add(watlow.address, param, instance, output)
+                        self.readings += 1
+                        if put is not None:
+                            reading = dict(output)
+                            reading['port'] = self.name
+                            reading['instance'] = instance
+                            reading['timestamp'] = timestamp
+                            put(reading)
+                self.cycles += 1
+                if poller.interval:
+                    stop.wait(poller.interval - (time.monotonic() - cycleStart))
+        finally:
+            self.stopped = time.monotonic()
+
+    def stats(self):
+        end = self.stopped if self.stopped is not None else time.monotonic()
+        elapsed = end - self.started if self.started is not None else 0.0
+        return {
+            'readings': self.readings,
+            'errors': self.errors,
+            'cycles': self.cycles,
+            'busy': self.busy,
+            'elapsed': elapsed,
+            'utilization': self.busy / elapsed if elapsed else 0.0,
+            'rate': self.readings / elapsed if elapsed else 0.0
+        }
+
+
+def _checkAddresses(ports, sink):
+    # Raises ValueError if an address is polled on several ports, since `sink`
+    # keeps readings by address without the port
+    seen = {}
+    for port, addresses in ports.items():
+        for address in addresses:
+            if address in seen:
+                raise ValueError('Address {0} is on ports {1} and {2}, which would share the {3}\'s entries; use one {3} '
+                                 'per port'.format(address, seen[address], getattr(port, 'port', port), sink))
+            seen[address] = getattr(port, 'port', port)
+
+
+class Poller():
+    '''
+    Polls Watlow controllers on several serial ports at once. Each port is
+    polled by its own thread, since separate ports can transfer data at the
+    same time, and every reading is merged into a single stream.
+
+    * **ports** (dict): maps each port to a dict of {address: [param, ...]}
+    * **timeout** (float): Read timeout value in seconds
+    * **interval** (float): minimum time in seconds between the start of two poll cycles on a port. `0` polls continuously
+    * **table**: `LatestValueTable` (see `pywatlow.sharedtable`) to publish every reading to, or `None`
+    * **history**: `History` (see `pywatlow.history`) to add every reading to, or `None`
+    * **log**: `ReadingLog` (see `pywatlow.blocklog`) to append every reading to, or `None`
+    * **queue** (bool): queue every reading for `get()` and `readings()`. Turn it off when only the
+      table, history or log are used, since nothing else empties the queue
+
+    Ports can be given as port names (e.g. 'COM5'), which are opened as a
+    `WatlowBus`, or as already opened `WatlowBus` objects. Parameters are
+    either a parameter ID, read from instance '01', or a tuple of
+    (param, data_type) or (param, data_type, instance)::
+
+        poller = Poller({
+            '/dev/ttyUSB0': {1: [4001, 7001], 2: [4001, (8003, int)]},
+            '/dev/ttyUSB1': {1: [4001]},
+        })
+        with poller:
+            for reading in poller.readings():
+                print(reading)
+
+    The parameters of each address are read as one batch with
+    `Watlow.readParams()`, so an address that doesn't respond only costs one
+    timeout per cycle. Each reading is the dict returned by `readParam()` with
+    the 'port', 'instance' and 'timestamp' (seconds since the epoch) keys
+    added. With a `table`, every reading is also published to the shared
+    memory table, so other processes can read the latest values without going
+    through the queue. A `history` keeps them in its ring buffers and a `log`
+    appends them to a file.
+
+    The queue keeps every reading until it is read, so it grows without
+    bound unless `get()` or `readings()` keep up. Pass `queue=False` when the
+    readings are only used through a table, history or log.
+
+    The table, history and log keep readings by address and parameter,
+    whatever the port, so with any of them an address can only be polled on
+    one port; use one of each (and one `Poller`) per port otherwise.
+    `ValueError` is raised if an address is on several ports.
+    '''
+    def __init__(self, ports, timeout=0.5, interval=0, table=None, history=None, log=None, queue=True):
+        self.interval = interval
+        self.table = table
+        self.history = history
+        self.log = log
+        self._queue = Queue() if queue else None
+        self._stop = threading.Event()
+        for sink, name in ((table, 'table'), (history, 'history'), (log, 'log')):
+            if sink is not None:
+                _checkAddresses(ports, name)
+        self.workers = []
+        for port, addresses in ports.items():
+            bus = port if isinstance(port, WatlowBus) else WatlowBus(port=port, timeout=timeout)
+            self.workers.append(_PortWorker(self, bus, addresses))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        for worker in self.workers:
+            worker.thread.start()
+
+    def stop(self, timeout=None):
+        '''
+        Stops polling after the transaction in progress on each port and waits
+        for the worker threads to finish.
+        '''
+        self._stop.set()
+        for worker in self.workers:
+            if worker.thread.is_alive():
+                worker.thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        for worker in self.workers:
+            worker.bus.close()
+
+    def get(self, timeout=None):
+        '''
+        Returns the next reading from any port, or `None` if there is none
+        within `timeout` seconds. Raises `RuntimeError` if the poller was
+        created with `queue=False`.
+        '''
+        if self._queue is None:
+            raise RuntimeError('Readings are not queued, the Poller was created with queue=False')
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def readings(self, timeout=None):
+        '''
+        Yields readings from all ports as they arrive. Stops when polling has
+        stopped and all readings were returned, or when no reading arrives
+        within `timeout` seconds.
+        '''
+        while True:
+            reading = self.get(timeout=0.1 if timeout is None else timeout)
+            if reading is not None:
+                yield reading
+            elif timeout is not None or (self._stop.is_set() and self._queue.empty()):
+                return
+
+    def utilization(self):
+        '''
+        Returns the fraction of time each port spent in transactions.
+        '''
+        return {worker.name: worker.stats()['utilization'] for worker in self.workers}
+
+    def stats(self):
+        '''
+        Returns a dict of per-port statistics: readings, errors, completed
+        cycles, busy and elapsed time, utilization and readings per second.
+        '''
+        return {worker.name: worker.stats() for worker in self.workers}
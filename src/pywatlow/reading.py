@@ -0,0 +1,170 @@
+'''
+Compact result type for parsed responses, and the response parser.
+
+`parseResponse()` reads the value straight out of the response with
+`struct.unpack_from` and reports problems with a status code instead of
+raising exceptions. The `Reading` it returns also works as the dict that
+`Watlow.readParam()` used to return (keys 'address', 'param', 'data' and
+'error').
+'''
+import struct
+import time
+from collections.abc import Mapping
+
+from pywatlow import checksum
+
+# Status codes
+OK = 0
+NO_RESPONSE = 1
+INVALID = 2
+UNPARSEABLE = 3
+SKIPPED = 4
+ERROR = 5
+
+STATUS_NAMES = {
+    OK: 'ok',
+    NO_RESPONSE: 'no response',
+    INVALID: 'invalid',
+    UNPARSEABLE: 'unparseable',
+    SKIPPED: 'skipped',
+    ERROR: 'error',
+}
+
+# Messages of the exceptions in the 'error' key of the dict view
+_ERROR_MESSAGES = {
+    NO_RESPONSE: 'Exception: No response from address {0}',
+    INVALID: 'Exception: Invalid response received from address {0}',
+    UNPARSEABLE: 'Received a message that could not be parsed from address {0}',
+    SKIPPED: 'Exception: Skipped after no response from address {0}',
+    ERROR: 'Exception: Transaction with address {0} failed',
+}
+
+# Response layouts, identified by the data length in byte 6 and the type bytes
+# preceding the value. Offsets of the parameter and instance bytes differ
+# between responses to read and to write requests.
+READ_PARAM_OFFSET = 11
+WRITE_PARAM_OFFSET = 10
+# Read response, int value (e.g. 8003): length 0x0a, bytes[-6:-4] are 0F 01
+READ_INT_LENGTH = 10
+# Write response, float value (e.g. 7001): length 0x0a, bytes[-7] is 08
+WRITE_FLOAT_LENGTH = 10
+# Write response, int value: length 0x09
+WRITE_INT_LENGTH = 9
+# Read response, float value (e.g. 4001): length 0x0b
+READ_FLOAT_LENGTH = 11
+
+_unpackFloat = struct.Struct('>f').unpack_from
+_unpackInt = struct.Struct('>H').unpack_from
+
+_KEYS = ('address', 'param', 'data', 'error')
+
+
+class Reading(Mapping):
+    '''
+    Result of one transaction with a Watlow controller.
+
+    * **address** (int): controller address
+    * **param** (int): parameter ID from the response, `None` unless `status` is `OK`
+    * **instance** (int): instance from the response, `None` unless `status` is `OK`
+    * **value**: parameter value (`int` or `float`), `None` unless `status` is `OK`
+    * **status** (int): one of the status codes `OK`, `NO_RESPONSE`, `INVALID`, `UNPARSEABLE`, `SKIPPED` or `ERROR`
+    * **timestamp** (float): time the response was parsed, in seconds since the epoch
+
+    For compatibility, a `Reading` is also a read-only mapping with the keys
+    'address', 'param', 'data' (the value) and 'error' (an `Exception`
+    describing the status, or `None`), so `reading['data']` and
+    `dict(reading)` work as they did with the dicts returned before. The
+    exception is only created when 'error' is looked up.
+    '''
+    __slots__ = ('address', 'param', 'instance', 'value', 'status', 'timestamp', 'exception')
+
+    def __init__(self, address, param=None, instance=None, value=None, status=OK, timestamp=None, exception=None):
+        self.address = address
+        self.param = param
+        self.instance = instance
+        self.value = value
+        self.status = status
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # Exception raised during the transaction, for the ERROR status
+        self.exception = exception
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    @property
+    def data(self):
+        return self.value
+
+    @property
+    def error(self):
+        if self.status == OK:
+            return None
+        if self.exception is not None:
+            return self.exception
+        return Exception(_ERROR_MESSAGES[self.status].format(self.address))
+
+    def __getitem__(self, key):
+        if key in _KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(_KEYS)
+
+    def __len__(self):
+        return len(_KEYS)
+
+    def asDict(self):
+        '''
+        Returns the dict that `Watlow.readParam()` returned before `Reading`.
+        '''
+        return {'address': self.address, 'param': self.param, 'data': self.value, 'error': self.error}
+
+    def __repr__(self):
+        return 'Reading(address={0}, param={1}, instance={2}, value={3!r}, status={4!r}, timestamp={5!r})'.format(
+            self.address, self.param, self.instance, self.value, STATUS_NAMES.get(self.status, self.status),
+            self.timestamp)
+
+
+def validResponse(bytesResponse, address):
+    '''
+    Returns True if both check bytes of a response are correct and it comes
+    from the controller at `address`.
+    '''
+    return (len(bytesResponse) > 10 and
+            bytesResponse[7] == checksum.headerCheck(bytesResponse) and
+            bytesResponse[-2] | (bytesResponse[-1] << 8) == checksum.dataCheck(memoryview(bytesResponse)[8:-2]) and
+            bytesResponse[4] - 15 == address)
+
+
+def parseResponse(bytesResponse, address, timestamp=None):
+    '''
+    Validates a response frame from the controller at `address` and returns
+    a `Reading`. Invalid, missing and unknown responses are reported through
+    the reading's status.
+    '''
+    length = len(bytesResponse)
+    if length == 0 or bytesResponse.count(0) == length:
+        return Reading(address, status=NO_RESPONSE, timestamp=timestamp)
+    if not validResponse(bytesResponse, address):
+        return Reading(address, status=INVALID, timestamp=timestamp)
+
+    dataLength = bytesResponse[6]
+    if dataLength == READ_INT_LENGTH and bytesResponse[-6] == 15 and bytesResponse[-5] == 1:
+        offset = READ_PARAM_OFFSET
+        value = _unpackInt(bytesResponse, length - 4)[0]
+    elif dataLength == WRITE_FLOAT_LENGTH and bytesResponse[-7] == 8:
+        offset = WRITE_PARAM_OFFSET
+        value = _unpackFloat(bytesResponse, length - 6)[0]
+    elif dataLength == WRITE_INT_LENGTH:
+        offset = WRITE_PARAM_OFFSET
+        value = _unpackInt(bytesResponse, length - 4)[0]
+    elif dataLength == READ_FLOAT_LENGTH:
+        offset = READ_PARAM_OFFSET
+        value = _unpackFloat(bytesResponse, length - 6)[0]
+    else:
+        # e.g. the response to writing a read-only parameter
+        return Reading(address, status=UNPARSEABLE, timestamp=timestamp)
+    param = bytesResponse[offset] * 1000 + bytesResponse[offset + 1]
+    return Reading(address, param, bytesResponse[offset + 2], value, OK, timestamp)
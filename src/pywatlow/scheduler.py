@@ -0,0 +1,270 @@
+'''
+Deadline based polling of parameters at different rates.
+
+`Scheduler` takes a list of `PollSpec` (address, parameter, period and
+priority) and reads each parameter once per period, running the read whose
+deadline (the end of its period) is earliest first::
+
+    bus = WatlowBus(port='COM5')
+    scheduler = Scheduler(bus, [
+        PollSpec(1, 4001, 0.2, priority=2),
+        PollSpec(1, 7001, 5.0, priority=1),
+        PollSpec(1, 8003, 300.0, data_type=int),
+    ], callback=lambda spec, reading: print(reading))
+    scheduler.start()
+
+Only as many reads as the bus can carry are scheduled: the time of one
+transaction is estimated from the frame lengths at the bus's baudrate, or
+from the address's measured response time once known, and the lowest priority
+specs are shed when the total exceeds `capacity`. Reads that would be late
+anyway give way to higher priority reads, and `stats()` reports missed
+deadlines and the rate achieved by each spec.
+'''
+import heapq
+import itertools
+import threading
+from collections import namedtuple
+
+from pywatlow import params as catalog
+
+
+class PollSpec(namedtuple('PollSpec', ['address', 'param', 'period', 'priority', 'instance', 'data_type'])):
+    '''
+    A parameter to read periodically.
+
+    * **address** (int): controller address
+    * **param** (int): parameter ID (e.g. 4001)
+    * **period** (float): seconds between reads
+    * **priority** (int): higher priorities are shed last under overload
+    * **instance** (str): parameter instance, defaults to '01'
+    * **data_type**: `int` or `float`, defaults to the catalog's data type
+    '''
+    __slots__ = ()
+
+    def __new__(cls, address, param, period, priority=0, instance='01', data_type=None):
+        if period <= 0:
+            raise ValueError('Poll period must be positive, not {0}'.format(period))
+        return super().__new__(cls, address, int(param), float(period), priority, instance, data_type)
+
+
+class _Task():
+    '''
+    Scheduling state and counters of one `PollSpec`.
+    '''
+    def __init__(self, spec, seq):
+        self.spec = spec
+        self.seq = seq
+        self.active = True
+        self.release = None
+        self.runs = 0
+        self.missed = 0
+        self.shed = 0
+        self.maxLateness = 0.0
+
+    @property
+    def deadline(self):
+        return self.release + self.spec.period
+
+
+class Scheduler():
+    '''
+    Reads the parameters of `specs` from the controllers on `bus`, earliest
+    deadline first.
+
+    * **bus**: `WatlowBus` the controllers are on
+    * **specs**: `PollSpec` objects
+    * **callback**: called with the spec and the `Reading` after each read
+    * **capacity** (float): fraction of the bus's time that may be scheduled
+    * **clock**: function returning the time in seconds. Defaults to the bus's clock
+    * **sleep**: function waiting a number of seconds. Defaults to waiting until `stop()` is called
+
+    The clock and sleep functions of a `SimulatedBus` can be passed to run a
+    schedule in simulated time.
+    '''
+    # Controller turnaround time in seconds assumed until a response time has been measured
+    TURNAROUND = 0.01
+
+    def __init__(self, bus, specs=(), callback=None, capacity=0.9, clock=None, sleep=None):
+        self.bus = bus
+        self.callback = callback
+        self.capacity = capacity
+        self.clock = clock or bus.clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self.tasks = []
+        self.started = None
+        self.thread = None
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        # Tasks waiting for their release time, and released tasks by deadline
+        self._waiting = []
+        self._ready = []
+        # Task whose read is running, queued again by `step()` when it's done
+        self._running = None
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec):
+        '''
+        Adds a `PollSpec`, which is first read right away. Specs can be added
+        while the scheduler is running.
+        '''
+        with self._lock:
+            task = _Task(spec, next(self._seq))
+            if self.started is not None:
+                task.release = self.clock()
+            self.tasks.append(task)
+            self._admit()
+
+    def transactionTime(self, spec):
+        '''
+        Returns the estimated time in seconds of one read of `spec`.
+        '''
+        timer = self.bus.timer(spec.address) if getattr(self.bus, 'adaptive', False) else None
+        if timer is not None and timer.srtt is not None:
+            return timer.srtt
+        entry = catalog.lookup(spec.param)
+        data_type = spec.data_type or (entry.data_type if entry else float)
+        characters = catalog.READ_REQUEST_LENGTH + catalog.READ_RESPONSE_LENGTH[data_type]
+        # 10 bits per character
+        return characters * 10.0 / self.bus.baudrate + self.TURNAROUND
+
+    def load(self, tasks=None):
+        '''
+        Returns the estimated fraction of the bus's time needed by the active
+        specs.
+        '''
+        if tasks is None:
+            tasks = [task for task in self.tasks if task.active]
+        return sum(self.transactionTime(task.spec) / task.spec.period for task in tasks)
+
+    def _admit(self):
+        # Activates the specs that fit in the bus's capacity, highest priority
+        # first, and rebuilds the queues without the running task
+        load = 0.0
+        for task in sorted(self.tasks, key=lambda task: (-task.spec.priority, task.seq)):
+            share = self.transactionTime(task.spec) / task.spec.period
+            task.active = load + share <= self.capacity
+            if task.active:
+                load += share
+        self._waiting = [(task.release, task.seq, task) for task in self.tasks
+                         if task.active and task.release is not None and task is not self._running]
+        heapq.heapify(self._waiting)
+        self._ready = []
+
+    def rebalance(self):
+        '''
+        Re-runs admission with the current transaction time estimates, e.g.
+        after response times have been measured.
+        '''
+        with self._lock:
+            self._admit()
+
+    def step(self):
+        '''
+        Runs at most one read and returns the time (on the scheduler's clock)
+        at which the next read is due.
+        '''
+        with self._lock:
+            now = self.clock()
+            if self.started is None:
+                self.started = now
+                for task in self.tasks:
+                    task.release = now
+                self._admit()
+            waiting = self._waiting
+            ready = self._ready
+            while waiting and waiting[0][0] <= now:
+                task = heapq.heappop(waiting)[2]
+                heapq.heappush(ready, (task.deadline, -task.spec.priority, task.seq, task))
+            while ready:
+                task = heapq.heappop(ready)[3]
+                if (now + self.transactionTime(task.spec) <= task.deadline or
+                        not any(other.spec.priority > task.spec.priority for _, _, _, other in ready)):
+                    break
+                # Would be late anyway, give way to higher priority reads
+                task.missed += 1
+                task.shed += 1
+                self._release(task, now)
+            else:
+                return waiting[0][0] if waiting else None
+            self._running = task
+
+        spec = task.spec
+        reading = self.bus[spec.address].readParam(spec.param, spec.data_type, spec.instance)
+        end = self.clock()
+        with self._lock:
+            self._running = None
+            task.runs += 1
+            if end > task.deadline:
+                task.missed += 1
+                task.maxLateness = max(task.maxLateness, end - task.deadline)
+            self._release(task, end)
+            if self._ready:
+                nextDue = end
+            else:
+                nextDue = self._waiting[0][0] if self._waiting else None
+        if self.callback is not None:
+            self.callback(spec, reading)
+        return nextDue
+
+    def _release(self, task, now):
+        # Schedules the next read of `task`, starting over from `now` if it
+        # fell more than a period behind
+        task.release += task.spec.period
+        if task.deadline < now:
+            task.release = now
+        if task.active:
+            heapq.heappush(self._waiting, (task.release, task.seq, task))
+
+    def run(self, duration=None):
+        '''
+        Runs the schedule until `stop()` is called or for `duration` seconds.
+        '''
+        self._stop.clear()
+        end = None if duration is None else self.clock() + duration
+        while not self._stop.is_set():
+            due = self.step()
+            now = self.clock()
+            if end is not None and now >= end:
+                return
+            if due is None:
+                due = now + 0.1 if end is None else end
+            if end is not None:
+                due = min(due, end)
+            if due > now:
+                self.sleep(due - now)
+
+    def start(self):
+        '''
+        Runs the schedule on a background thread.
+        '''
+        self._stop.clear()
+        self.thread = threading.Thread(target=self.run, name='pywatlow-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def stats(self):
+        '''
+        Returns a dict of statistics keyed by (address, param, instance): the
+        spec's 'period' and 'priority', whether it is 'active' (not shed by
+        admission), the number of 'runs', 'missed' deadlines and reads 'shed'
+        while late, the largest lateness in seconds ('maxLateness'), and the
+        'rate' achieved against the 'target' rate in reads per second.
+        '''
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        return {(task.spec.address, task.spec.param, task.spec.instance): {
+            'period': task.spec.period,
+            'priority': task.spec.priority,
+            'active': task.active,
+            'runs': task.runs,
+            'missed': task.missed,
+            'shed': task.shed,
+            'maxLateness': task.maxLateness,
+            'rate': task.runs / elapsed if elapsed else 0.0,
+            'target': 1.0 / task.spec.period,
+        } for task in self.tasks}
@@ -0,0 +1,201 @@
+'''
+Latest value table in shared memory.
+
+A `LatestValueTable` is a memory mapped file holding the latest reading of
+each (address, param, instance): value, status, timestamp and a sequence
+counter. One process (e.g. a `Poller` with `table=`) publishes readings into
+it, and any number of local processes read the current values straight from
+the mapping, without system calls or serialization::
+
+    # Publisher
+    table = LatestValueTable.create('/dev/shm/watlow', slots=64)
+    poller = Poller({'/dev/ttyUSB0': {1: [4001, 7001]}}, table=table, queue=False)
+
+    # Readers
+    table = LatestValueTable.open('/dev/shm/watlow')
+    print(table.get(1, 4001))
+
+On Linux, files in /dev/shm stay in memory. Readers stay consistent with the
+writer through a seqlock: the writer makes a slot's sequence counter odd while
+it updates the slot and even again afterwards, and readers retry until they
+see the same even counter before and after copying the slot. There is one
+writing process; its threads may each publish to their own slots.
+'''
+import mmap
+import os
+import struct
+import threading
+
+from pywatlow.cache import cacheKey
+from pywatlow.reading import Reading
+
+MAGIC = b'PWLV'
+VERSION = 1
+# magic, version, number of slots, number of slots in use
+HEADER = struct.Struct('<4sHHI4x')
+# sequence, address, instance, status, value type, param, value, timestamp
+SLOT = struct.Struct('<IBBBBIdd4x')
+
+_NONE = 0
+_FLOAT = 1
+_INT = 2
+
+
+class LatestValueTable():
+    '''
+    Fixed layout table of the latest reading per (address, param, instance),
+    in a memory mapped file. Use `create()` in the publishing process and
+    `open()` in readers.
+
+    The file starts with `HEADER` (magic, version, slot count and slots in
+    use), followed by `slots` slots of `SLOT` (sequence counter, address,
+    instance, status, value type, param, value and timestamp). Slots are
+    assigned to parameters in the order they are first published.
+    '''
+    def __init__(self, path, writable, slots=None):
+        self.path = path
+        self.writable = writable
+        if writable:
+            size = HEADER.size + slots * SLOT.size
+            with open(path, 'w+b') as fh:
+                fh.truncate(size)
+            self._file = open(path, 'r+b')
+            self._map = mmap.mmap(self._file.fileno(), size)
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, slots, 0)
+        else:
+            self._file = open(path, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, slots, used = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('{0} is not a version {1} latest value table'.format(path, VERSION))
+        self.slots = slots
+        self._index = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.retries = 0
+
+    @classmethod
+    def create(cls, path, slots=256):
+        '''
+        Creates (or replaces) the table file at `path` with room for `slots`
+        parameters, and returns the table for publishing.
+        '''
+        return cls(path, True, slots)
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Opens an existing table for reading.
+        '''
+        return cls(path, False)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def unlink(self):
+        '''
+        Closes the table and removes its file.
+        '''
+        self.close()
+        os.unlink(self.path)
+
+    def __len__(self):
+        return HEADER.unpack_from(self._map, 0)[3]
+
+    def _offset(self, slot):
+        return HEADER.size + slot * SLOT.size
+
+    def _rescan(self):
+        # Indexes the slots assigned since the last scan
+        for slot in range(len(self._index), len(self)):
+            fields = SLOT.unpack_from(self._map, self._offset(slot))
+            self._index[(fields[1], fields[5], fields[2])] = slot
+
+    def _slot(self, key):
+        # Returns the slot of `key`, or `None`
+        slot = self._index.get(key)
+        if slot is None:
+            self._rescan()
+            slot = self._index.get(key)
+        return slot
+
+    def _assign(self, key):
+        with self._lock:
+            slot = self._slot(key)
+            if slot is None:
+                slot = len(self)
+                if slot >= self.slots:
+                    raise ValueError('Latest value table {0} is full ({1} slots)'.format(self.path, self.slots))
+                address, param, instance = key
+                SLOT.pack_into(self._map, self._offset(slot), 0, address, instance, 0, _NONE, param, 0.0, 0.0)
+                self._index[key] = slot
+                HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.slots, slot + 1)
+            return slot
+
+    def publish(self, address, param, instance, reading):
+        '''
+        Stores `reading` as the latest reading of (address, param, instance).
+        '''
+        key = cacheKey(address, param, instance)
+        slot = self._slot(key)
+        if slot is None:
+            slot = self._assign(key)
+        offset = self._offset(slot)
+        value = reading.value
+        valueType = _NONE if value is None else (_FLOAT if isinstance(value, float) else _INT)
+        seq = struct.unpack_from('<I', self._map, offset)[0]
+        # Odd while the slot is being written
+        struct.pack_into('<I', self._map, offset, (seq + 1) & 0xffffffff)
+        SLOT.pack_into(self._map, offset, (seq + 1) & 0xffffffff, key[0], key[2], reading.status, valueType,
+                       key[1], value or 0, reading.timestamp)
+        struct.pack_into('<I', self._map, offset, (seq + 2) & 0xffffffff)
+        self.published += 1
+
+    def _read(self, slot):
+        offset = self._offset(slot)
+        while True:
+            fields = SLOT.unpack_from(self._map, offset)
+            if not fields[0] & 1 and struct.unpack_from('<I', self._map, offset)[0] == fields[0]:
+                return fields
+            self.retries += 1
+
+    def _reading(self, fields):
+        seq, address, instance, status, valueType, param, value, timestamp = fields
+        if valueType == _NONE:
+            return Reading(address, status=status, timestamp=timestamp)
+        return Reading(address, param, instance, int(value) if valueType == _INT else value, status, timestamp)
+
+    def get(self, address, param, instance='01'):
+        '''
+        Returns the latest `Reading` of a parameter, or `None` if it hasn't
+        been published.
+        '''
+        slot = self._slot(cacheKey(address, param, instance))
+        if slot is None:
+            return None
+        fields = self._read(slot)
+        if fields[0] == 0:
+            return None
+        return self._reading(fields)
+
+    def sequence(self, address, param, instance='01'):
+        '''
+        Returns the sequence counter of a parameter, which increases by two
+        with every reading published, or `None` if it has no slot.
+        '''
+        slot = self._slot(cacheKey(address, param, instance))
+        return None if slot is None else self._read(slot)[0]
+
+    def snapshot(self):
+        '''
+        Returns a dict of the latest readings keyed by (address, param,
+        instance), with the instance as an int.
+        '''
+        self._rescan()
+        out = {}
+        for key, slot in self._index.items():
+            fields = self._read(slot)
+            if fields[0]:
+                out[key] = self._reading(fields)
+        return out
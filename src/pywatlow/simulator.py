@@ -0,0 +1,396 @@
+'''
+In-process stand-in for a bus of Watlow controllers, for testing and load
+testing without hardware.
+
+`SimulatedBus` behaves like a pySerial serial object and can be passed
+anywhere one is accepted::
+
+    bus = SimulatedBus([SimulatedController(1, {4001: 72.5, 7001: 75.0})])
+    watlow = Watlow(serial=bus, address=1)
+    print(watlow.read())
+
+Wire time at 38400 baud (10 bits per character) and the controllers'
+turnaround time are modeled. By default time is simulated: reads return
+immediately and advance the bus's clock (`now()`) instead of sleeping, so
+benchmarks can run much faster than the real bus while still reporting bus
+time. Pass `realtime=True` to sleep for real.
+'''
+import random
+import struct
+import threading
+import time
+
+from pywatlow import modbus
+from pywatlow import params as catalog
+from pywatlow.checksum import dataCheckByte
+from pywatlow.checksum import headerCheckByte
+from pywatlow.frames import FrameDecoder
+
+# Error codes seen in responses (see docs/reference/messaging.rst)
+ERROR_READ_ONLY = 0x80
+ERROR_UNKNOWN_PARAM = 0x85
+
+
+def buildFrame(header, data=b''):
+    '''
+    Builds a complete frame from the five header bytes following the preamble
+    (bytes[2] through bytes[6]) and the data bytes, adding both check bytes.
+    '''
+    header = b'\x55\xff' + bytes(header)
+    frame = header + headerCheckByte(header)
+    if data:
+        data = bytes(data)
+        frame += data + dataCheckByte(data)
+    return frame
+
+
+class SimulatedController():
+    '''
+    A simulated Watlow controller.
+
+    * **address** (int): controller address, 1 through 16
+    * **values** (dict): initial parameter values, keyed by parameter ID (instance 1) or by (param, instance)
+    * **turnaround** (float): seconds between the end of a request and the start of the response
+    * **readOnly**: parameter IDs that reject writes. Defaults to those marked read-only in `pywatlow.params`
+
+    The data type of each parameter is taken from `pywatlow.params`, or from
+    the type of its initial value for parameters missing from the catalog.
+    '''
+    def __init__(self, address, values=None, turnaround=0.005, readOnly=None):
+        self.address = address
+        self.turnaround = turnaround
+        self.values = {}
+        self.types = {}
+        for key, value in (values or {}).items():
+            self.set(key, value)
+        if readOnly is None:
+            readOnly = [entry.param for entry in catalog.CATALOG.values() if not entry.writable]
+        self.readOnly = set(readOnly)
+
+    def set(self, key, value):
+        param, instance = key if isinstance(key, tuple) else (key, 1)
+        entry = catalog.lookup(param)
+        data_type = entry.data_type if entry else type(value)
+        self.types[param] = data_type
+        self.values[(int(param), int(instance))] = data_type(value)
+
+    def get(self, param, instance=1):
+        return self.values.get((int(param), int(instance)))
+
+    def _valueBytes(self, param, value):
+        if self.types[param] == float:
+            return b'\x08' + struct.pack('>f', value)
+        return b'\x0f\x01' + int(value).to_bytes(2, 'big')
+
+    def _error(self, code):
+        return buildFrame([0x06, 0x00, self.address + 15, 0x00, 0x02], [0x02, code])
+
+    def respond(self, request):
+        '''
+        Returns the response frame to a request frame addressed to this
+        controller, or `None` if the request isn't understood.
+        '''
+        if len(request) < 14:
+            return None
+        zone = self.address + 15
+        if request[8:11] == b'\x01\x03\x01':
+            # Read request
+            param = request[11] * 1000 + request[12]
+            instance = request[13]
+            value = self.get(param, instance)
+            if value is None:
+                return self._error(ERROR_UNKNOWN_PARAM)
+            data = b'\x02\x03\x01' + request[11:14] + self._valueBytes(param, value)
+            return buildFrame([0x06, 0x00, zone, 0x00, len(data)], data)
+        if request[8:10] == b'\x01\x04':
+            # Write request
+            param = request[10] * 1000 + request[11]
+            instance = request[12]
+            if param in self.readOnly:
+                return self._error(ERROR_READ_ONLY)
+            if request[13] == 0x08:
+                value = struct.unpack_from('>f', request, 14)[0]
+            else:
+                value = int.from_bytes(request[15:17], 'big')
+            if param not in self.types:
+                self.types[param] = float if request[13] == 0x08 else int
+            self.values[(param, instance)] = self.types[param](value)
+            data = b'\x02\x04' + request[10:13] + self._valueBytes(param, self.values[(param, instance)])
+            if self.types[param] == float:
+                return buildFrame([0x06, 0x00, zone, 0x00, len(data)], data)
+            return buildFrame([0x06, 0x03, zone, 0x00, len(data)], data)
+        return None
+
+
+class SimulatedBus():
+    '''
+    Simulated RS-485 bus that behaves like a pySerial serial object.
+
+    * **controllers**: `SimulatedController` objects on the bus
+    * **timeout** (float): read timeout in seconds, like `serial.Serial.timeout`
+    * **baudrate** (int): bus baudrate, used for wire time
+    * **realtime** (bool): sleep for wire and turnaround time instead of advancing a simulated clock
+    * **seed**: seed for the random error injection
+
+    Faults can be injected per address:
+
+    * `silent`: set of addresses that never respond
+    * `inject(address, fault, count)`: makes the next `count` responses from `address` fail with `fault`,
+      one of 'timeout' (no response), 'crc' (bad data check bytes) or 'header' (bad header check byte)
+    * `errorRate`: probability that any response has a bad data check
+    '''
+    FAULTS = ('timeout', 'crc', 'header')
+
+    def __init__(self, controllers=(), timeout=0.5, baudrate=38400, realtime=False, seed=None, port='simulated'):
+        self.port = port
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.realtime = realtime
+        self.controllers = {controller.address: controller for controller in controllers}
+        self.silent = set()
+        self.errorRate = 0.0
+        self.is_open = True
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.requests = 0
+        self.responses = 0
+        self._faults = {}
+        self._random = random.Random(seed)
+        self._decoder = FrameDecoder()
+        # Received bytes not read yet, as [readyAt, bytearray] chunks
+        self._rx = []
+        self._lineFree = 0.0
+        self._now = 0.0
+        self._lock = threading.RLock()
+
+    def characterTime(self):
+        return 10.0 / self.baudrate
+
+    def now(self):
+        '''
+        Returns the bus clock in seconds: simulated time, or time.monotonic()
+        when running in real time.
+        '''
+        return time.monotonic() if self.realtime else self._now
+
+    def sleep(self, seconds):
+        '''
+        Waits `seconds` on the bus clock.
+        '''
+        if seconds > 0:
+            if self.realtime:
+                time.sleep(seconds)
+            else:
+                with self._lock:
+                    self._now += seconds
+
+    def _waitUntil(self, moment):
+        if self.realtime:
+            self.sleep(moment - time.monotonic())
+        else:
+            with self._lock:
+                self._now = max(self._now, moment)
+
+    def addController(self, controller):
+        self.controllers[controller.address] = controller
+
+    def inject(self, address, fault, count=1):
+        if fault not in self.FAULTS:
+            raise ValueError('Unknown fault {0}'.format(fault))
+        self._faults[address] = [fault, count]
+
+    def _fault(self, address):
+        fault = self._faults.get(address)
+        if fault is None:
+            return None
+        fault[1] -= 1
+        if fault[1] <= 0:
+            del self._faults[address]
+        return fault[0]
+
+    # pySerial API
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        now = self.now()
+        with self._lock:
+            return sum(len(chunk) for readyAt, chunk in self._rx if readyAt <= now)
+
+    def reset_input_buffer(self):
+        now = self.now()
+        with self._lock:
+            self._rx = [[readyAt, chunk] for readyAt, chunk in self._rx if readyAt > now]
+
+    def reset_output_buffer(self):
+        pass
+
+    def write(self, data):
+        with self._lock:
+            start = max(self.now(), self._lineFree)
+            requestEnd = start + len(data) * self.characterTime()
+            self._lineFree = requestEnd
+            self.bytesWritten += len(data)
+            for request in self._requests(data):
+                self.requests += 1
+                self._answer(request, requestEnd)
+        # Writing blocks until the request has been sent
+        self._waitUntil(requestEnd)
+        return len(data)
+
+    def _requests(self, data):
+        # Returns the request frames completed by the bytes written
+        self._decoder.feed(data)
+        requests = []
+        while True:
+            request = self._decoder.decode()
+            if request is None:
+                return requests
+            requests.append(request)
+
+    def _address(self, request):
+        # Returns the address a request is for, or None
+        if len(request) < 4 or request[2] != 0x05:
+            return None
+        return request[3] - 15
+
+    def _respond(self, controller, request):
+        return controller.respond(request)
+
+    def _answer(self, request, requestEnd):
+        address = self._address(request)
+        controller = self.controllers.get(address)
+        if controller is None or address in self.silent:
+            return
+        fault = self._fault(address)
+        if fault == 'timeout':
+            return
+        response = self._respond(controller, request)
+        if response is None:
+            return
+        response = bytearray(response)
+        if fault == 'crc' or (self.errorRate and self._random.random() < self.errorRate):
+            response[-1] ^= 0xFF
+        elif fault == 'header':
+            response[7] ^= 0xFF
+        readyAt = requestEnd + controller.turnaround + len(response) * self.characterTime()
+        self._lineFree = readyAt
+        self.responses += 1
+        self._rx.append([readyAt, response])
+
+    def read(self, size=1):
+        deadline = self.now() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            if not self._rx or (deadline is not None and self._rx[0][0] > deadline):
+                nothing = True
+            else:
+                nothing = False
+                readyAt = self._rx[0][0]
+        if nothing:
+            # pySerial returns what it has after the timeout
+            if deadline is not None:
+                self._waitUntil(deadline)
+            return b''
+        self._waitUntil(readyAt)
+        with self._lock:
+            out = bytearray()
+            now = self.now()
+            while self._rx and len(out) < size and self._rx[0][0] <= now:
+                chunk = self._rx[0][1]
+                take = size - len(out)
+                out += chunk[:take]
+                del chunk[:take]
+                if not chunk:
+                    self._rx.pop(0)
+            self.bytesRead += len(out)
+            return bytes(out)
+
+
+class SimulatedModbusBus(SimulatedBus):
+    '''
+    Simulated bus of controllers set to Modbus RTU, for `ModbusWatlow`::
+
+        bus = SimulatedModbusBus([SimulatedController(1, {4001: 72.5, 7001: 75.0})])
+        watlow = ModbusWatlow(serial=bus, address=1)
+
+    * **controllers**, **timeout**, **baudrate**, **realtime**, **seed**: as for `SimulatedBus`
+    * **registers**, **wordOrder**: as for `ModbusWatlow`
+    * **strict** (bool): answer reads of registers that hold no parameter with an exception response
+      instead of zeros
+
+    Each `write()` is taken as one request frame. Faults are injected as with
+    `SimulatedBus`, except for 'header' since Modbus frames only have a CRC.
+    '''
+    FAULTS = ('timeout', 'crc')
+
+    def __init__(self, controllers=(), registers=None, wordOrder=modbus.LOW_HIGH, strict=False, **kwargs):
+        super().__init__(controllers, **kwargs)
+        self.registers = registers
+        self.wordOrder = wordOrder
+        self.strict = strict
+        # (number of values, {register: (param, instance)}) by address
+        self._maps = {}
+
+    def _requests(self, data):
+        return [bytes(data)]
+
+    def _address(self, request):
+        return request[0] if modbus.validFrame(request) else None
+
+    def _registerMap(self, controller):
+        # Returns {first register: (param, instance)} of the controller's
+        # values, rebuilt when values are added
+        cached = self._maps.get(controller.address)
+        if cached is None or cached[0] != len(controller.values):
+            mapping = {}
+            for param, instance in controller.values:
+                try:
+                    mapping[modbus.registerOf(param, instance, self.registers)] = (param, instance)
+                except ValueError:
+                    pass
+            cached = self._maps[controller.address] = (len(controller.values), mapping)
+        return cached[1]
+
+    def _respond(self, controller, request):
+        function = request[1]
+        mapping = self._registerMap(controller)
+        if function == modbus.READ_HOLDING_REGISTERS and len(request) == 8:
+            register, count = struct.unpack_from('>HH', request, 2)
+            if not 1 <= count <= modbus.MAX_REGISTERS:
+                return self._exception(controller, function, modbus.ILLEGAL_DATA_VALUE)
+            words = []
+            for word in range(register, register + count):
+                # Each value is held in its first register and the next one
+                for first in (word, word - 1):
+                    key = mapping.get(first)
+                    if key is not None:
+                        words.append(modbus.packValue(controller.values[key], controller.types[key[0]],
+                                                      self.wordOrder)[word - first])
+                        break
+                else:
+                    if self.strict:
+                        return self._exception(controller, function, modbus.ILLEGAL_DATA_ADDRESS)
+                    words.append(0)
+            data = struct.pack('>B{0}H'.format(count), 2 * count, *words)
+            return modbus.buildFrame(controller.address, function, data)
+        if function == modbus.WRITE_MULTIPLE_REGISTERS and len(request) == 13:
+            register, count = struct.unpack_from('>HH', request, 2)
+            key = mapping.get(register)
+            if count != 2 or key is None or key[0] in controller.readOnly:
+                return self._exception(controller, function, modbus.ILLEGAL_DATA_ADDRESS)
+            data_type = controller.types[key[0]]
+            controller.values[key] = data_type(modbus.unpackValue(struct.unpack_from('>2H', request, 7), data_type,
+                                                                  self.wordOrder))
+            return modbus.buildFrame(controller.address, function, request[2:6])
+        return self._exception(controller, function, modbus.ILLEGAL_FUNCTION)
+
+    def _exception(self, controller, function, code):
+        return modbus.buildFrame(controller.address, function | 0x80, [code])
@@ -0,0 +1,107 @@
+'''
+Response time tracking for the controllers on a bus.
+
+`WatlowBus` and `AsyncWatlowBus` keep one `ResponseTimer` per address. The
+timer estimates the controller's response time and derives a read timeout
+from it the way TCP derives its retransmission timeout (RFC 6298): the
+smoothed response time plus four times its mean deviation. A controller that
+stops answering is considered dead after a few timeouts in a row and is then
+only probed with exponential backoff, so it doesn't cost a full timeout on
+every poll of the other controllers.
+'''
+
+
+class ResponseTimer():
+    '''
+    Response time estimate and read timeout for one controller.
+
+    * **timeout** (float): timeout in seconds until the first response, and the largest timeout used
+    * **minTimeout** (float): smallest timeout in seconds
+    * **deadAfter** (int): timeouts in a row after which the controller is considered dead
+    * **backoff** (float): seconds until the first probe of a dead controller, doubled after each failed probe
+    * **maxBackoff** (float): longest interval in seconds between probes of a dead controller
+    '''
+    # Gains of the smoothed response time and of its mean deviation
+    ALPHA = 0.125
+    BETA = 0.25
+    # Mean deviations added to the smoothed response time for the timeout
+    K = 4
+
+    def __init__(self, timeout=0.5, minTimeout=0.05, deadAfter=3, backoff=1.0, maxBackoff=30.0):
+        self.maxTimeout = timeout
+        self.minTimeout = minTimeout
+        self.deadAfter = deadAfter
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.srtt = None
+        self.rttvar = None
+        self.failures = 0
+        self.nextProbe = 0.0
+        self.responses = 0
+        self.timeouts = 0
+        self.skipped = 0
+
+    def timeout(self):
+        '''
+        Returns the read timeout in seconds for the next request.
+        '''
+        if self.srtt is None:
+            return self.maxTimeout
+        timeout = max(self.srtt + self.K * self.rttvar, self.minTimeout)
+        # Wait longer after each timeout in case the controller is only slow
+        timeout *= 2 ** min(self.failures, 16)
+        return min(timeout, self.maxTimeout)
+
+    @property
+    def dead(self):
+        return self.failures >= self.deadAfter
+
+    def available(self, now):
+        '''
+        Returns True if a request should be sent at `now` (on the bus's
+        clock): the controller is alive, or it is dead and due for a probe.
+        '''
+        if not self.dead or now >= self.nextProbe:
+            return True
+        self.skipped += 1
+        return False
+
+    def success(self, elapsed):
+        '''
+        Records a response received `elapsed` seconds after the request.
+        '''
+        if self.srtt is None:
+            self.srtt = elapsed
+            self.rttvar = elapsed / 2
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - elapsed) - self.rttvar)
+            self.srtt += self.ALPHA * (elapsed - self.srtt)
+        self.failures = 0
+        self.responses += 1
+
+    def failure(self, now):
+        '''
+        Records a request sent at `now` that timed out.
+        '''
+        self.failures += 1
+        self.timeouts += 1
+        if self.dead:
+            backoff = self.backoff * 2 ** min(self.failures - self.deadAfter, 16)
+            self.nextProbe = now + min(backoff, self.maxBackoff)
+
+    def stats(self):
+        '''
+        Returns a dict with the smoothed response time ('srtt') and its mean
+        deviation ('rttvar') in seconds (`None` before the first response), the
+        current 'timeout', whether the controller is 'dead', and the counts of
+        'responses', 'timeouts' and requests 'skipped' while dead.
+        '''
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'timeout': self.timeout(),
+            'dead': self.dead,
+            'responses': self.responses,
+            'timeouts': self.timeouts,
+            'skipped': self.skipped,
+        }
@@ -2,9 +2,31 @@ import struct
 from binascii import hexlify
 from binascii import unhexlify
 
-import crcmod
 import serial as ser
 
+from pywatlow import checksum
+from pywatlow import params as catalog
+from pywatlow.cache import cacheKey
+from pywatlow.capture import CaptureSerial
+from pywatlow.frames import FrameCompiler
+from pywatlow.frames import readFrame
+from pywatlow.reading import ERROR
+from pywatlow.reading import SKIPPED
+from pywatlow.reading import Reading
+from pywatlow.reading import parseResponse
+from pywatlow.reading import validResponse
+
+
+def _paramSpec(spec):
+    # Normalizes a read spec (param or tuple of param, data_type, instance) to
+    # a (param, data_type, instance) tuple
+    if isinstance(spec, (tuple, list)):
+        param = spec[0]
+        data_type = spec[1] if len(spec) > 1 else None
+        instance = spec[2] if len(spec) > 2 else '01'
+        return (int(param), data_type, instance)
+    return (int(spec), None, '01')
+
 
 class Watlow():
     '''
@@ -16,21 +38,41 @@ class Watlow():
     * **port** (str): string representing the serial port or `None`
     * **timeout** (float): Read timeout value in seconds
     * **address** (int): Watlow controller address (found in the setup menu). Acceptable values are 1 through 16.
+    * **cache**: `ReadCache` (see `pywatlow.cache`) to serve repeated reads from, or `None`
+    * **writeFilter**: `WriteFilter` (see `pywatlow.writes`) to skip writes of unchanged values, or `None`
+    * **metrics**: `Metrics` (see `pywatlow.metrics`) recording each transaction, or `None`
+    * **capture** (str): path of a file to log every frame sent and received to (see `pywatlow.capture`), or `None`
 
     `timeout` and `port` are not necessary if a serial object was already passed
     with those arguments. The baudrate for Watlow temperature controllers is 38400
     and hardcoded.
+
+    Request frames are taken from `compiler`, a `FrameCompiler` shared by all
+    instances, so that polling the same parameters doesn't rebuild them each
+    time. Assign a new `FrameCompiler` to an instance's `compiler` attribute to
+    give it a separate cache.
     '''
-    def __init__(self, serial=None, port=None, timeout=0.5, address=1):
+    compiler = FrameCompiler()
+    cache = None
+    writeFilter = None
+    metrics = None
+    baudrate = 38400
+
+    def __init__(self, serial=None, port=None, timeout=0.5, address=1, cache=None, writeFilter=None, metrics=None,
+                 capture=None):
         self.timeout = timeout
-        self.baudrate = 38400
         self.address = address
+        self.cache = cache
+        self.writeFilter = writeFilter
+        self.metrics = metrics
         if serial:
             self.port = serial.port
             self.serial = serial
         else:
             self.port = port
             self.open()
+        if capture is not None:
+            self.serial = CaptureSerial(self.serial, capture)
 
     def open(self):
         self.serial = ser.Serial(self.port, self.baudrate, timeout=self.timeout)
@@ -39,6 +81,48 @@ class Watlow():
         self.serial.flush()
         self.serial.close()
 
+    def _transact(self, request):
+        '''
+        Writes a request frame and returns the response frame (or whatever was
+        received before the timeout).
+        '''
+        metrics = self.metrics
+        if metrics is None:
+            self.serial.write(request)
+            return readFrame(self.serial)
+        start = metrics.clock()
+        try:
+            self.serial.write(request)
+            response = readFrame(self.serial)
+        except Exception:
+            metrics.failed(self.address, request, metrics.clock() - start)
+            raise
+        metrics.record(self.address, request, response, metrics.clock() - start)
+        return response
+
+    def _transactMany(self, requests):
+        '''
+        Runs the requests one after another and returns the list of responses.
+        Stops after the first request that gets no response at all, so the
+        list may be shorter than `requests`.
+        '''
+        responses = []
+        for request in requests:
+            response = self._transact(request)
+            responses.append(response)
+            if not response:
+                break
+        return responses
+
+    def _batchOutputs(self, requests, responses, error):
+        # Parses the responses of a batch and fills in readings for the
+        # requests that weren't sent
+        outputs = [self._parseReading(response) for response in responses]
+        status = SKIPPED if error is None else ERROR
+        for _ in range(len(requests) - len(outputs)):
+            outputs.append(Reading(self.address, status=status, exception=error))
+        return outputs
+
     def _headerCheckByte(self, headerBytes):
         '''
         Takes the full header byte array bytes[0] through bytes[6] of the full
@@ -48,57 +132,14 @@ class Watlow():
         Implementation relies on this post:
         https://reverseengineering.stackexchange.com/questions/8303/rs-485-checksum-reverse-engineering-watlow-ez-zone-pm
         '''
-        crc_8_table = [
-            0x00, 0xfe, 0xff, 0x01, 0xfd, 0x03, 0x02, 0xfc,
-            0xf9, 0x07, 0x06, 0xf8, 0x04, 0xfa, 0xfb, 0x05,
-            0xf1, 0x0f, 0x0e, 0xf0, 0x0c, 0xf2, 0xf3, 0x0d,
-            0x08, 0xf6, 0xf7, 0x09, 0xf5, 0x0b, 0x0a, 0xf4,
-            0xe1, 0x1f, 0x1e, 0xe0, 0x1c, 0xe2, 0xe3, 0x1d,
-            0x18, 0xe6, 0xe7, 0x19, 0xe5, 0x1b, 0x1a, 0xe4,
-            0x10, 0xee, 0xef, 0x11, 0xed, 0x13, 0x12, 0xec,
-            0xe9, 0x17, 0x16, 0xe8, 0x14, 0xea, 0xeb, 0x15,
-            0xc1, 0x3f, 0x3e, 0xc0, 0x3c, 0xc2, 0xc3, 0x3d,
-            0x38, 0xc6, 0xc7, 0x39, 0xc5, 0x3b, 0x3a, 0xc4,
-            0x30, 0xce, 0xcf, 0x31, 0xcd, 0x33, 0x32, 0xcc,
-            0xc9, 0x37, 0x36, 0xc8, 0x34, 0xca, 0xcb, 0x35,
-            0x20, 0xde, 0xdf, 0x21, 0xdd, 0x23, 0x22, 0xdc,
-            0xd9, 0x27, 0x26, 0xd8, 0x24, 0xda, 0xdb, 0x25,
-            0xd1, 0x2f, 0x2e, 0xd0, 0x2c, 0xd2, 0xd3, 0x2d,
-            0x28, 0xd6, 0xd7, 0x29, 0xd5, 0x2b, 0x2a, 0xd4,
-            0x81, 0x7f, 0x7e, 0x80, 0x7c, 0x82, 0x83, 0x7d,
-            0x78, 0x86, 0x87, 0x79, 0x85, 0x7b, 0x7a, 0x84,
-            0x70, 0x8e, 0x8f, 0x71, 0x8d, 0x73, 0x72, 0x8c,
-            0x89, 0x77, 0x76, 0x88, 0x74, 0x8a, 0x8b, 0x75,
-            0x60, 0x9e, 0x9f, 0x61, 0x9d, 0x63, 0x62, 0x9c,
-            0x99, 0x67, 0x66, 0x98, 0x64, 0x9a, 0x9b, 0x65,
-            0x91, 0x6f, 0x6e, 0x90, 0x6c, 0x92, 0x93, 0x6d,
-            0x68, 0x96, 0x97, 0x69, 0x95, 0x6b, 0x6a, 0x94,
-            0x40, 0xbe, 0xbf, 0x41, 0xbd, 0x43, 0x42, 0xbc,
-            0xb9, 0x47, 0x46, 0xb8, 0x44, 0xba, 0xbb, 0x45,
-            0xb1, 0x4f, 0x4e, 0xb0, 0x4c, 0xb2, 0xb3, 0x4d,
-            0x48, 0xb6, 0xb7, 0x49, 0xb5, 0x4b, 0x4a, 0xb4,
-            0xa1, 0x5f, 0x5e, 0xa0, 0x5c, 0xa2, 0xa3, 0x5d,
-            0x58, 0xa6, 0xa7, 0x59, 0xa5, 0x5b, 0x5a, 0xa4,
-            0x50, 0xae, 0xaf, 0x51, 0xad, 0x53, 0x52, 0xac,
-            0xa9, 0x57, 0x56, 0xa8, 0x54, 0xaa, 0xab, 0x55
-        ]
-
-        # Watlow's header check byte algorithm:
-        intCheck = ~crc_8_table[headerBytes[6] ^ crc_8_table[headerBytes[5] ^
-                                crc_8_table[headerBytes[4] ^ crc_8_table[headerBytes[3] ^
-                                            crc_8_table[~headerBytes[2]]]]]] & (2**8-1)
-        return bytes([intCheck])
+        return checksum.headerCheckByte(headerBytes)
 
     def _dataCheckByte(self, dataBytes):
         '''
         Takes the full data byte array, bytes[8] through bytes[13] of the full
         command and calculates the data check byte using BacNET CRC-16.
         '''
-        # CRC-16 with 0xFFFF as initial value, 0x1021 as polynomial, bit reversed
-        crc_fun = crcmod.mkCrcFun(poly=0x11021, initCrc=0, rev=True, xorOut=0xFFFF)
-        # bytes object packed using C-type unsigned short, little-endian:
-        byte_str = struct.pack('<H', crc_fun(dataBytes))
-        return byte_str
+        return checksum.dataCheckByte(dataBytes)
 
     def _intDataParamToHex(self, dataParam):
         # Reformats data param from notation in the manual to hex string
@@ -201,73 +242,22 @@ class Watlow():
         '''
         Compares check bytes received in response to those calculated.
         '''
-        isValid = False
-        # Evaluate headerChk as bytearray instead of as an int (which is how
-        # python will interpret a single hex character)
-        headerChkReceived = bytearray([bytesResponse[7]])
-        dataCheckRecieved = bytesResponse[-2:]
-        addressReceived = bytesResponse[4] - 15
-        if (headerChkReceived == self._headerCheckByte(bytesResponse[0:7]) and
-                dataCheckRecieved == self._dataCheckByte(bytesResponse[8:-2]) and
-                addressReceived == self.address):
-            isValid = True
-        return isValid
+        return validResponse(bytesResponse, self.address)
+
+    def _parseReading(self, bytesResponse):
+        '''
+        Takes the full response byte array and returns a `Reading` with the
+        relevant data (e.g. current temperature) or the reason it couldn't be
+        read.
+        '''
+        return parseResponse(bytesResponse, self.address)
 
     def _parseResponse(self, bytesResponse):
         '''
         Takes the full response byte array and extracts the relevant data (e.g.
         current temperature), constructs response dict, and returns it.
         '''
-        output = {
-                    'address': self.address,
-                    'param': None,
-                    'data': None,
-                    'error': None
-                 }
-        try:
-            if bytesResponse == b'' or bytesResponse == bytearray(len(bytesResponse)):
-                raise Exception('Exception: No response from address {0}'.format(self.address))
-            if not self._validateResponse(bytesResponse):
-                print('Invalid Response at address {0}: '.format(self.address), hexlify(bytesResponse))
-                raise Exception('Exception: Invalid response received from address {0}'.format(self.address))
-        except Exception as e:
-            output['error'] = e
-            return output
-        else:
-            # Case where response data value is an int used to represent a state defined
-            # in the manual (e.g. param 8003, heat algorithm, where 62 means 'PID')
-            # from a read request
-            # Hex byte 7: '0a', Hex bytes 15, 16: 0F, 01
-            if bytesResponse[6] == 10 and bytesResponse[-6] == 15 and bytesResponse[-5] == 1:
-                data = bytesResponse[-4:-2]
-                output['param'] = self._byteDataParamToInt(bytesResponse[11:13])
-                output['data'] = int.from_bytes(data, byteorder='big')
-            # Case where response data value is a float from a set param request
-            # (e.g. 7001, process value setpoint)
-            # Hex byte 7: '0a', Hex byte 14: '08'
-            elif bytesResponse[6] == 10 and bytesResponse[-7] == 8:
-                ieee_754 = hexlify(bytesResponse[-6:-2])
-                output['data'] = struct.unpack('>f', unhexlify(ieee_754))[0]
-                output['param'] = self._byteDataParamToInt(bytesResponse[10:12])
-            # Case where response data value is an integer from a set param
-            # request (e.g. param 8003, heat algorithm, where 62 means 'PID')
-            # Hex byte 7: '09'
-            elif bytesResponse[6] == 9:
-                data = bytesResponse[-4:-2]
-                output['param'] = self._byteDataParamToInt(bytesResponse[10:12])
-                output['data'] = int.from_bytes(data, byteorder='big')
-            # Case where data value is a float representing a process value
-            # (e.g. 4001, where current temp of 50.0 is returned)
-            # Hex byte 7: '0b'
-            elif bytesResponse[6] == 11:
-                ieee_754 = bytesResponse[-6:-2]
-                output['param'] = self._byteDataParamToInt(bytesResponse[11:13])
-                output['data'] = struct.unpack('>f', ieee_754)[0]
-            # Other cases, such as response from trying to write a read-only parameter:
-            else:
-                output['error'] = Exception('Received a message that could not be parsed from address {0}'.format(self.address))
-
-            return output
+        return self._parseReading(bytesResponse).asDict()
 
     def read(self, instance='01'):
         '''
@@ -289,41 +279,98 @@ class Watlow():
         '''
         return self.readParam(7001, float, instance='01')
 
-    def readParam(self, param, data_type, instance='01'):
+    def readParam(self, param, data_type=None, instance='01'):
         '''
         Takes a parameter and writes data to the watlow controller at
-        object's internal address. Using this function requires knowing the data
-        type for the parameter (int or float). See the Watlow
+        object's internal address. See the Watlow
         `user manual <https://www.watlow.com/-/media/documents/user-manuals/pm-pid-1.ashx>`_
         for individual parameters and the Usage section of these docs.
 
         * **param**: a four digit integer corresponding to a Watlow parameter (e.g. 4001, 7001)
-        * **data_type**: the Python type representing the data value type (i.e. `int` or `float`)
+        * **data_type**: the Python type representing the data value type (i.e. `int` or `float`), optional
         * **instance**: a two digit string corresponding to the channel to read (e.g. '01', '05')
 
-        `data_type` is used to determine how many characters to read
-        following the controller's response. If `int` is passed when the data type
-        should be `float`, it will not read the entire message and will throw an
-        error. If `float` is passed when it should be `int`, it will timeout,
-        possibly reading correctly. If multiple instances of `Watlow()` are using
-        the same serial port for different controllers it will read too many
-        characters. It is best to be completely sure which data type is being used
-        by each parameter (`int` or `float`).
+        The data type is determined from the response, so `data_type` is not
+        needed and is only kept for compatibility. The response is read frame by
+        frame using the data length in its header, so the call returns as soon as
+        the controller's response is complete. Responses from other addresses on
+        a shared serial port are only read one frame at a time.
 
-        Returns a dict containing the response data, parameter ID, and address.
+        With a `cache`, a fresh cached reading is returned without a
+        transaction.
+
+        Returns a `Reading` containing the response data, parameter ID, and
+        address, which can also be used as a dict (see `pywatlow.reading`).
         '''
-        request = self._buildReadRequest(param, instance)
+        if self.cache is not None:
+            return self.cache.read(cacheKey(self.address, param, instance), lambda: self._readParam(param, data_type, instance))
+        return self._readParam(param, data_type, instance)
+
+    def _readParam(self, param, data_type, instance):
+        output = self._read(param, data_type, instance)
+        if self.writeFilter is not None and output.ok:
+            self.writeFilter.confirm(cacheKey(self.address, param, instance), output)
+        return output
+
+    # The framing of requests and responses is in `_read()`, `_write()`,
+    # `_readMany()` and `_writeMany()`, which other protocols override (see
+    # `pywatlow.modbus`)
+
+    def _read(self, param, data_type, instance):
+        # Reads one parameter and returns the `Reading`. The data type is
+        # taken from the response, `data_type` may be `None`
+        request = self.compiler.readRequest(self, param, instance)
         try:
-            self.serial.write(request)
+            response = self._transact(request)
         except Exception as e:
-            print('Exception: ', e)
-        else:
-            if data_type == float:
-                response = self.serial.read(21)
-            elif data_type == int:
-                response = self.serial.read(20)
-            output = self._parseResponse(response)
-            return output
+            return Reading(self.address, status=ERROR, exception=e)
+        return self._parseReading(response)
+
+    def _write(self, param, value, data_type, instance):
+        # Writes one parameter and returns the `Reading` of the response
+        request = self.compiler.writeRequest(self, param, value, data_type, instance)
+        try:
+            bytesResponse = self._transact(request)
+        except Exception as e:
+            return Reading(self.address, status=ERROR, exception=e)
+        return self._parseReading(bytesResponse)
+
+    def _readMany(self, specs):
+        # Reads the (param, data_type, instance) specs and returns a `Reading`
+        # for each
+        requests = [self.compiler.readRequest(self, param, instance) for param, data_type, instance in specs]
+        error = None
+        try:
+            responses = self._transactMany(requests)
+        except Exception as e:
+            responses, error = [], e
+        return self._batchOutputs(requests, responses, error)
+
+    def _writeMany(self, specs):
+        # Writes the (param, value, data_type, instance) specs and returns a
+        # `Reading` for each
+        requests = [self.compiler.writeRequest(self, param, value, data_type, instance)
+                    for param, value, data_type, instance in specs]
+        error = None
+        try:
+            responses = self._transactMany(requests)
+        except Exception as e:
+            responses, error = [], e
+        return self._batchOutputs(requests, responses, error)
+
+    def _confirm(self, param, instance, output):
+        # Records the value echoed by a write in the cache and write filter, or
+        # drops it if the write failed
+        if self.cache is not None:
+            self.cache.put(cacheKey(self.address, param, instance), output)
+        if self.writeFilter is not None:
+            self.writeFilter.confirm(cacheKey(self.address, param, instance), output)
+
+    def _redundantWrite(self, param, value, instance):
+        # Returns the confirmed reading if the write wouldn't change the value
+        if self.writeFilter is None:
+            return None
+        return self.writeFilter.redundant(cacheKey(self.address, param, instance), value)
 
     def write(self, value, instance='01'):
         '''
@@ -341,11 +388,9 @@ class Watlow():
         '''
         return self.writeParam(7001, value, float, instance)
 
-    def writeParam(self, param, value, data_type, instance='01'):
+    def writeParam(self, param, value, data_type=None, instance='01'):
         '''
-        Changes the value of the passed watlow parameter ID. Using this function
-        requires knowing the data type for the parameter (int or float).
-        See the Watlow
+        Changes the value of the passed watlow parameter ID. See the Watlow
         `user manual <https://www.watlow.com/-/media/documents/user-manuals/pm-pid-1.ashx>`_
         for individual parameters and the Usage section of these docs.
 
@@ -353,20 +398,74 @@ class Watlow():
         * **data_type**: the Python type representing the data value type (i.e. `int` or `float`)
         * **instance**: a two digit string corresponding to the channel to read (e.g. '01', '05')
 
-        `data_type` is used to determine how the BACnet TP/MS message will be constructed
-        and how many serial characters to read following the controller's response.
+        `data_type` is used to determine how the BACnet TP/MS message will be constructed.
+        If it isn't passed, it is looked up in the parameter catalog
+        (`pywatlow.params`), and `ValueError` is raised for parameters missing
+        from the catalog.
+
+        With a `writeFilter`, writing the value last confirmed by the
+        controller returns the confirmed reading without a transaction.
 
         Returns a dict containing the response data, parameter ID, and address.
         '''
-        request = self._buildWriteRequest(param, value, data_type, instance)
-        try:
-            self.serial.write(request)
-        except Exception as e:
-            print('Exception: ', e)
-        else:
-            if data_type == float:
-                bytesResponse = self.serial.read(20)
-            elif data_type == int:
-                bytesResponse = self.serial.read(19)
-            output = self._parseResponse(bytesResponse)
-            return output
+        data_type = catalog.dataType(param, data_type)
+        confirmed = self._redundantWrite(param, value, instance)
+        if confirmed is not None:
+            return confirmed
+        output = self._write(param, value, data_type, instance)
+        self._confirm(param, instance, output)
+        return output
+
+    def readParams(self, params):
+        '''
+        Reads several parameters in one batch. The requests are sent back to
+        back as soon as each response arrives.
+
+        * **params**: list of parameters, each a parameter ID (read from instance '01') or a tuple of
+          (param, data_type) or (param, data_type, instance)
+
+        If the controller doesn't respond at all, the rest of the batch is
+        skipped instead of waiting for the timeout once per parameter.
+
+        The whole batch is always read from the controller; with a `cache`,
+        the cached values are updated from the responses.
+
+        Returns a list of `Reading` objects like the one returned by
+        `readParam()`, in the same order as `params`.
+        '''
+        specs = [_paramSpec(spec) for spec in params]
+        outputs = self._readMany(specs)
+        for (param, data_type, instance), output in zip(specs, outputs):
+            if output.ok:
+                self._confirm(param, instance, output)
+        return outputs
+
+    def writeParams(self, values):
+        '''
+        Writes several parameters in one batch, in order.
+
+        * **values**: list of (param, value), (param, value, data_type) or (param, value, data_type, instance)
+          tuples. If `data_type` is missing or `None` it is looked up as in `writeParam()`
+
+        As with `readParams()`, the rest of the batch is skipped if the
+        controller doesn't respond at all. Writes skipped by the `writeFilter`
+        aren't sent.
+
+        Returns a list of `Reading` objects like the one returned by
+        `writeParam()`, in the same order as `values`.
+        '''
+        outputs = []
+        specs = []
+        for spec in values:
+            param, value = spec[0], spec[1]
+            data_type = catalog.dataType(param, spec[2] if len(spec) > 2 else None)
+            instance = spec[3] if len(spec) > 3 else '01'
+            confirmed = self._redundantWrite(param, value, instance)
+            outputs.append(confirmed)
+            if confirmed is None:
+                specs.append((param, value, data_type, instance))
+        written = self._writeMany(specs) if specs else []
+        for (param, value, data_type, instance), output in zip(specs, written):
+            self._confirm(param, instance, output)
+        written = iter(written)
+        return [next(written) if output is None else output for output in outputs]
@@ -0,0 +1,303 @@
+'''
+Reducing the bus time spent on writes.
+
+`WriteFilter` skips writes of the value a controller already has: the last
+value confirmed by the controller (echoed by a write or returned by a read) is
+kept per (address, param, instance), and writing the same value again, within
+`epsilon`, returns the confirmed reading without a transaction::
+
+    watlow = Watlow(port='COM5', address=1, writeFilter=WriteFilter(epsilon=0.05))
+    watlow.write(60.0)   # written
+    watlow.write(60.0)   # skipped
+
+`WriteCoalescer` collects writes and sends only the latest value of each
+parameter when flushed, and `WriteBehind` sends writes from a background
+thread, returning a `concurrent.futures.Future` for each.
+'''
+import itertools
+import queue
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from pywatlow import params as catalog
+from pywatlow.cache import cacheKey
+
+_float32 = struct.Struct('>f')
+
+
+def _asFloat32(value):
+    # Floats are sent and echoed as 32 bit floats
+    return _float32.unpack(_float32.pack(value))[0]
+
+
+class WriteFilter():
+    '''
+    Skips writes of values equal to the last value confirmed by the
+    controller.
+
+    * **epsilon** (float): largest difference between float values that counts as equal
+    * **epsilons** (dict): `epsilon` by parameter ID
+    * **maxAge** (float): seconds after which a confirmed value is written again anyway (e.g. in case it was
+      changed on the controller's front panel), `None` to keep it until the next read or write
+    * **clock**: function returning the time in seconds
+
+    Float values are compared after rounding to the 32 bit floats the
+    controller stores, so the default `epsilon` of 0 only skips writes of
+    exactly the confirmed value.
+    '''
+    def __init__(self, epsilon=0.0, epsilons=None, maxAge=10.0, clock=time.monotonic):
+        self.epsilon = epsilon
+        self.epsilons = dict(epsilons or {})
+        self.maxAge = maxAge
+        self.clock = clock
+        self.suppressed = 0
+        self.passed = 0
+        self._confirmed = {}
+        self._lock = threading.Lock()
+
+    def redundant(self, key, value):
+        '''
+        Returns the confirmed `Reading` for `key` if writing `value` would not
+        change it, otherwise `None`. `key` is a `pywatlow.cache.cacheKey()`.
+        '''
+        entry = self._confirmed.get(key)
+        if entry is not None and (self.maxAge is None or self.clock() - entry[0] <= self.maxAge):
+            reading = entry[1]
+            if isinstance(reading.value, float):
+                same = abs(_asFloat32(float(value)) - reading.value) <= self.epsilons.get(key[1], self.epsilon)
+            else:
+                same = int(value) == reading.value
+            if same:
+                self.suppressed += 1
+                return reading
+        self.passed += 1
+        return None
+
+    def confirm(self, key, reading):
+        '''
+        Records the value of a reading from the controller, or forgets the
+        value for `key` if the reading failed.
+        '''
+        with self._lock:
+            if reading.ok:
+                self._confirmed[key] = (self.clock(), reading)
+            else:
+                self._confirmed.pop(key, None)
+
+    def forget(self, key=None):
+        '''
+        Forgets the confirmed value for `key`, or all of them, so the next
+        write is sent.
+        '''
+        with self._lock:
+            if key is None:
+                self._confirmed.clear()
+            else:
+                self._confirmed.pop(key, None)
+
+    def stats(self):
+        return {'suppressed': self.suppressed, 'passed': self.passed, 'confirmed': len(self._confirmed)}
+
+
+class WriteCoalescer():
+    '''
+    Collects writes to the controllers on `bus` (a `WatlowBus`) and sends
+    them when `flush()` is called. A write replaces any pending write to the
+    same (address, param, instance), so only the latest value is sent.
+
+    Can be used from several threads, e.g. with control loops calling
+    `write()` on every tick and another thread calling `flush()` whenever the
+    bus has time.
+    '''
+    def __init__(self, bus):
+        self.bus = bus
+        self.coalesced = 0
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def write(self, address, param, value, data_type=None, instance='01'):
+        '''
+        Queues a write, replacing the pending write to the same parameter if
+        there is one.
+        '''
+        key = cacheKey(address, param, instance)
+        with self._lock:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (param, value, data_type, instance)
+
+    def flush(self):
+        '''
+        Sends the pending writes, one `writeParams()` batch per address, and
+        returns the list of `Reading` objects from the responses.
+        '''
+        with self._lock:
+            pending = self._pending
+            self._pending = OrderedDict()
+        batches = OrderedDict()
+        for key, spec in pending.items():
+            batches.setdefault(key[0], []).append(spec)
+        outputs = []
+        for address, specs in batches.items():
+            outputs.extend(self.bus[address].writeParams(specs))
+        return outputs
+
+
+class WriteBehind():
+    '''
+    Sends writes to the controllers on `bus` (a `WatlowBus`) from a
+    background thread, so callers don't wait for the responses.
+
+    * **bus**: `WatlowBus` the controllers are on
+    * **maxsize** (int): largest number of pending writes
+    * **block** (bool): when the queue is full, wait for room instead of raising `queue.Full` right away
+    * **timeout** (float): longest wait for room in seconds when `block` is set, `None` to wait as long as it takes
+    * **coalesce** (bool): a write replaces the pending write to the same (address, param, instance)
+
+    `writeParam()` returns a `concurrent.futures.Future` resolved with the
+    `Reading` from the controller's response. Writes to one address are sent
+    in the order they were queued, as `writeParams()` batches of up to
+    `batchSize`, and other threads' transactions on the bus run between the
+    batches. A replaced write's future is resolved with the reading of the
+    write that replaced it. Usually created through `WatlowBus.writeBehind()`.
+    '''
+    batchSize = 16
+
+    def __init__(self, bus, maxsize=64, block=True, timeout=None, coalesce=False):
+        self.bus = bus
+        self.maxsize = maxsize
+        self.block = block
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self.written = 0
+        self.coalesced = 0
+        self.rejected = 0
+        # Pending writes in order, keyed by cache key if coalescing or by a
+        # sequence number, as [address, spec, futures]
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._sending = False
+        self.thread = threading.Thread(target=self._run, name='pywatlow-write-behind', daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def writeParam(self, address, param, value, data_type=None, instance='01'):
+        '''
+        Queues a write and returns its `Future`. Raises `queue.Full` if the
+        queue stays full (see `block` and `timeout`) and `ValueError` if the
+        data type of `param` is unknown.
+        '''
+        spec = (param, value, catalog.dataType(param, data_type), instance)
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('WriteBehind is closed')
+            key = cacheKey(address, param, instance) if self.coalesce else next(self._seq)
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                if not self._condition.wait_for(self._hasRoom, self.timeout if self.block else 0):
+                    self.rejected += 1
+                    raise queue.Full('{0} writes pending'.format(len(self._pending)))
+                if self._closed:
+                    raise RuntimeError('WriteBehind is closed')
+                # Another caller may have queued a write to the same key while
+                # this one waited for room
+                entry = self._pending.pop(key, None)
+            if entry is not None:
+                self.coalesced += 1
+                entry[1] = spec
+                entry[2].append(future)
+            else:
+                entry = [address, spec, [future]]
+            # A replaced write moves to the end so writes stay in order
+            self._pending[key] = entry
+            self._condition.notify_all()
+        return future
+
+    def _hasRoom(self):
+        return len(self._pending) < self.maxsize or self._closed
+
+    def _take(self):
+        # Removes and returns the oldest pending write's address and the
+        # pending writes to that address, in order
+        address = next(iter(self._pending.values()))[0]
+        batch = []
+        for key, entry in list(self._pending.items()):
+            if entry[0] == address:
+                batch.append(self._pending.pop(key))
+                if len(batch) == self.batchSize:
+                    break
+        self._condition.notify_all()
+        return address, batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                address, batch = self._take()
+                self._sending = True
+            try:
+                self._send(address, batch)
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, address, batch):
+        batch = [entry for entry in batch if any([future.set_running_or_notify_cancel() for future in entry[2]])]
+        if not batch:
+            return
+        try:
+            outputs = self.bus[address].writeParams([entry[1] for entry in batch])
+        except Exception as e:
+            outputs = None
+            error = e
+        for index, entry in enumerate(batch):
+            for future in entry[2]:
+                if not future.running():
+                    continue
+                if outputs is None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(outputs[index])
+        if outputs is not None:
+            self.written += len(outputs)
+
+    def flush(self, timeout=None):
+        '''
+        Waits until all pending writes have been sent. Returns False if some
+        are still pending after `timeout` seconds.
+        '''
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._sending, timeout)
+
+    def close(self, wait=True):
+        '''
+        Stops the background thread, after sending the pending writes if
+        `wait` is set, otherwise cancelling them.
+        '''
+        with self._condition:
+            self._closed = True
+            if not wait:
+                for entry in self._pending.values():
+                    for future in entry[2]:
+                        future.cancel()
+                self._pending.clear()
+            self._condition.notify_all()
+        self.thread.join()
+
+    def stats(self):
+        return {'pending': len(self._pending), 'written': self.written, 'coalesced': self.coalesced,
+                'rejected': self.rejected}
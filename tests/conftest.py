@@ -0,0 +1,120 @@
+'''
+Fakes and fixtures shared by the test modules.
+
+The fixtures return the fake classes and builders rather than instances, so a
+test can make as many as it needs with its own arguments.
+'''
+import struct
+import time
+
+import pytest
+
+from pywatlow import checksum
+from pywatlow.simulator import SimulatedBus
+from pywatlow.simulator import SimulatedController
+
+
+def makeFloatResponse(address, value, param=4001, instance=1):
+    '''
+    Builds a response to a read request for a float parameter
+    '''
+    header = bytes([0x55, 0xff, 0x06, 0x00, address + 15, 0x00, 0x0b])
+    data = bytes([0x02, 0x03, 0x01, param // 1000, param % 1000, instance, 0x08]) + struct.pack('>f', value)
+    return header + checksum.headerCheckByte(header) + data + checksum.dataCheckByte(data)
+
+
+class FakeSerial:
+    '''
+    Serial stand-in that returns scripted bytes and records reads
+    '''
+    def __init__(self, data=b'', timeout=0.5):
+        self.port = None
+        self.timeout = timeout
+        self.data = bytearray(data)
+        self.reads = []
+        self.written = bytearray()
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+    def read(self, size=1):
+        self.reads.append(size)
+        chunk = bytes(self.data[:size])
+        del self.data[:size]
+        return chunk
+
+
+class ResponderSerial:
+    '''
+    Serial stand-in that answers each read request with the zone's address
+    as the value, after `delay` seconds like a real bus would
+    '''
+    def __init__(self, stale=b'', port=None, delay=0):
+        self.port = port
+        self.timeout = 0.05
+        self.delay = delay
+        self.buffer = bytearray(stale)
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        address = data[3] - 15
+        self.buffer += makeFloatResponse(address, float(address), data[11] * 1000 + data[12], data[13])
+        return len(data)
+
+    def read(self, size=1):
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Clock:
+    '''
+    Clock stand-in whose time only changes when `now` is set
+    '''
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def makeSimulatedBus(addresses=(1,), **kwargs):
+    '''
+    Returns a `SimulatedBus` with a controller at each of `addresses`, all
+    holding the same process value, setpoint and heat algorithm
+    '''
+    return SimulatedBus([SimulatedController(address, {4001: 72.5, 7001: 75.0, 8003: 71}) for address in addresses],
+                        **kwargs)
+
+
+@pytest.fixture
+def floatResponse():
+    return makeFloatResponse
+
+
+@pytest.fixture
+def fakeSerial():
+    return FakeSerial
+
+
+@pytest.fixture
+def responderSerial():
+    return ResponderSerial
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def simulatedBus():
+    return makeSimulatedBus
@@ -0,0 +1,130 @@
+import asyncio
+import socket
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.aio import AsyncWatlow
+from pywatlow.aio import AsyncWatlowBus
+from pywatlow.frames import FrameDecoder
+
+
+async def controllers(reader, writer, floatResponse, silent=(), delay=0.001):
+    '''
+    Loopback stand-in for a bus of controllers answering reads with their
+    address as the value. Addresses in `silent` never answer.
+    '''
+    decoder = FrameDecoder()
+    while True:
+        chunk = await reader.read(decoder.needed())
+        if not chunk:
+            return
+        decoder.feed(chunk)
+        request = decoder.decode()
+        if request is None:
+            continue
+        address = request[3] - 15
+        if address in silent:
+            continue
+        await asyncio.sleep(delay)
+        writer.write(floatResponse(address, float(address), request[11] * 1000 + request[12], request[13]))
+        await writer.drain()
+
+
+@pytest.fixture
+def runWithBus(floatResponse):
+    '''
+    Returns a function running the coroutine function `test` on an
+    `AsyncWatlowBus` connected to `controllers()`
+    '''
+    def run(test, **kwargs):
+        async def main():
+            clientSock, serverSock = socket.socketpair()
+            reader, writer = await asyncio.open_connection(sock=clientSock)
+            serverReader, serverWriter = await asyncio.open_connection(sock=serverSock)
+            server = asyncio.ensure_future(controllers(serverReader, serverWriter, floatResponse, **kwargs))
+            bus = AsyncWatlowBus(reader, writer, timeout=0.2)
+            try:
+                return await test(bus)
+            finally:
+                server.cancel()
+                await bus.close()
+                serverWriter.close()
+        # asyncio.run() needs Python 3.7
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(main())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+    return run
+
+
+class TestAsyncWatlow:
+    '''
+    Test suite for AsyncWatlowBus and AsyncWatlow over a socket loopback
+    '''
+
+    def test_read(self, runWithBus):
+        async def test(bus):
+            assert isinstance(bus[4], AsyncWatlow)
+            return await bus[4].read()
+        output = runWithBus(test)
+        assert output['data'] == 4.0
+        assert output['address'] == 4
+        assert output['error'] is None
+
+    def test_gather(self, runWithBus):
+        '''
+        Tests that many concurrent reads are serialized on the bus and each
+        gets its own controller's response
+        '''
+        async def test(bus):
+            return await asyncio.gather(*[bus[address % 16 + 1].read() for address in range(200)])
+        outputs = runWithBus(test)
+        assert [output['data'] for output in outputs] == [float(address % 16 + 1) for address in range(200)]
+
+    def test_timeout_and_cancel(self, runWithBus):
+        '''
+        Tests per-call timeouts on a silent address and that the bus keeps
+        working after a read is cancelled mid-transaction
+        '''
+        async def test(bus):
+            loop = asyncio.get_event_loop()
+            start = loop.time()
+            silent = await bus[3].read(timeout=0.05)
+            elapsed = loop.time() - start
+            pending = asyncio.ensure_future(bus[2].read())
+            await asyncio.sleep(0)
+            pending.cancel()
+            try:
+                await pending
+            except asyncio.CancelledError:
+                pass
+            return silent, elapsed, await bus[5].read(), pending.cancelled()
+        silent, elapsed, output, cancelled = runWithBus(test, silent=(3,), delay=0.01)
+        assert silent['error'] is not None
+        assert elapsed < 0.15
+        assert cancelled
+        assert output['data'] == 5.0
+
+    def test_late_response(self, runWithBus):
+        '''
+        Tests that a late response from the same address isn't returned as the
+        response to the next request
+        '''
+        async def test(bus):
+            late = await bus[4].readParam(4001, timeout=0.05)
+            return late, await bus[4].readParam(7001, timeout=0.3), bus.mismatched
+        late, output, mismatched = runWithBus(test, delay=0.1)
+        assert late['error'] is not None
+        assert (output.param, output.value) == (7001, 4.0)
+        assert mismatched == 1
+
+    def test_batches(self, runWithBus):
+        async def test(bus):
+            return await bus[2].readParams([4001, (7001, float, '02')]), await bus[3].readParams([4001, 7001])
+        outputs, silent = runWithBus(test, silent=(3,))
+        assert [(output.param, output.instance, output.value) for output in outputs] == [(4001, 1, 2.0), (7001, 2, 2.0)]
+        assert [output.status for output in silent] == [reading.NO_RESPONSE, reading.SKIPPED]
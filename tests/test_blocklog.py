@@ -0,0 +1,139 @@
+import math
+import os
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.blocklog import FILE_HEADER
+from pywatlow.blocklog import FLOAT
+from pywatlow.blocklog import INT
+from pywatlow.blocklog import NONE
+from pywatlow.blocklog import ReadingLog
+from pywatlow.blocklog import blockSize
+from pywatlow.bus import WatlowBus
+from pywatlow.poller import Poller
+from pywatlow.reading import Reading
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'readings.pwl')
+
+
+def write(path, count, blockSize=10, **kwargs):
+    log = ReadingLog.create(path, blockSize=blockSize, **kwargs)
+    for n in range(count):
+        log.add(1 + n % 2, 4001, '01', Reading(1 + n % 2, 4001, 1, n / 2.0, timestamp=100.0 + n))
+    return log
+
+
+class TestReadingLog:
+    '''
+    Test suite for the columnar ReadingLog
+    '''
+
+    def test_blocks(self, path):
+        log = write(path, 25)
+        assert log.written == 20
+        assert len(log) == 25
+        log.add(3, 8003, '01', Reading(3, 8003, 1, 71, timestamp=200.0))
+        log.add(4, 4001, '02', Reading(4, status=reading.NO_RESPONSE, timestamp=201.0))
+        log.close()
+        assert os.path.getsize(path) == FILE_HEADER.size + 2 * blockSize(10) + blockSize(7)
+        log = ReadingLog.open(path)
+        assert len(log) == 27
+        assert [(first, last) for offset, count, first, last in log.blocks()] == [
+            (100.0, 109.0), (110.0, 119.0), (120.0, 201.0)]
+        assert len(log.blocks(start=112.0, end=115.0)) == 1
+        columns = list(log.blockColumns(start=112.0, end=115.0))[0]
+        assert list(columns['timestamp'])[:3] == [110.0, 111.0, 112.0]
+        assert list(columns['address'])[:3] == [1, 2, 1]
+        log.close()
+
+    def test_columns(self, path):
+        pytest.importorskip('numpy')
+        log = write(path, 25)
+        log.add(3, 8003, '01', Reading(3, 8003, 1, 71, timestamp=200.0))
+        log.add(4, 4001, '02', Reading(4, status=reading.NO_RESPONSE, timestamp=201.0))
+        log.close()
+        log = ReadingLog.open(path)
+        columns = log.columns()
+        assert len(columns['timestamp']) == 27
+        assert list(columns['value'][:3]) == [0.0, 0.5, 1.0]
+        assert list(columns['valueType'][-3:]) == [FLOAT, INT, NONE]
+        assert list(columns['instance'][-2:]) == [1, 2]
+        assert columns['status'][-1] == reading.NO_RESPONSE
+        assert math.isnan(columns['value'][-1])
+        columns = log.columns(start=105.0, end=112.0)
+        assert list(columns['timestamp']) == [105.0 + n for n in range(7)]
+        assert list(columns['param']) == [4001] * 7
+        assert len(log.columns(start=300.0)['value']) == 0
+
+    def test_append_and_recover(self, path):
+        write(path, 10).close()
+        write(path, 5).close()
+        # Lose the index of the second session
+        with open(path + '.idx', 'r+b') as fh:
+            fh.truncate(fh.seek(0, os.SEEK_END) // 2)
+        # and half of a block written when the process died
+        with open(path, 'ab') as fh:
+            fh.write(b'PWRB\x0a')
+        log = ReadingLog.open(path)
+        assert [count for offset, count, first, last in log.blocks()] == [10, 5]
+        log.close()
+        with open(path, 'wb') as fh:
+            fh.write(b'not a log')
+        with pytest.raises(ValueError):
+            ReadingLog.open(path)
+
+    def test_torn_block(self, path):
+        write(path, 10).close()
+        # The start of a block of 10 readings, cut off by a crash
+        with open(path, 'rb') as fh:
+            fh.seek(-blockSize(10), os.SEEK_END)
+            torn = fh.read(blockSize(10) // 2)
+        with open(path, 'ab') as fh:
+            fh.write(torn)
+        write(path, 30).close()
+        log = ReadingLog.open(path)
+        assert len(log) == 40
+        assert os.path.getsize(path) == FILE_HEADER.size + 4 * blockSize(10)
+        columns = [list(block['value']) for block in log.blockColumns()]
+        assert columns[1] == columns[0] == [n / 2.0 for n in range(10)]
+        log.close()
+        # A torn block followed by more blocks isn't taken as complete
+        with open(path, 'r+b') as fh:
+            data = fh.read()
+            fh.seek(FILE_HEADER.size + blockSize(10))
+            fh.write(torn + data[FILE_HEADER.size + blockSize(10):])
+        os.unlink(path + '.idx')
+        log = ReadingLog.open(path)
+        assert len(log) == 10
+        log.close()
+
+    def test_fsync(self, path, clock):
+        log = write(path, 30, fsyncInterval=5.0, clock=clock)
+        assert log.syncs == 0
+        clock.now = 5.0
+        for n in range(10):
+            log.add(1, 4001, '01', Reading(1, 4001, 1, 1.0, timestamp=300.0 + n))
+        assert log.syncs == 1
+        # The readings before the interval ran out were written
+        assert log.written == 31
+        log.close()
+        assert log.syncs == 2
+        assert log.written == 40
+
+    def test_poller(self, path, responderSerial):
+        log = ReadingLog.create(path, blockSize=4)
+        bus = WatlowBus(serial=responderSerial())
+        poller = Poller({bus: {1: [4001], 2: [4001]}}, log=log)
+        with poller:
+            for count, output in enumerate(poller.readings()):
+                if count == 10:
+                    break
+        log.close()
+        log = ReadingLog.open(path)
+        assert len(log) >= 10
+        columns = next(log.blockColumns())
+        assert set(columns['value']) == {1.0, 2.0}
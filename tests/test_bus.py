@@ -0,0 +1,87 @@
+import threading
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.bus import WatlowHandle
+from pywatlow.cache import ReadCache
+
+
+class TestWatlowBus:
+    '''
+    Test suite for WatlowBus and its handles
+    '''
+
+    def test_handles(self, responderSerial):
+        bus = WatlowBus(serial=responderSerial())
+        assert bus[3] is bus.watlow(3)
+        assert isinstance(bus[3], WatlowHandle)
+        assert bus[3].serial is bus.serial
+        output = bus[3].read()
+        assert output['address'] == 3
+        assert output['data'] == 3.0
+        assert output['error'] is None
+
+    def test_stale_response(self, responderSerial, floatResponse):
+        '''
+        Tests that a late response from another address is dropped rather
+        than returned to the wrong handle
+        '''
+        bus = WatlowBus(serial=responderSerial(stale=floatResponse(5, 99.0)))
+        output = bus[2].read()
+        assert output['data'] == 2.0
+        assert output['error'] is None
+        assert bus.mismatched == 1
+
+    def test_late_response(self, simulatedBus):
+        '''
+        Tests that a late response from the same address, to a request that
+        timed out, isn't returned as the response to the next request
+        '''
+        serial = simulatedBus(timeout=0.1)
+        serial.controllers[1].turnaround = 0.15
+        bus = WatlowBus(serial=serial, timeout=0.1, adaptive=False, clock=serial.now, cache=ReadCache(10.0))
+        assert bus[1].readParam(4001).status == reading.NO_RESPONSE
+        bus.timeout = 0.5
+        output = bus[1].readParam(7001)
+        assert (output.param, output.value) == (7001, 75.0)
+        assert bus.mismatched == 1
+        assert bus.cache.get((1, 7001, 1)).value == 75.0
+
+    def test_threads(self, responderSerial):
+        '''
+        Tests that concurrent reads from 16 threads never see each other's
+        responses
+        '''
+        bus = WatlowBus(serial=responderSerial())
+        errors = []
+
+        def poll(address):
+            for _ in range(50):
+                output = bus[address].read()
+                if output['data'] != float(address) or output['error'] is not None:
+                    errors.append(output)
+
+        threads = [threading.Thread(target=poll, args=(address,)) for address in range(1, 17)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+
+    def test_readParams(self, responderSerial):
+        '''
+        Tests batch reads, and that a batch to an address that doesn't respond
+        stops after the first timeout
+        '''
+        serial = responderSerial()
+        bus = WatlowBus(serial=serial)
+        outputs = bus[7].readParams([4001, (4001, float), (4001, float, '01')])
+        assert [output['data'] for output in outputs] == [7.0, 7.0, 7.0]
+
+        written = []
+        serial.write = lambda data: written.append(data) or len(data)
+        outputs = bus[7].readParams([4001, 7001, (8003, int)])
+        assert len(written) == 1
+        assert len(outputs) == 3
+        assert all(output['error'] is not None for output in outputs)
+        assert all(output['address'] == 7 for output in outputs)
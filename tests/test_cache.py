@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from pywatlow.bus import WatlowBus
+from pywatlow.cache import ReadCache
+from pywatlow.cache import cacheKey
+from pywatlow.watlow import Watlow
+
+
+@pytest.fixture
+def cachedWatlow(simulatedBus, clock):
+    '''
+    Returns a function making a `Watlow` on a simulated bus with a
+    `ReadCache` on the `clock` fixture
+    '''
+    def make(**kwargs):
+        simulated = simulatedBus()
+        cache = ReadCache(clock=clock, **kwargs)
+        return simulated, clock, Watlow(serial=simulated, address=1, cache=cache)
+    return make
+
+
+class TestReadCache:
+    '''
+    Test suite for ReadCache and its use by Watlow
+    '''
+
+    def test_ttl(self, cachedWatlow):
+        simulated, clock, watlow = cachedWatlow(ttl=1.0, ttls={4001: 0.1})
+        assert watlow.readSetpoint()['data'] == 75.0
+        assert watlow.readSetpoint()['data'] == 75.0
+        assert watlow.read()['data'] == 72.5
+        assert simulated.requests == 2
+        clock.now = 0.5
+        watlow.readSetpoint()
+        watlow.read()
+        assert simulated.requests == 3
+        clock.now = 1.5
+        watlow.readSetpoint()
+        assert simulated.requests == 4
+        stats = watlow.cache.stats()
+        assert (stats['hits'], stats['misses']) == (2, 4)
+        assert stats['entries'] == 2
+
+    def test_write_through(self, cachedWatlow):
+        '''
+        Tests that writes update the cached value from the echoed response
+        and failed writes drop it
+        '''
+        simulated, clock, watlow = cachedWatlow()
+        watlow.readSetpoint()
+        assert watlow.write(81.5)['data'] == 81.5
+        assert watlow.readSetpoint()['data'] == 81.5
+        watlow.writeParams([(8003, 62)])
+        assert watlow.readParam(8003)['data'] == 62
+        assert simulated.requests == 3
+        simulated.silent.add(1)
+        assert watlow.write(90.0)['error'] is not None
+        assert watlow.cache.get(cacheKey(1, 7001)) is None
+        assert watlow.readSetpoint()['error'] is not None
+
+    def test_errors_not_cached(self, cachedWatlow):
+        simulated, clock, watlow = cachedWatlow()
+        simulated.inject(1, 'crc')
+        assert watlow.read()['error'] is not None
+        assert watlow.read()['data'] == 72.5
+        assert simulated.requests == 2
+
+    def test_stale_while_refresh(self, cachedWatlow):
+        simulated, clock, watlow = cachedWatlow(ttl=1.0, stale=True)
+        watlow.readSetpoint()
+        simulated.controllers[1].set(7001, 60.0)
+        clock.now = 2.0
+        assert watlow.readSetpoint()['data'] == 75.0
+        for _ in range(100):
+            if watlow.cache.refreshes:
+                break
+            time.sleep(0.01)
+        assert watlow.readSetpoint()['data'] == 60.0
+        assert watlow.cache.stats()['staleHits'] == 1
+
+    def test_bus_handles(self, simulatedBus):
+        '''
+        Tests that handles on a bus share the bus's cache
+        '''
+        simulated = simulatedBus((1, 2))
+        bus = WatlowBus(serial=simulated, clock=simulated.now, cache=ReadCache())
+        bus[1].read()
+        bus[1].read()
+        bus[2].read()
+        assert simulated.requests == 2
+        bus.cache.invalidate(address=1)
+        bus[1].read()
+        assert simulated.requests == 3
@@ -0,0 +1,108 @@
+import math
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.capture import FLOAT
+from pywatlow.capture import INT
+from pywatlow.capture import RX
+from pywatlow.capture import TX
+from pywatlow.capture import CaptureLog
+from pywatlow.capture import CaptureSerial
+from pywatlow.reading import parseResponse
+from pywatlow.watlow import Watlow
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'bus.cap')
+
+
+def capture(path, simulated):
+    bus = WatlowBus(serial=simulated, clock=simulated.now, adaptive=False, capture=path)
+    bus[1].read()
+    bus[1].writeParam(7001, 60.5)
+    bus[1].writeParam(8003, 64)
+    bus[1].readParam(8003)
+    simulated.inject(2, 'crc')
+    bus[2].read()
+    simulated.silent.add(2)
+    bus[2].read()
+    bus.close()
+    return simulated
+
+
+class TestCapture:
+    '''
+    Test suite for CaptureSerial and CaptureLog
+    '''
+
+    def test_records(self, path, simulatedBus):
+        simulated = capture(path, simulatedBus((1, 2), timeout=0.05))
+        records = list(CaptureLog(path).records())
+        assert [record.direction for record in records] == [TX, RX] * 5 + [TX]
+        assert sum(len(record.frame) for record in records if record.direction == TX) == simulated.bytesWritten
+        assert sum(len(record.frame) for record in records if record.direction == RX) == simulated.bytesRead
+        assert parseResponse(records[1].frame, 1).value == 72.5
+        assert records[0].timestamp <= records[1].timestamp
+
+    def test_unflushed(self, path, simulatedBus):
+        '''
+        Tests that records are in the file as soon as they are captured, so
+        a crash doesn't lose them
+        '''
+        simulated = simulatedBus()
+        watlow = Watlow(serial=simulated, address=1, capture=path)
+        watlow.read()
+        assert len(CaptureLog(path)) == 2
+        watlow.read()
+        assert len(CaptureLog(path)) == 4
+        watlow.close()
+
+    def test_watlow(self, path, simulatedBus):
+        simulated = simulatedBus()
+        watlow = Watlow(serial=simulated, address=1, capture=path)
+        assert isinstance(watlow.serial, CaptureSerial)
+        watlow.read()
+        watlow.close()
+        # Appended to the same log
+        watlow = Watlow(serial=simulated, address=1, capture=path)
+        watlow.read()
+        watlow.close()
+        assert len(CaptureLog(path)) == 4
+
+    def test_decode(self, path, simulatedBus):
+        numpy = pytest.importorskip('numpy')
+        capture(path, simulatedBus((1, 2), timeout=0.05))
+        log = CaptureLog(path)
+        decoded = log.decode()
+        assert len(decoded) == 11
+        for record, row in zip(log.records(), decoded):
+            if record.direction == RX:
+                expected = parseResponse(record.frame, row['address'])
+                assert row['status'] == expected.status
+                if expected.ok:
+                    assert (row['param'], row['instance']) == (expected.param, expected.instance)
+                    assert row['value'] == expected.value
+                    assert row['valueType'] == (FLOAT if isinstance(expected.value, float) else INT)
+        requests = decoded[decoded['direction'] == TX]
+        assert list(requests['param'][:4]) == [4001, 7001, 8003, 8003]
+        assert list(requests['status'][:4]) == [reading.OK] * 4
+        assert requests['value'][1] == 60.5 and requests['value'][2] == 64
+        assert math.isnan(requests['value'][0])
+        responses = decoded[decoded['direction'] == RX]
+        assert list(responses['status']) == [reading.OK] * 4 + [reading.INVALID]
+        assert numpy.all(responses['address'] == [1, 1, 1, 1, 2])
+
+    def test_decode_many(self, path, simulatedBus):
+        pytest.importorskip('numpy')
+        capture(path, simulatedBus((1, 2), timeout=0.05))
+        with open(path, 'rb') as fh:
+            header = fh.read(16)
+            records = fh.read()
+        with open(path, 'wb') as fh:
+            fh.write(header + records * 1000)
+        decoded = CaptureLog(path).decode()
+        assert len(decoded) == 11000
+        assert (decoded['status'] == reading.OK).sum() == 10000
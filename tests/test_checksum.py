@@ -0,0 +1,43 @@
+from binascii import unhexlify
+
+from pywatlow import checksum
+
+# Actual responses received from Watlow controllers
+FRAMES = [
+    '55FF060010000B8802030104010108468F3638DD0E',
+    '55ff060011000b1002030104010108468f393a07ae',
+    '55FF06031100097702040803010F010047883B',
+    '55FF060011000AEE02040701010842A000001579',
+    '55FF0600110002170280FFB8',
+]
+
+
+def test_dataCheck_fallback():
+    '''
+    Tests that the pure Python CRC-16 matches the one in use (crcmod's C
+    extension when it is installed), including continued calculations
+    '''
+    for hexFrame in FRAMES:
+        data = unhexlify(hexFrame)[8:-2]
+        assert checksum._pyDataCheck(data) == checksum.dataCheck(data), hexFrame
+        assert checksum.dataCheck(memoryview(data)) == checksum.dataCheck(data), hexFrame
+        assert checksum.dataCheck(data[3:], checksum.dataCheck(data[:3])) == checksum.dataCheck(data), hexFrame
+        assert checksum._pyDataCheck(data[3:], checksum._pyDataCheck(data[:3])) == checksum.dataCheck(data), hexFrame
+        assert checksum.dataCheckByte(data) == unhexlify(hexFrame)[-2:], hexFrame
+
+
+def test_verifyFrames():
+    '''
+    Tests that the batch verification agrees with verifyFrame for valid and
+    corrupted frames
+    '''
+    frames = [unhexlify(hexFrame) for hexFrame in FRAMES]
+    frames += [
+        unhexlify('55ff060010000b8802030104010108468f3abe4356'),  # Incorrect dataChk
+        unhexlify('55FF060010000B8902030104010108468F3638DD0E'),  # Incorrect headerChk
+        b'\x55\xff\x06',  # Truncated
+    ]
+    expected = [True] * len(FRAMES) + [False, False, False]
+    assert checksum.verifyFrames(frames) == expected
+    assert [checksum.verifyFrame(frame) for frame in frames] == expected
+    assert checksum.verifyFrames([bytearray(frame) for frame in frames]) == expected
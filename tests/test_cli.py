@@ -0,0 +1,116 @@
+import argparse
+import io
+import json
+
+import pytest
+
+from pywatlow import cli
+from pywatlow.bus import WatlowBus
+
+
+@pytest.fixture
+def simulated(simulatedBus, monkeypatch):
+    '''
+    Returns a simulated bus of controllers 1 through 3, 3 silent, that the
+    app opens instead of a serial port
+    '''
+    simulated = simulatedBus((1, 2, 3))
+    simulated.silent.add(3)
+    monkeypatch.setattr(cli, 'openBus', lambda port, timeout: WatlowBus(serial=simulated, clock=simulated.now))
+    monkeypatch.setattr(cli.time, 'sleep', simulated.sleep)
+    return simulated
+
+
+class TestCli:
+    '''
+    Test suite for the command line app
+    '''
+
+    def test_parseAddresses(self):
+        assert cli.parseAddresses('1-4,7') == [1, 2, 3, 4, 7]
+        assert cli.parseAddresses('5') == [5]
+
+    def test_poll(self, simulated):
+        args = cli.parser.parse_args(['poll', '--port', 'COM5', '--addresses', '1-3', '--params', '4001,7001',
+                                      '--rate', '5', '--duration', '10'])
+        assert args.command == 'poll'
+        out = io.StringIO()
+        assert cli.poll(args, out) == 0
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert lines
+        ok = [line for line in lines if line['status'] == 'ok']
+        assert {(line['address'], line['param']) for line in ok} == {(1, 4001), (1, 7001), (2, 4001), (2, 7001)}
+        assert all(line['value'] == 72.5 for line in ok if line['param'] == 4001)
+        failed = [line for line in lines if line['address'] == 3]
+        assert failed and all(line['error'] for line in failed)
+        assert all(line['timestamp'] > 0 for line in lines)
+
+    def test_options(self):
+        assert isinstance(cli.parser.parse_args(['-r', 'COM5', '1', '4001']), argparse.Namespace)
+        for rate in ('0', '-1', 'nan'):
+            with pytest.raises(SystemExit):
+                cli.parser.parse_args(['poll', '--port', 'COM5', '--rate', rate])
+        for addresses in ('0-16', 'a', '3-1', '1,17'):
+            with pytest.raises(SystemExit):
+                cli.parser.parse_args(['poll', '--port', 'COM5', '--addresses', addresses])
+        for params in ('a', '4001,', '4001,-1'):
+            with pytest.raises(SystemExit):
+                cli.parser.parse_args(['poll', '--port', 'COM5', '--params', params])
+        args = cli.parser.parse_args(['poll', '--port', 'COM5'])
+        assert (args.addresses, args.params) == ([1], [4001])
+
+    def test_batch(self, simulated):
+        source = io.StringIO('\n'.join([
+            '# recipe',
+            'write,1,7001,60.5',
+            'write,2,7001,61',
+            'write,2,8003,62,int',
+            '{"op": "read", "address": 1, "param": 7001}',
+            'read,1,4001',
+            '',
+            'read,3,4001',
+            'read,3,7001',
+            'fetch,1,4001',
+        ]))
+        args = cli.parser.parse_args(['batch', '--port', 'COM5', '-'])
+        out, err = io.StringIO(), io.StringIO()
+        assert cli.batch(args, source, out, err) == 1
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [result['line'] for result in results] == [2, 3, 4, 5, 6, 8, 9, 10]
+        assert [result.get('value') for result in results[:5]] == [60.5, 61.0, 62, 60.5, 72.5]
+        assert all(result['status'] == 'ok' and result['latency_ms'] >= 0 for result in results[:5])
+        assert results[5]['status'] == 'no response'
+        assert results[6]['status'] == 'skipped'
+        assert results[7]['status'] == 'invalid'
+        assert simulated.controllers[2].get(8003) == 62
+        summary = json.loads(err.getvalue())
+        assert summary['operations'] == 7
+        assert summary['batches'] == 4
+        assert summary['errors'] == 3
+
+    def test_batch_invalid_lines(self, simulated):
+        lines = [
+            'read,17,4001',
+            '{"op": 1, "address": 1, "param": 4001}',
+            '{"op": "read", "address": [1], "param": 4001}',
+            '{"op": "read", "address": 1, "param": 4001, "data_type": ["int"]}',
+            '[1, 2]',
+            # Not in the catalog, so the data type must be given
+            'write,1,26099,5',
+            'read,1,4001,,,1',
+            '{"op": "read", "address": 1, "param": 4001, "instance": "0x1"}',
+            '{"op": "read", "address": 1, "param": 4001, "instance": 256}',
+            'read,1,4001',
+            '{"op": "read", "address": 1, "param": 4001, "instance": 1}',
+        ]
+        args = cli.parser.parse_args(['batch', '--port', 'COM5', '-'])
+        out, err = io.StringIO(), io.StringIO()
+        assert cli.batch(args, io.StringIO('\n'.join(lines)), out, err) == 1
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [result['status'] for result in results] == ['invalid'] * 9 + ['ok'] * 2
+        assert 'data_type' in results[5]['error']
+        assert all('instance' in result['error'] for result in results[6:9])
+        assert json.loads(err.getvalue())['errors'] == 9
+        assert cli.parseOperation('write,1,26099,5,float')[3:5] == (5.0, float)
+        assert cli.parseOperation('read,1,4001,,,0A')[5] == '0A'
+        assert cli.parseOperation('{"op": "read", "address": 1, "param": 4001, "instance": 10}')[5] == '0a'
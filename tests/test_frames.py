@@ -0,0 +1,114 @@
+from binascii import unhexlify
+
+from pywatlow.frames import FrameCompiler
+from pywatlow.frames import FrameDecoder
+from pywatlow.frames import readFrame
+from pywatlow.watlow import Watlow
+
+
+class TestFrameCompiler:
+    '''
+    Test suite for the FrameCompiler class
+    * Compiled frames are compared against the Watlow frame builders
+    '''
+
+    def test_readRequest(self):
+        '''
+        Tests that compiled read requests are byte-identical to
+        _buildReadRequest and are served from the cache on repeated calls
+        '''
+        compiler = FrameCompiler()
+        for address in (1, 2, 11, 16):
+            watlow = Watlow(serial=None, address=address)
+            for param in (4001, '4002', 7001, 8003, 26029, 34005):
+                for instance in ('01', '02'):
+                    expected = watlow._buildReadRequest(param, instance)
+                    assert compiler.readRequest(watlow, param, instance) == expected
+                    assert compiler.readRequest(watlow, param, instance) == expected
+
+        assert compiler.readRequest(Watlow(serial=None, address=2), 7001) == \
+            unhexlify('55ff0511000006610103010701018776')
+        stats = compiler.stats()
+        assert stats['misses'] == 48
+        assert stats['hits'] == 49
+
+    def test_writeRequest(self):
+        '''
+        Tests that compiled write requests are byte-identical to
+        _buildWriteRequest for float and int parameters
+        '''
+        compiler = FrameCompiler()
+        tests = [
+            # Test of form: dataParam, param values, value type
+            (7001, (81, 80, 78.5, -12.25, 9999.0), float),
+            ('4018', (0.0, 14.7), float),
+            (8003, (71, 62, 64), int),
+            (34029, (1539, 0, 65535), int),
+        ]
+        for address in (1, 2, 16):
+            watlow = Watlow(serial=None, address=address)
+            for param, values, data_type in tests:
+                for value in values:
+                    expected = watlow._buildWriteRequest(param, value, data_type, '01')
+                    assert compiler.writeRequest(watlow, param, value, data_type) == expected, (param, value, address)
+
+        assert compiler.writeRequest(Watlow(serial=None, address=1), 7001, 81, float) == \
+            unhexlify('55ff051000000aec01040701010842a20000c4b8')
+
+    def test_maxsize(self):
+        '''
+        Tests that the cache never grows past maxsize and counts evictions
+        '''
+        compiler = FrameCompiler(maxsize=4)
+        watlow = Watlow(serial=None)
+        for param in range(4001, 4011):
+            compiler.readRequest(watlow, param)
+        stats = compiler.stats()
+        assert stats['size'] == 4
+        assert stats['evictions'] == 6
+        assert stats['misses'] == 10
+
+        # The most recently used entries are the ones kept:
+        compiler.readRequest(watlow, 4010)
+        assert compiler.stats()['hits'] == 1
+
+
+class TestFrameDecoder:
+    '''
+    Test suite for FrameDecoder and readFrame
+    '''
+    response = unhexlify('55FF060010000B8802030104010108468F3638DD0E')
+    intResponse = unhexlify('55FF06031100097702040803010F010047883B')
+    errorResponse = unhexlify('55FF0600110002170280FFB8')
+
+    def test_decode(self):
+        '''
+        Tests that frames are split out of a stream with noise, fake preambles
+        and frames arriving a byte at a time
+        '''
+        stream = (b'\x00\x55\x13' + self.response + b'\x55\xff\x06\x00' + self.intResponse +
+                  self.errorResponse + b'\x55')
+        decoder = FrameDecoder()
+        frames = []
+        for byte in stream:
+            decoder.feed(bytes([byte]))
+            frame = decoder.decode()
+            if frame is not None:
+                frames.append(frame)
+        assert frames == [self.response, self.intResponse, self.errorResponse]
+        assert decoder.discarded == 7
+        assert decoder.pending == b'\x55'
+
+    def test_readFrame(self, fakeSerial):
+        '''
+        Tests that readFrame reads exactly one frame without waiting on the
+        timeout, and leaves the next frame on the port
+        '''
+        serial = fakeSerial(b'\xff\x00' + self.intResponse + self.response)
+        assert readFrame(serial) == self.intResponse
+        assert readFrame(serial) == self.response
+        assert serial.data == b''
+        # Nothing more to read: returns what was received
+        assert readFrame(serial) == b''
+        serial = fakeSerial(self.response[:12])
+        assert readFrame(serial) == self.response[:12]
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.gateway import NONE
+from pywatlow.gateway import READ
+from pywatlow.gateway import Gateway
+from pywatlow.gateway import GatewayClient
+from pywatlow.gateway import GatewayWatlow
+from pywatlow.gateway import parseAddress
+
+
+@pytest.fixture
+def simulatedGateway(simulatedBus):
+    '''
+    Returns a function starting a `Gateway` at `address` in front of a
+    simulated bus of controllers 1 and 2
+    '''
+    def start(address='localhost:0', realtime=False):
+        simulated = simulatedBus((1, 2), realtime=realtime)
+        gateway = Gateway(WatlowBus(serial=simulated, clock=simulated.now), address)
+        gateway.start()
+        return simulated, gateway
+    return start
+
+
+class TestGateway:
+    '''
+    Test suite for Gateway and GatewayClient
+    '''
+
+    def test_parseAddress(self):
+        assert parseAddress('localhost:5020') == ('localhost', 5020)
+        assert parseAddress(':5020') == ('localhost', 5020)
+        assert parseAddress('/tmp/watlow.sock') == '/tmp/watlow.sock'
+
+    def test_tcp(self, simulatedGateway):
+        simulated, gateway = simulatedGateway()
+        try:
+            client = GatewayClient(gateway.address)
+            assert isinstance(client[1], GatewayWatlow)
+            assert client[1].read() == {'address': 1, 'param': 4001, 'data': 72.5, 'error': None}
+            assert client[2].write(81.5)['data'] == 81.5
+            assert simulated.controllers[2].get(7001) == 81.5
+            assert client[2].writeParam(8003, 62)['data'] == 62
+            assert [output['data'] for output in client[1].readParams([4001, 7001])] == [72.5, 75.0]
+            output = client[1].writeParam(4001, 10.0)
+            assert output.status == reading.UNPARSEABLE
+            with pytest.raises(ValueError):
+                client[1].writeParam(12345, 1)
+            client.close()
+        finally:
+            gateway.shutdown()
+        output = client[1].read()
+        assert output.status == reading.ERROR
+
+    def test_coalesced_error(self, simulatedBus):
+        '''
+        Tests that reads waiting on another client's read get its error
+        '''
+        gateway = Gateway(WatlowBus(serial=simulatedBus()), 'localhost:0')
+        outputs = []
+
+        def fail(*args):
+            while not gateway.coalesced:
+                time.sleep(0.001)
+            raise RuntimeError('port closed')
+        gateway.bus[1].readParam = fail
+        threads = [threading.Thread(target=lambda: outputs.append(gateway.handle(READ, 1, 4001, 1, NONE, 0)))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gateway.server.server_close()
+        assert [output.status for output in outputs] == [reading.ERROR] * 2
+        assert all('port closed' in str(output.error) for output in outputs)
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='Unix sockets')
+    def test_unix_path(self, simulatedBus, tmp_path):
+        '''
+        Tests that a file that isn't a socket isn't replaced by the gateway's
+        socket
+        '''
+        path = tmp_path / 'data.csv'
+        path.write_text('keep')
+        with pytest.raises(ValueError):
+            Gateway(WatlowBus(serial=simulatedBus()), str(path))
+        assert path.read_text() == 'keep'
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='Unix sockets')
+    def test_unix_coalescing(self, simulatedGateway, tmp_path):
+        '''
+        Tests that concurrent identical reads from several clients share bus
+        transactions
+        '''
+        path = str(tmp_path / 'watlow.sock')
+        simulated, gateway = simulatedGateway(path, realtime=True)
+        try:
+            clients = [GatewayClient(path) for _ in range(8)]
+            outputs = []
+
+            def poll(client):
+                for _ in range(5):
+                    outputs.append(client[1].read())
+
+            threads = [threading.Thread(target=poll, args=(client,)) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(outputs) == 40
+            assert all(output['data'] == 72.5 for output in outputs)
+            stats = gateway.stats()
+            assert stats['requests'] == 40
+            assert stats['coalesced'] > 0
+            assert stats['transactions'] + stats['coalesced'] == 40
+            assert simulated.requests == stats['transactions']
+        finally:
+            gateway.shutdown()
+        assert not os.path.exists(path)
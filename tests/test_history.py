@@ -0,0 +1,91 @@
+import math
+import time
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.history import History
+from pywatlow.history import RingBuffer
+from pywatlow.poller import Poller
+from pywatlow.reading import Reading
+
+
+def fill(history, count, step=0.25, start=1000.0):
+    for n in range(count):
+        history.add(1, 4001, '01', Reading(1, 4001, 1, float(n), timestamp=start + n * step))
+
+
+class TestHistory:
+    '''
+    Test suite for the ring buffer History
+    '''
+
+    def test_ring_buffer(self):
+        ring = RingBuffer(4)
+        assert len(ring.view()) == 0
+        for n in range(10):
+            ring.append(n)
+        assert list(ring.view()) == [6, 7, 8, 9]
+        assert list(ring.view(1, 3)) == [7, 8]
+        assert list(ring.view(-2)) == [8, 9]
+        ring.replace(10)
+        assert ring.last() == 10
+        with pytest.raises(ValueError):
+            RingBuffer(0)
+
+    def test_raw(self):
+        history = History(capacity=8)
+        fill(history, 20)
+        times, values = history.raw(1, 4001)
+        assert list(values) == [float(n) for n in range(12, 20)]
+        times, values = history.raw(1, 4001, start=1003.5, end=1004.5)
+        assert list(times) == [1003.5, 1003.75, 1004.0, 1004.25]
+        assert list(values) == [14.0, 15.0, 16.0, 17.0]
+        # Views of the buffers, not copies
+        assert isinstance(values, memoryview)
+        fill(history, 1, start=2000.0)
+        assert history.latest(1, 4001) == (2000.0, 0.0)
+        with pytest.raises(KeyError):
+            history.raw(2, 4001)
+
+    def test_rollups(self):
+        history = History(capacity=8, rollups=((1.0, 3), (60.0, 2)))
+        fill(history, 20)
+        history.add(1, 4001, '01', Reading(1, status=reading.NO_RESPONSE, timestamp=1005.0))
+        seconds = history.rollup(1, 4001, 1)
+        assert list(seconds.time) == [1002.0, 1003.0, 1004.0]
+        assert list(seconds.min) == [8.0, 12.0, 16.0]
+        assert list(seconds.max) == [11.0, 15.0, 19.0]
+        assert list(seconds.mean) == [9.5, 13.5, 17.5]
+        assert list(seconds.count) == [4, 4, 4]
+        minutes = history.rollup(1, 4001, 60.0, start=900.0)
+        assert (list(minutes.time), list(minutes.mean), list(minutes.count)) == ([960.0], [9.5], [20])
+        assert math.isnan(history.raw(1, 4001)[1][-1])
+        with pytest.raises(KeyError):
+            history.rollup(1, 4001, 5.0)
+
+    def test_constant_memory(self):
+        history = History(capacity=100)
+        fill(history, 10)
+        size = history.nbytes()
+        fill(history, 10000, start=2000.0)
+        assert history.nbytes() == size
+        assert len(history.raw(1, 4001)[0]) == 100
+
+    def test_poller(self, responderSerial):
+        history = History()
+        bus = WatlowBus(serial=responderSerial())
+        poller = Poller({bus: {1: [4001], 2: [4001]}}, history=history, queue=False)
+        with poller:
+            deadline = time.monotonic() + 5.0
+            while not ((2, 4001, 1) in history.keys() and len(history.raw(2, 4001)[1]) >= 3):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        assert sorted(history.keys()) == [(1, 4001, 1), (2, 4001, 1)]
+        assert set(history.raw(2, 4001)[1]) == {2.0}
+        # Nothing is queued for readings() to keep
+        with pytest.raises(RuntimeError):
+            poller.get()
+        with pytest.raises(ValueError):
+            Poller({bus: {1: [4001]}, WatlowBus(serial=responderSerial()): {1: [7001]}}, history=history)
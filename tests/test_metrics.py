@@ -0,0 +1,108 @@
+import pytest
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.metrics import ADDRESS_MISMATCH
+from pywatlow.metrics import CRC_MISMATCH
+from pywatlow.metrics import OK
+from pywatlow.metrics import SKIPPED
+from pywatlow.metrics import STALE_RESPONSE
+from pywatlow.metrics import TIMEOUT
+from pywatlow.metrics import Histogram
+from pywatlow.metrics import Metrics
+from pywatlow.watlow import Watlow
+
+
+@pytest.fixture
+def metricsBus(simulatedBus):
+    '''
+    Returns a simulated bus of controllers 1 and 2, its `Metrics` and the
+    `WatlowBus` recording into them
+    '''
+    simulated = simulatedBus((1, 2))
+    metrics = Metrics()
+    bus = WatlowBus(serial=simulated, timeout=0.1, clock=simulated.now, metrics=metrics)
+    return simulated, metrics, bus
+
+
+class TestMetrics:
+    '''
+    Test suite for Metrics and its use by Watlow and WatlowBus
+    '''
+
+    def test_histogram(self):
+        histogram = Histogram((0.01, 0.1))
+        for value in (0.005, 0.01, 0.05, 0.5):
+            histogram.observe(value)
+        assert histogram.cumulative() == [(0.01, 2), (0.1, 3), (float('inf'), 4)]
+        assert histogram.quantile(0.5) == 0.01
+        assert histogram.quantile(0.99) == float('inf')
+        assert histogram.stats()['mean'] == 0.14125
+
+    def test_outcomes(self, metricsBus):
+        simulated, metrics, bus = metricsBus
+        bus[1].read()
+        bus[1].write(70.0)
+        simulated.inject(1, 'crc')
+        bus[1].readSetpoint()
+        simulated.silent.add(2)
+        for _ in range(5):
+            bus[2].read()
+        stats = metrics.stats()
+        assert stats[1][OK] == 2
+        assert stats[1][CRC_MISMATCH] == 1
+        assert stats[1]['bytesSent'] == simulated.bytesWritten - stats[2]['bytesSent']
+        assert stats[1]['bytesReceived'] == simulated.bytesRead
+        assert stats[1]['latency']['count'] == 3
+        # Dead after three timeouts
+        assert stats[2][TIMEOUT] == 3
+        assert stats[2][SKIPPED] == 2
+        assert stats[2]['latency']['count'] == 0
+        assert metrics.latency(param=4001).count == 1
+        assert metrics.count(OK) == 2
+
+    def test_dropped(self, metricsBus, floatResponse):
+        '''
+        Tests that frames dropped by the bus are counted apart from the
+        transactions
+        '''
+        simulated, metrics, bus = metricsBus
+        simulated.controllers[1].turnaround = 0.15
+        bus.adaptive = False
+        assert bus[1].readParam(4001).status == reading.NO_RESPONSE
+        bus.timeout = 0.5
+        assert bus[1].readParam(7001).value == 75.0
+        metrics.dropped(1, floatResponse(2, 1.0))
+        stats = metrics.stats()[1]
+        assert stats['transactions'] == 2
+        assert stats['dropped'] == {STALE_RESPONSE: 1, ADDRESS_MISMATCH: 1}
+        assert 'pywatlow_dropped_frames_total{address="1",reason="stale response"} 1' in metrics.prometheus()
+
+    def test_watlow(self, simulatedBus):
+        simulated = simulatedBus()
+        metrics = Metrics(clock=simulated.now)
+        watlow = Watlow(serial=simulated, address=1, metrics=metrics)
+        watlow.readParams([4001, 4001])
+        assert metrics.count(OK, address=1) == 2
+        assert 0 < metrics.latency(1).sum == simulated.now()
+
+    def test_hooks(self, metricsBus):
+        simulated, metrics, bus = metricsBus
+        seen = []
+        metrics.addHook(seen.append)
+        metrics.addHook(lambda transaction: 1 / 0)
+        bus[1].writeParam(7001, 71.0)
+        assert len(seen) == 1
+        assert (seen[0].address, seen[0].op, seen[0].param, seen[0].outcome) == (1, 'write', 7001, OK)
+        assert metrics.hookErrors == 1
+
+    def test_prometheus(self, metricsBus):
+        simulated, metrics, bus = metricsBus
+        bus[1].read()
+        text = metrics.prometheus()
+        assert '# TYPE pywatlow_transactions_total counter' in text
+        assert 'pywatlow_transactions_total{address="1",op="read",outcome="ok"} 1' in text
+        assert 'pywatlow_sent_bytes_total{address="1"} 16' in text
+        assert 'pywatlow_received_bytes_total{address="1"} 21' in text
+        assert 'pywatlow_response_seconds_bucket{address="1",le="+Inf"} 1' in text
+        assert 'pywatlow_param_response_seconds_count{param="4001"} 1' in text
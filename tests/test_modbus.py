@@ -0,0 +1,102 @@
+import pytest
+
+from pywatlow import modbus
+from pywatlow import reading
+from pywatlow.metrics import Metrics
+from pywatlow.modbus import ModbusWatlow
+from pywatlow.modbus import planBlocks
+from pywatlow.modbus import registerOf
+from pywatlow.simulator import SimulatedController
+from pywatlow.simulator import SimulatedModbusBus
+
+ZONE = [4001, 4005, 4007, 4012, 4014, 4015, 4016, 4017, 4018, 4020, 4028, 4030, 4031]
+
+
+def makeBus(**kwargs):
+    values = {param: 1.5 if param in (4001, 4012, 4014, 4015, 4016, 4017, 4018, 4031) else 3 for param in ZONE}
+    values.update({7001: 75.0, 8003: 71, (4001, 2): 22.5})
+    return SimulatedModbusBus([SimulatedController(1, values)], **kwargs)
+
+
+class TestModbus:
+    '''
+    Test suite for ModbusWatlow against the simulated Modbus bus
+    '''
+
+    def test_frames(self):
+        # Example request from the Modbus specification
+        assert modbus.readRequest(1, 0x6B, 3)[-2:] == b'\x74\x17'
+        assert modbus.validFrame(modbus.readRequest(1, 360, 2))
+        assert not modbus.validFrame(b'\x01\x03\x00\x00')
+        for wordOrder in (modbus.LOW_HIGH, modbus.HIGH_LOW):
+            words = modbus.packValue(72.5, float, wordOrder)
+            assert modbus.unpackValue(words, float, wordOrder) == 72.5
+            assert modbus.unpackValue(modbus.packValue(-3, int, wordOrder), int, wordOrder) == -3
+        assert modbus.packValue(1.0, float) == [0x0000, 0x3F80]
+
+    def test_registers(self):
+        assert registerOf(4001) == 360
+        assert registerOf(4005, '02') == 448
+        assert registerOf(7001) == 2160
+        assert registerOf(4001, registers={4001: (1000, 40)}, instance=3) == 1080
+        with pytest.raises(ValueError):
+            registerOf(9001)
+        assert planBlocks([366, 360, 2160, 362, 380]) == [(360, 4, [1, 3]), (366, 2, [0]), (380, 2, [4]), (2160, 2, [2])]
+        assert planBlocks([366, 360, 2160, 362, 380], maxGap=16) == [(360, 22, [1, 3, 0, 4]), (2160, 2, [2])]
+        assert planBlocks([360, 360]) == [(360, 2, [0, 1])]
+        assert len(planBlocks(list(range(0, 400, 2)), maxGap=16)) == 4
+
+    def test_read_write(self):
+        bus = makeBus()
+        watlow = ModbusWatlow(serial=bus, address=1)
+        assert watlow.read() == {'address': 1, 'param': 4001, 'data': 1.5, 'error': None}
+        assert watlow.readParam(4001, instance='02')['data'] == 22.5
+        assert watlow.readParam(8003)['data'] == 71
+        assert watlow.write(81.5)['data'] == 81.5
+        assert watlow.readSetpoint()['data'] == 81.5
+        assert watlow.writeParam(8003, 62)['data'] == 62
+        assert bus.controllers[1].get(8003) == 62
+        # A read-only parameter gets an exception response
+        assert watlow.writeParam(4001, 100.0).status == reading.UNPARSEABLE
+        with pytest.raises(ValueError):
+            watlow.readParam(9001, float)
+        with pytest.raises(ValueError):
+            ModbusWatlow(serial=bus, address=1, capture='bus.cap')
+
+    def test_block_reads(self):
+        bus = makeBus()
+        watlow = ModbusWatlow(serial=bus, address=1)
+        outputs = watlow.readParams(ZONE + [7001, (4001, None, '02')])
+        assert [output['data'] for output in outputs[:4]] == [1.5, 3, 3, 1.5]
+        assert [output.param for output in outputs] == ZONE + [7001, 4001]
+        assert outputs[-1].instance == 2
+        modbusRequests = bus.requests
+        # Standard Bus needs a transaction per parameter
+        assert len(outputs) >= 5 * modbusRequests
+        assert modbusRequests == 3
+        outputs = watlow.writeParams([(7001, 70.0), (8003, 63)])
+        assert [output['data'] for output in outputs] == [70.0, 63]
+
+    def test_block_fallback(self):
+        bus = makeBus(strict=True)
+        watlow = ModbusWatlow(serial=bus, address=1)
+        outputs = watlow.readParams([4001, 4005, 4012])
+        assert [output['data'] for output in outputs] == [1.5, 3, 1.5]
+        # One block read rejected, then one read per parameter
+        assert bus.requests == 4
+
+    def test_faults(self):
+        bus = makeBus()
+        metrics = Metrics()
+        watlow = ModbusWatlow(serial=bus, address=1, metrics=metrics)
+        bus.inject(1, 'timeout')
+        outputs = watlow.readParams([4001, 7001, 8003])
+        assert [output.status for output in outputs] == [reading.NO_RESPONSE, reading.SKIPPED, reading.SKIPPED]
+        bus.inject(1, 'crc')
+        assert watlow.read().status == reading.INVALID
+        assert watlow.read().ok
+        assert metrics.count('timeout', 1) == 1
+        assert metrics.count('crc mismatch', 1) == 1
+        assert metrics.count('ok', 1) == 1
+        with pytest.raises(ValueError):
+            bus.inject(1, 'header')
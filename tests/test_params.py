@@ -0,0 +1,62 @@
+import csv
+import os
+
+from pywatlow import params
+from pywatlow.watlow import Watlow
+
+REFERENCE = os.path.join(os.path.dirname(__file__), '..', 'docs', 'reference')
+
+
+def test_catalog_matches_reference():
+    '''
+    Tests that the catalog agrees with the example messages in docs/reference
+    '''
+    files = [
+        ('messages_read_float.csv', float, 'readResponseLength'),
+        ('messages_read_int.csv', int, 'readResponseLength'),
+        ('messages_set_float.csv', float, 'writeResponseLength'),
+        ('messages_set_int.csv', int, 'writeResponseLength'),
+    ]
+    for filename, data_type, lengthName in files:
+        with open(os.path.join(REFERENCE, filename)) as fh:
+            rows = list(csv.reader(fh))[1:]
+        for request, response in zip(rows[0::2], rows[1::2]):
+            if not request[1]:
+                continue
+            entry = params.lookup(request[1])
+            assert entry.data_type is data_type, filename
+            if filename.startswith('messages_set'):
+                assert entry.writable, filename
+            else:
+                assert entry.readable, filename
+            responseLength = len(' '.join(response[3:]).replace('--', '').split())
+            assert getattr(entry, lengthName) == responseLength, filename
+
+
+def test_dataType():
+    assert params.dataType(4001) is float
+    assert params.dataType('8003') is int
+    assert params.dataType(12345, int) is int
+    assert params.lookup(12345) is None
+    try:
+        params.dataType(12345)
+    except ValueError:
+        pass
+    else:
+        assert False, 'Unknown parameter without data_type should raise ValueError'
+
+
+def test_writeParam_catalog_type(fakeSerial):
+    '''
+    Tests that writeParam and writeParams build the message for the
+    catalog's data type when none is given
+    '''
+    serial = fakeSerial()
+    Watlow(serial=serial, address=1).writeParam(8003, 71)
+    assert serial.written[:19].hex().upper() == '55FF05100300094601040803010F0100478FED'
+    # Echoed responses from docs/reference/messages_set_*.csv
+    serial = fakeSerial(bytes.fromhex('55FF060010000A760204070101 0843C40000 8203 55FF0603100009EF02040803010F010047883B'))
+    outputs = Watlow(serial=serial, address=1).writeParams([(7001, 81), (8003, 62, None, '01')])
+    assert [output['data'] for output in outputs] == [392.0, 71]
+    assert serial.written[:20].hex() == '55ff051000000aec01040701010842a20000c4b8'
+    assert serial.written[20:].hex().upper() == '55FF05100300094601040803010F01003EC903'
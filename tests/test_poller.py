@@ -0,0 +1,42 @@
+import time
+
+from pywatlow.bus import WatlowBus
+from pywatlow.poller import Poller
+
+
+def runPoller(responderSerial, portCount, duration=0.3):
+    ports = {WatlowBus(serial=responderSerial(port='port{0}'.format(n), delay=0.005)): {1: [4001], 2: [4001, (7001, float, '01')]}
+             for n in range(portCount)}
+    poller = Poller(ports)
+    with poller:
+        time.sleep(duration)
+    return poller, list(poller.readings())
+
+
+class TestPoller:
+    '''
+    Test suite for the multi-port Poller
+    '''
+
+    def test_readings(self, responderSerial):
+        poller, readings = runPoller(responderSerial, 2)
+        assert readings
+        assert {reading['port'] for reading in readings} == {'port0', 'port1'}
+        for reading in readings:
+            assert reading['error'] is None
+            assert reading['data'] == float(reading['address'])
+            assert reading['instance'] == '01'
+            assert reading['timestamp'] > 0
+        stats = poller.stats()
+        assert sum(port['readings'] for port in stats.values()) == len(readings)
+        for utilization in poller.utilization().values():
+            assert 0.5 < utilization <= 1.0
+
+    def test_parallel_ports(self, responderSerial):
+        '''
+        Tests that ports are polled in parallel: four ports should give well
+        over twice the readings of one
+        '''
+        single = len(runPoller(responderSerial, 1)[1])
+        quad = len(runPoller(responderSerial, 4)[1])
+        assert quad > 2.5 * single
@@ -319,3 +319,28 @@ class TestWatlow:
             assert generatedOutput['param'] == test[1], test_msg
             assert generatedOutput['address'] == test[2], test_msg
             assert (type(generatedOutput['error']) is Exception) == test[4], test_msg
+
+    def test_readParam_data_type(self, fakeSerial):
+        '''
+        Tests that passing the wrong data type still reads the whole response
+        '''
+        serial = fakeSerial(unhexlify('55FF06031100097702040803010F010047883B'))
+        output = Watlow(serial=serial, address=2).readParam(8003, float)
+        assert output['data'] == 71
+        assert output['error'] is None
+        assert serial.written == unhexlify('55FF051100000661010301080301F00F')
+
+    def test_writeParams(self, fakeSerial):
+        '''
+        Tests that a batch of writes is sent in order and each echoed
+        response is parsed
+        '''
+        responses = [
+            unhexlify('55FF06031100097702040803010F010047883B'),
+            unhexlify('55FF060011000AEE02040701010842A000001579'),
+        ]
+        serial = fakeSerial(b''.join(responses))
+        outputs = Watlow(serial=serial, address=2).writeParams([(8003, 71, int), (7001, 80, float, '01')])
+        assert serial.written == (unhexlify('55FF0511030009CF01040803010F0100478FED') +
+                                  unhexlify('55FF051100000A6501040701010842A000007C0D'))
+        assert [(output['param'], output['data']) for output in outputs] == [(8003, 71), (7001, 80.0)]
@@ -0,0 +1,61 @@
+from binascii import unhexlify
+
+from pywatlow import reading
+from pywatlow.reading import Reading
+from pywatlow.reading import parseResponse
+from pywatlow.simulator import SimulatedController
+from pywatlow.watlow import Watlow
+
+
+class TestParseResponse:
+    '''
+    Test suite for parseResponse and Reading
+    '''
+
+    def test_read_float(self):
+        output = parseResponse(unhexlify('55FF060010000B8802030104010108468F3638DD0E'), 1)
+        assert output.ok
+        assert (output.param, output.instance) == (4001, 1)
+        assert round(output.value, 4) == 18331.1094
+        assert output.error is None
+
+    def test_write_int(self):
+        output = parseResponse(unhexlify('55FF06031100097702040803010F010047883B'), 2)
+        assert output.status == reading.OK
+        assert (output.param, output.instance, output.value) == (8003, 1, 71)
+
+    def test_simulated_layouts(self):
+        '''
+        Tests the read int and write float layouts with responses from the
+        simulated controller
+        '''
+        controller = SimulatedController(3, {8003: 62})
+        watlow = Watlow(serial=None, address=3)
+        output = parseResponse(controller.respond(watlow._buildReadRequest(8003)), 3)
+        assert (output.param, output.value) == (8003, 62)
+        output = parseResponse(controller.respond(watlow._buildWriteRequest(7001, 81.5, float)), 3)
+        assert (output.param, output.value) == (7001, 81.5)
+
+    def test_status(self):
+        frame = unhexlify('55FF060010000B8802030104010108468F3638DD0E')
+        assert parseResponse(b'', 1).status == reading.NO_RESPONSE
+        assert parseResponse(bytes(21), 1).status == reading.NO_RESPONSE
+        assert parseResponse(frame[:-1] + b'\x00', 1).status == reading.INVALID
+        assert parseResponse(frame, 2).status == reading.INVALID
+        error = SimulatedController(1)._error(0x80)
+        assert parseResponse(error, 1).status == reading.UNPARSEABLE
+        assert str(parseResponse(error, 1)['error']) == 'Received a message that could not be parsed from address 1'
+
+    def test_mapping(self):
+        '''
+        Tests that a Reading can still be used as the dict readParam returned
+        '''
+        output = parseResponse(unhexlify('55FF06031100097702040803010F010047883B'), 2)
+        assert output == {'address': 2, 'param': 8003, 'data': 71, 'error': None}
+        assert dict(output) == output.asDict()
+        assert sorted(output) == ['address', 'data', 'error', 'param']
+        assert output['data'] == 71
+        assert 'instance' not in output
+        failed = Reading(2, status=reading.ERROR, exception=OSError('port closed'))
+        assert failed['data'] is None
+        assert isinstance(failed['error'], OSError)
@@ -0,0 +1,97 @@
+import pytest
+
+from pywatlow.bus import WatlowBus
+from pywatlow.scheduler import PollSpec
+from pywatlow.scheduler import Scheduler
+
+
+@pytest.fixture
+def simulatedScheduler(simulatedBus):
+    '''
+    Returns a function making a `Scheduler` of `specs` on a simulated bus of
+    controllers 1 through 4, and the list its callback appends readings to
+    '''
+    def make(specs, **kwargs):
+        simulated = simulatedBus(range(1, 5))
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        readings = []
+        scheduler = Scheduler(bus, specs, callback=lambda spec, reading: readings.append((spec, reading)),
+                              sleep=simulated.sleep, **kwargs)
+        return scheduler, readings
+    return make
+
+
+class TestScheduler:
+    '''
+    Test suite for the polling Scheduler, run in simulated time
+    '''
+
+    def test_rates(self, simulatedScheduler):
+        specs = ([PollSpec(address, 4001, 0.1, priority=2) for address in range(1, 5)] +
+                 [PollSpec(address, 7001, 1.0, priority=1) for address in range(1, 5)] +
+                 [PollSpec(1, 8003, 10.0)])
+        scheduler, readings = simulatedScheduler(specs)
+        scheduler.run(20.0)
+        stats = scheduler.stats()
+        assert stats[(1, 4001, '01')]['runs'] == 200
+        assert stats[(4, 7001, '01')]['runs'] == 20
+        assert stats[(1, 8003, '01')]['runs'] == 2
+        for spec in stats.values():
+            assert spec['active']
+            assert spec['missed'] == 0
+            assert spec['rate'] == pytest.approx(spec['target'], rel=0.1)
+        assert all(reading['error'] is None for spec, reading in readings)
+        assert {reading.param for spec, reading in readings} == {4001, 7001, 8003}
+
+    def test_admission(self, simulatedScheduler):
+        '''
+        Tests that low priority specs are shed when the bus can't carry them
+        all
+        '''
+        specs = [PollSpec(address, 4001, 0.1, priority=1) for address in range(1, 5)]
+        specs += [PollSpec(address, 7001, 0.02) for address in range(1, 5)]
+        scheduler, readings = simulatedScheduler(specs)
+        assert scheduler.load() <= scheduler.capacity
+        scheduler.run(5.0)
+        stats = scheduler.stats()
+        assert all(stats[(address, 4001, '01')]['active'] for address in range(1, 5))
+        assert not all(stats[(address, 7001, '01')]['active'] for address in range(1, 5))
+        assert all(stats[(address, 4001, '01')]['missed'] == 0 for address in range(1, 5))
+
+    def test_overload(self, simulatedScheduler):
+        '''
+        Tests that late low priority reads give way to high priority ones when
+        admission doesn't limit the load
+        '''
+        specs = [PollSpec(address, 4001, 0.1, priority=1) for address in range(1, 5)]
+        specs += [PollSpec(address, 7001, 0.05) for address in range(1, 5)]
+        scheduler, readings = simulatedScheduler(specs, capacity=10.0)
+        scheduler.run(5.0)
+        stats = scheduler.stats()
+        assert sum(stats[(address, 7001, '01')]['shed'] for address in range(1, 5)) > 0
+        for address in range(1, 5):
+            assert stats[(address, 4001, '01')]['rate'] == pytest.approx(10.0, rel=0.1)
+
+    def test_add_while_reading(self, simulatedScheduler):
+        '''
+        Tests that adding a spec while a read is running doesn't queue the
+        running spec twice
+        '''
+        scheduler, readings = simulatedScheduler([PollSpec(1, 4001, 0.5)])
+        handle = scheduler.bus[1]
+        readParam = handle.readParam
+
+        def addWhileReading(*args):
+            if not scheduler.stats().get((2, 4001, '01')):
+                scheduler.add(PollSpec(2, 4001, 0.5))
+            return readParam(*args)
+        handle.readParam = addWhileReading
+        scheduler.run(10.0)
+        # Each spec is queued once
+        assert sorted(entry[-1].spec.address for entry in scheduler._waiting + scheduler._ready) == [1, 2]
+        for spec in scheduler.stats().values():
+            assert spec['rate'] == pytest.approx(spec['target'], rel=0.1)
+
+    def test_period(self):
+        with pytest.raises(ValueError):
+            PollSpec(1, 4001, 0)
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from pywatlow import reading
+from pywatlow.bus import WatlowBus
+from pywatlow.poller import Poller
+from pywatlow.reading import Reading
+from pywatlow.sharedtable import LatestValueTable
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'watlow')
+
+
+class TestLatestValueTable:
+    '''
+    Test suite for the shared memory LatestValueTable
+    '''
+
+    def test_publish(self, path):
+        table = LatestValueTable.create(path, slots=4)
+        reader = LatestValueTable.open(path)
+        assert reader.get(1, 4001) is None
+        table.publish(1, 4001, '01', Reading(1, 4001, 1, 72.5, timestamp=10.0))
+        table.publish(2, 8003, '01', Reading(2, 8003, 1, 71, timestamp=11.0))
+        output = reader.get(1, 4001)
+        assert (output.param, output.value, output.timestamp, output.ok) == (4001, 72.5, 10.0, True)
+        assert reader.get(2, 8003, 1).value == 71
+        assert reader.sequence(1, 4001) == 2
+        table.publish(1, 4001, '01', Reading(1, status=reading.NO_RESPONSE, timestamp=12.0))
+        assert reader.get(1, 4001).status == reading.NO_RESPONSE
+        assert reader.sequence(1, 4001) == 4
+        assert sorted(reader.snapshot()) == [(1, 4001, 1), (2, 8003, 1)]
+        table.publish(3, 4001, '01', Reading(3, 4001, 1, 1.0))
+        table.publish(4, 4001, '01', Reading(4, 4001, 1, 1.0))
+        with pytest.raises(ValueError):
+            table.publish(5, 4001, '01', Reading(5, 4001, 1, 1.0))
+        reader.close()
+        table.close()
+
+    def test_consistency(self, path):
+        '''
+        Tests that readers never see a half written slot
+        '''
+        table = LatestValueTable.create(path, slots=1)
+        reader = LatestValueTable.open(path)
+        stop = threading.Event()
+
+        def publish():
+            n = 0
+            while not stop.is_set():
+                n += 1
+                table.publish(1, 4001, '01', Reading(1, 4001, 1, float(n), timestamp=float(n)))
+
+        writer = threading.Thread(target=publish)
+        writer.start()
+        try:
+            for _ in range(20000):
+                output = reader.get(1, 4001)
+                if output is not None:
+                    assert output.value == output.timestamp
+        finally:
+            stop.set()
+            writer.join()
+        table.close()
+        reader.close()
+
+    def test_other_process(self, path):
+        table = LatestValueTable.create(path)
+        table.publish(7, 7001, '01', Reading(7, 7001, 1, 75.0))
+        code = 'from pywatlow.sharedtable import LatestValueTable; print(LatestValueTable.open({0!r}).get(7, 7001).value)'
+        output = subprocess.check_output([sys.executable, '-c', code.format(path)],
+                                         env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        assert output.strip() == b'75.0'
+        table.unlink()
+
+    def test_poller(self, path, responderSerial):
+        table = LatestValueTable.create(path)
+        poller = Poller({WatlowBus(serial=responderSerial()): {3: [4001]}}, table=table)
+        with poller:
+            assert poller.get(timeout=1) is not None
+        assert LatestValueTable.open(path).get(3, 4001).value == 3.0
+        # The same address on two ports would share slots
+        with pytest.raises(ValueError):
+            Poller({WatlowBus(serial=responderSerial()): {3: [4001]}, WatlowBus(serial=responderSerial()): {3: [7001]}},
+                   table=table)
@@ -0,0 +1,57 @@
+from pywatlow.bus import WatlowBus
+from pywatlow.simulator import SimulatedBus
+from pywatlow.simulator import SimulatedController
+from pywatlow.watlow import Watlow
+
+
+def makeBus(**kwargs):
+    controllers = [SimulatedController(address, {4001: 20.0 + address, 7001: 75.0, 8003: 71})
+                   for address in range(1, 17)]
+    return SimulatedBus(controllers, **kwargs)
+
+
+class TestSimulator:
+    '''
+    End to end tests of Watlow and WatlowBus against the simulated bus
+    '''
+
+    def test_read_write(self):
+        serial = makeBus()
+        watlow = Watlow(serial=serial, address=2)
+        assert watlow.read() == {'address': 2, 'param': 4001, 'data': 22.0, 'error': None}
+        assert watlow.readParam(8003) == {'address': 2, 'param': 8003, 'data': 71, 'error': None}
+        assert watlow.write(81.5)['data'] == 81.5
+        assert watlow.readSetpoint()['data'] == 81.5
+        assert watlow.writeParam(8003, 62)['data'] == 62
+        assert serial.controllers[2].get(8003) == 62
+        # Writing a read-only parameter returns an error frame
+        assert watlow.writeParam(4001, 100.0)['error'] is not None
+
+    def test_wire_time(self):
+        '''
+        Tests that a read costs request and response wire time plus the
+        controller's turnaround on the simulated clock
+        '''
+        serial = makeBus()
+        Watlow(serial=serial, address=1).read()
+        expected = (16 + 21) * 10 / 38400 + 0.005
+        assert abs(serial.now() - expected) < 1e-9
+
+    def test_faults(self):
+        serial = makeBus(timeout=0.1)
+        bus = WatlowBus(serial=serial)
+        serial.silent.add(3)
+        start = serial.now()
+        assert bus[3].read()['error'] is not None
+        assert serial.now() - start >= 0.1
+
+        serial.inject(4, 'crc')
+        assert 'Invalid' in str(bus[4].read()['error'])
+        assert bus[4].read()['error'] is None
+
+        serial.inject(5, 'timeout')
+        assert bus[5].read()['error'] is not None
+        serial.inject(5, 'header', count=2)
+        assert bus[5].read()['error'] is not None
+        assert bus[5].read()['error'] is not None
+        assert bus[5].read()['data'] == 25.0
@@ -0,0 +1,65 @@
+from pywatlow.bus import WatlowBus
+from pywatlow.simulator import SimulatedBus
+from pywatlow.simulator import SimulatedController
+from pywatlow.timing import ResponseTimer
+
+
+class TestResponseTimer:
+    '''
+    Test suite for ResponseTimer
+    '''
+
+    def test_timeout(self):
+        timer = ResponseTimer(timeout=0.5, minTimeout=0.01)
+        assert timer.timeout() == 0.5
+        for _ in range(20):
+            timer.success(0.02)
+        assert 0.02 <= timer.timeout() < 0.05
+        timer.failure(0.0)
+        assert timer.failures == 1
+        assert not timer.dead
+        assert 0.04 <= timer.timeout() < 0.1
+
+    def test_backoff(self):
+        timer = ResponseTimer(deadAfter=3, backoff=1.0, maxBackoff=4.0)
+        for now in range(3):
+            assert timer.available(now)
+            timer.failure(now)
+        assert timer.dead
+        assert timer.nextProbe == 3.0
+        assert not timer.available(2.5)
+        assert timer.skipped == 1
+        timer.failure(3.0)
+        assert timer.nextProbe == 5.0
+        timer.failure(5.0)
+        timer.failure(9.0)
+        assert timer.nextProbe == 13.0
+        timer.success(0.02)
+        assert not timer.dead
+        assert timer.available(9.5)
+
+
+class TestAdaptiveBus:
+    '''
+    Tests adaptive timeouts on a simulated bus with one dead controller
+    '''
+
+    def poll(self, adaptive, cycles=50):
+        simulated = SimulatedBus([SimulatedController(address, {4001: 70.0 + address}) for address in range(1, 17)])
+        simulated.silent.add(5)
+        bus = WatlowBus(serial=simulated, adaptive=adaptive, clock=simulated.now)
+        readings = 0
+        for _ in range(cycles):
+            for address in range(1, 17):
+                if bus[address].read()['error'] is None:
+                    readings += 1
+        return bus, readings, simulated.now()
+
+    def test_dead_address(self):
+        bus, readings, elapsed = self.poll(adaptive=True)
+        fixedBus, fixedReadings, fixedElapsed = self.poll(adaptive=False)
+        assert readings == fixedReadings == 50 * 15
+        assert elapsed < fixedElapsed / 2
+        assert bus.timer(5).dead
+        assert bus.timer(5).skipped > 0
+        assert bus.timer(1).timeout() <= 0.05
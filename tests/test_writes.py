@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from pywatlow.bus import WatlowBus
+from pywatlow.watlow import Watlow
+from pywatlow.writes import WriteBehind
+from pywatlow.writes import WriteCoalescer
+from pywatlow.writes import WriteFilter
+
+
+class TestWriteFilter:
+    '''
+    Test suite for WriteFilter and its use by Watlow
+    '''
+
+    def test_suppress(self, simulatedBus):
+        simulated = simulatedBus()
+        watlow = Watlow(serial=simulated, address=1, writeFilter=WriteFilter())
+        assert watlow.write(81.3)['data'] == watlow.write(81.3)['data']
+        assert watlow.writeParam(8003, 62)['data'] == 62
+        assert watlow.writeParam(8003, 62)['data'] == 62
+        assert simulated.requests == 2
+        watlow.write(81.4)
+        assert simulated.requests == 3
+        assert watlow.writeFilter.stats()['suppressed'] == 2
+
+    def test_epsilon_and_reads(self, simulatedBus):
+        '''
+        Tests the float tolerance, and that values read from the controller
+        count as confirmed
+        '''
+        simulated = simulatedBus()
+        watlow = Watlow(serial=simulated, address=1, writeFilter=WriteFilter(epsilons={7001: 0.1}))
+        watlow.readSetpoint()
+        watlow.write(75.05)
+        assert simulated.requests == 1
+        watlow.write(75.2)
+        assert simulated.requests == 2
+        assert round(simulated.controllers[1].get(7001), 4) == 75.2
+
+    def test_max_age_and_failures(self, simulatedBus):
+        simulated = simulatedBus()
+        clock = [0.0]
+        watlow = Watlow(serial=simulated, address=1, writeFilter=WriteFilter(maxAge=5.0, clock=lambda: clock[0]))
+        watlow.write(60.0)
+        clock[0] = 6.0
+        watlow.write(60.0)
+        assert simulated.requests == 2
+        simulated.inject(1, 'crc')
+        assert watlow.write(61.0)['error'] is not None
+        watlow.write(61.0)
+        assert simulated.requests == 4
+
+    def test_writeParams(self, simulatedBus):
+        simulated = simulatedBus()
+        watlow = Watlow(serial=simulated, address=1, writeFilter=WriteFilter())
+        watlow.write(60.0)
+        outputs = watlow.writeParams([(7001, 60.0), (8003, 62), (7001, 60.0)])
+        assert [output['data'] for output in outputs] == [60.0, 62, 60.0]
+        assert simulated.requests == 2
+
+
+class TestWriteCoalescer:
+    '''
+    Test suite for WriteCoalescer
+    '''
+
+    def test_flush(self, simulatedBus):
+        simulated = simulatedBus((1, 2))
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        coalescer = WriteCoalescer(bus)
+        for value in range(50, 60):
+            coalescer.write(1, 7001, float(value))
+            coalescer.write(2, 7001, float(value) + 10)
+        coalescer.write(2, 8003, 62)
+        assert len(coalescer) == 3
+        outputs = coalescer.flush()
+        assert [(output['address'], output['param'], output['data']) for output in outputs] == [
+            (1, 7001, 59.0), (2, 7001, 69.0), (2, 8003, 62)]
+        assert simulated.requests == 3
+        assert coalescer.coalesced == 18
+        assert coalescer.flush() == []
+
+
+class TestWriteBehind:
+    '''
+    Test suite for WriteBehind and writeParamAsync
+    '''
+
+    def test_futures(self, simulatedBus):
+        simulated = simulatedBus((1, 2))
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        futures = [bus[address].writeParamAsync(7001, 60.0 + n) for n in range(10) for address in (1, 2)]
+        futures.append(bus[2].writeParamAsync(8003, 62))
+        outputs = [future.result(timeout=5) for future in futures]
+        assert [output['data'] for output in outputs[:20]] == [60.0 + n for n in range(10) for address in (1, 2)]
+        assert outputs[-1]['data'] == 62
+        assert simulated.controllers[1].get(7001) == 69.0
+        bus.close()
+        assert bus.writeBehind().thread.is_alive() is False
+
+    def test_backpressure(self, simulatedBus):
+        '''
+        Tests that a full queue raises queue.Full, or waits for room
+        '''
+        simulated = simulatedBus()
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        writer = WriteBehind(bus, maxsize=2, block=False)
+        with bus.lock:
+            # The worker can't send while the bus is held
+            futures = [writer.writeParam(1, 7001, 50.0)]
+            while len(writer):
+                time.sleep(0.001)
+            futures += [writer.writeParam(1, 7001, 51.0), writer.writeParam(1, 7001, 52.0)]
+            with pytest.raises(queue.Full):
+                writer.writeParam(1, 7001, 53.0)
+            writer.block, writer.timeout = True, 0.01
+            with pytest.raises(queue.Full):
+                writer.writeParam(1, 7001, 53.0)
+            assert writer.stats()['rejected'] == 2
+        assert [future.result(timeout=5)['data'] for future in futures] == [50.0, 51.0, 52.0]
+        assert writer.flush(timeout=5)
+        writer.close()
+
+    def test_coalesce(self, simulatedBus):
+        simulated = simulatedBus()
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        writer = WriteBehind(bus, coalesce=True)
+        with bus.lock:
+            first = writer.writeParam(1, 7001, 50.0)
+            while len(writer):
+                time.sleep(0.001)
+            futures = [writer.writeParam(1, 7001, float(value)) for value in range(51, 60)]
+        assert first.result(timeout=5)['data'] == 50.0
+        assert all(future.result(timeout=5)['data'] == 59.0 for future in futures)
+        assert simulated.requests == 2
+        writer.close()
+
+    def test_coalesce_full(self, simulatedBus):
+        '''
+        Tests that writes to the same parameter that both waited for room are
+        coalesced, and both their futures resolved
+        '''
+        simulated = simulatedBus()
+        bus = WatlowBus(serial=simulated, clock=simulated.now)
+        writer = WriteBehind(bus, maxsize=2, coalesce=True)
+        futures = []
+        with bus.lock:
+            first = writer.writeParam(1, 7001, 50.0)
+            while len(writer):
+                time.sleep(0.001)
+            writer.writeParam(1, 8003, 62)
+            writer.writeParam(1, 8003, 63, instance='02')
+            threads = [threading.Thread(target=lambda value: futures.append(writer.writeParam(1, 7001, value)), args=(value,))
+                       for value in (51.0, 52.0)]
+            for thread in threads:
+                thread.start()
+            # Both wait for room
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join()
+        assert first.result(timeout=5)['data'] == 50.0
+        values = [future.result(timeout=5)['data'] for future in futures]
+        assert values[0] == values[1] and values[0] in (51.0, 52.0)
+        assert writer.coalesced == 1
+        writer.close()